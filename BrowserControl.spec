@@ -34,6 +34,12 @@ a = Analysis(
         'userscript_updater',
         'userscript_injector',
         'retry_utils',
+        'api_encoding',
+        'backend_client',
+        'backend_events',
+        'gtin_cache',
+        'outbox',
+        'ui_tasks',
         'error_reporter',
         # External dependencies
         'selenium',
@@ -0,0 +1,53 @@
+# api_encoding.py
+# Client side of the backend's compact response encodings (backend/encoding.py)
+#
+# Requests made with ACCEPT_HEADERS get row data as a columnar table
+# ({"$columns", "$rows", optional "$index"}), as MessagePack when msgpack is
+# installed, otherwise as JSON. decode_response() turns any of these back
+# into the usual lists/dicts of rows, and passes plain JSON through unchanged,
+# so older backends keep working.
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+COLUMNAR_MIMETYPE = "application/vnd.browsercontrol.columnar+json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+
+if msgpack is not None:
+    ACCEPT_HEADERS = {"Accept": f"{MSGPACK_MIMETYPE}, {COLUMNAR_MIMETYPE};q=0.9, application/json;q=0.5"}
+else:
+    ACCEPT_HEADERS = {"Accept": f"{COLUMNAR_MIMETYPE}, application/json;q=0.5"}
+
+
+def decode_response(resp):
+    """
+    Decode a requests.Response body in any encoding the backend may choose.
+
+    Returns:
+        The same data resp.json() would return for a plain JSON response
+    """
+    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip()
+    if content_type == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise ValueError("Backend sent MessagePack but msgpack is not installed")
+        return from_columnar(msgpack.unpackb(resp.content, raw=False))
+    if content_type == COLUMNAR_MIMETYPE:
+        return from_columnar(resp.json())
+    return resp.json()
+
+
+def from_columnar(obj):
+    """Expand column tables back into lists (or dicts, with "$index") of row dicts."""
+    if isinstance(obj, dict):
+        if "$columns" in obj and "$rows" in obj:
+            columns = obj["$columns"]
+            rows = [dict(zip(columns, (from_columnar(v) for v in row))) for row in obj["$rows"]]
+            if "$index" in obj:
+                return dict(zip(obj["$index"], rows))
+            return rows
+        return {k: from_columnar(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [from_columnar(v) for v in obj]
+    return obj
@@ -16,6 +16,8 @@ a = Analysis(
         'sqlalchemy.engine',
         'sqlalchemy.pool',
         'pyodbc',
+        'msgpack',
+        'waitress',
         'werkzeug',
         'werkzeug.security',
         'urllib.parse',
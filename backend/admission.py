@@ -0,0 +1,180 @@
+# admission.py
+# Admission control: per-client and global concurrency limits for the API
+#
+# A single station can flood the backend, e.g. a held-down Enter key (the
+# tools bind <Return> to a request) or a scanner stuck in a retry loop. Every
+# request has to be admitted first:
+#
+#   - each client IP may have at most per_client_limit requests in flight;
+#     more are rejected immediately
+#   - at most max_in_flight requests run at once across all clients; the next
+#     max_queue wait up to queue_timeout seconds for a slot, and anything
+#     beyond that is rejected immediately
+#
+# Rejections become 429 responses with Retry-After, so a flood is turned
+# away cheaply instead of queueing up in front of SQL Server.
+
+import threading
+import time
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted."""
+
+    def __init__(self, message, reason, retry_after=1):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _ClientCounters:
+    __slots__ = ("in_flight", "admitted", "rejected", "last_rejected_at")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.last_rejected_at = None
+
+
+class AdmissionController:
+    """
+    Args:
+        max_in_flight: Requests allowed to run at once across all clients
+        per_client_limit: Requests one client may have in flight at once
+        max_queue: Requests allowed to wait for a global slot
+        queue_timeout: Seconds a queued request waits before it is rejected
+        max_tracked_clients: Idle clients beyond this are dropped from the counters
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 12,
+        per_client_limit: int = 16,
+        max_queue: int = 32,
+        queue_timeout: float = 2.0,
+        max_tracked_clients: int = 1000,
+    ):
+        self.max_in_flight = max_in_flight
+        self.per_client_limit = per_client_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_tracked_clients = max_tracked_clients
+
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._waiting = 0
+        self._clients = {}
+
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_client_limit": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+            "max_waiting": 0,
+            "queue_wait_seconds_total": 0.0,
+        }
+
+    def acquire(self, client: str):
+        """Admit a request from client or raise AdmissionRejected. Pair with release()."""
+        with self._lock:
+            counters = self._clients.get(client)
+            if counters is None:
+                # Prune first: a fresh entry looks idle and would be swept with the rest
+                self._prune()
+                counters = self._clients[client] = _ClientCounters()
+
+            if counters.in_flight >= self.per_client_limit:
+                self._reject(counters, "rejected_client_limit")
+                raise AdmissionRejected(
+                    f"Too many concurrent requests from {client} (limit {self.per_client_limit})",
+                    "client_limit",
+                )
+            # Count it against the client while it waits, so one client can't
+            # fill the queue either
+            counters.in_flight += 1
+
+            if self._in_flight >= self.max_in_flight:
+                if self._waiting >= self.max_queue:
+                    counters.in_flight -= 1
+                    self._reject(counters, "rejected_queue_full")
+                    raise AdmissionRejected("Server busy, request queue full", "queue_full")
+
+                self._stats["queued"] += 1
+                self._waiting += 1
+                self._stats["max_waiting"] = max(self._stats["max_waiting"], self._waiting)
+                start = time.monotonic()
+                deadline = start + self.queue_timeout
+                try:
+                    while self._in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            counters.in_flight -= 1
+                            self._reject(counters, "rejected_queue_timeout")
+                            raise AdmissionRejected(
+                                f"Server busy, no slot within {self.queue_timeout}s", "queue_timeout"
+                            )
+                        self._slot_free.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    self._stats["queue_wait_seconds_total"] += time.monotonic() - start
+
+            self._in_flight += 1
+            counters.admitted += 1
+            self._stats["admitted"] += 1
+
+    def release(self, client: str):
+        with self._lock:
+            self._in_flight -= 1
+            counters = self._clients.get(client)
+            if counters is not None:
+                counters.in_flight -= 1
+            self._slot_free.notify()
+
+    def stats(self) -> dict:
+        """Global gauges and counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "max_in_flight": self.max_in_flight,
+                "per_client_limit": self.per_client_limit,
+                "max_queue": self.max_queue,
+                "clients": len(self._clients),
+            })
+        snapshot["queue_wait_seconds_total"] = round(snapshot["queue_wait_seconds_total"], 6)
+        return snapshot
+
+    def client_stats(self, top: int = 20) -> list:
+        """Per-client counters for the most-rejected clients, worst first."""
+        now = time.monotonic()
+        with self._lock:
+            rows = [
+                {
+                    "client": client,
+                    "in_flight": c.in_flight,
+                    "admitted": c.admitted,
+                    "rejected": c.rejected,
+                    "seconds_since_rejected": round(now - c.last_rejected_at, 1) if c.last_rejected_at else None,
+                }
+                for client, c in self._clients.items()
+                if c.rejected
+            ]
+        rows.sort(key=lambda r: r["rejected"], reverse=True)
+        return rows[:top]
+
+    def _reject(self, counters, stat):
+        """Caller holds the lock."""
+        self._stats[stat] += 1
+        counters.rejected += 1
+        counters.last_rejected_at = time.monotonic()
+
+    def _prune(self):
+        """Forget idle clients with nothing rejected once the table is too big. Caller holds the lock."""
+        if len(self._clients) <= self.max_tracked_clients:
+            return
+        for client in [k for k, c in self._clients.items() if c.in_flight == 0 and not c.rejected]:
+            del self._clients[client]
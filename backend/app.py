@@ -1,6 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 import pyodbc
+import argparse
+import base64
+import functools
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import signal
+import sys
 import threading
+import time
+import zlib
+from contextlib import contextmanager
+from admission import AdmissionController, AdmissionRejected
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from cluster import Supervisor, WorkerLink
+from db_pool import ConnectionPool, PoolTimeoutError
+from encoding import encode_response
+from events import CLOSED, EventBroker, TooManySubscribers
+from idempotency import IdempotencyStore
+from metrics import RequestMetrics, merge_snapshots
+from query_log import QueryLog, TimedConnection
+from server import APIServer
+from ttl_cache import TTLCache
+from settings_changes import SettingsChangeLog
+from settings_store import SettingsStore
+from single_flight import SingleFlight
+from sites import Site, SiteRouter, UnknownSite
+from write_behind import WriteBehindQueue
 
 app = Flask(__name__)
 
@@ -8,6 +37,449 @@ app = Flask(__name__)
 SERVER = "JASPRODSQL09"
 DATABASE = "ILS"
 DRIVER = "{ODBC Driver 17 for SQL Server}"
+DB_LOGIN_TIMEOUT = 5        # Seconds before an ODBC connect attempt gives up
+
+# Sites (buildings) served by this backend, each with its own database,
+# connection pool, breaker, lookup cache and admission limits (see sites.py).
+# USER_PROFILE settings always live on DEFAULT_SITE.
+DEFAULT_SITE = "main"
+SITES = {
+    DEFAULT_SITE: {"server": SERVER, "database": DATABASE},
+    # "b2": {"server": "B2SQL01", "database": "ILS"},
+}
+SITE_DEPARTMENTS = {}       # Department prefix -> site for clients that send no site, e.g. {"B2.": "b2"}
+
+# Circuit breaker around SQL Server connects
+BREAKER_FAILURE_THRESHOLD = 3   # Consecutive connect failures that trip it
+BREAKER_RESET_TIMEOUT = 10      # Seconds between background probes while open
+
+# Connection pool configuration
+POOL_MIN_SIZE = 4           # Opened at service start
+POOL_MAX_SIZE = 20          # Hard cap on concurrent SQL Server connections
+POOL_ACQUIRE_TIMEOUT = 5    # Seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = 300     # Retire connections idle longer than this (above min size)
+POOL_MAX_LIFETIME = 3600    # Recycle connections older than this
+POOL_VALIDATE_AFTER = 30    # Ping connections idle longer than this before reuse
+
+# Serving configuration (defaults for the command-line options in main())
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 5000
+SERVE_THREADS = 64              # Worker threads; admission caps real work, the rest hold /events streams
+SERVE_CONNECTION_LIMIT = 200    # Open client connections (dozens of stations, keep-alive)
+SERVE_BACKLOG = 128             # Connections waiting to be accepted
+SERVE_KEEPALIVE_TIMEOUT = 60    # Seconds an idle keep-alive connection stays open
+SERVE_DRAIN_TIMEOUT = 10        # Seconds to let in-flight requests finish on shutdown
+SERVE_WORKERS = 1               # Processes sharing the port; >1 runs a supervisor (see cluster.py)
+
+# Admission control (defaults for the command-line options in main())
+ADMISSION_MAX_IN_FLIGHT = 12    # Requests running at once; keeps worker threads free for /health
+# Requests one client IP may have in flight. A station legitimately runs about
+# ten at once: 4 ui_tasks workers, the outbox flusher, the settings poll, and
+# reads it hedged or timed out that are still running here. Several stations
+# can also share an IP behind NAT. 16 leaves room for that and still stops a
+# runaway client from filling the queue. /events streams are not counted.
+ADMISSION_PER_CLIENT = 16
+ADMISSION_QUEUE = 32            # Requests allowed to wait for a slot before 429s
+ADMISSION_QUEUE_TIMEOUT = 2     # Seconds a request waits for a slot before 429
+ADMISSION_EXEMPT = {"/health", "/metrics", "/stats", "/slow_queries",   # Monitoring is never throttled
+                    "/events"}   # Long-lived, capped by EVENTS_MAX_SUBSCRIBERS instead
+
+# Per-statement timing
+SLOW_QUERY_MS = 250         # Statements slower than this (connect + execute + fetch) are logged
+SLOW_QUERY_KEEP = 500       # Slow executions kept for /slow_queries
+SLOW_QUERY_WINDOW = 3600    # Seconds a slow execution stays in /slow_queries
+
+# Batch endpoints
+MAX_ARRIVAL_BATCH = 500     # Containers per batch arrival (SQL Server allows 2100 parameters)
+MAX_GTIN_BATCH = 100        # GTINs per multi-GTIN lookup
+
+# GTIN -> LP lookup cache, keyed by (gtin, department); first pages by (gtin, department, limit)
+LP_CACHE_SIZE = 2048        # Entries kept (least recently used evicted first)
+LP_CACHE_TTL = 15           # Seconds a cached lookup stays valid
+
+# lookup_lp_by_gtin pagination and streaming
+LP_PAGE_SIZE = 50           # Page size when a cursor is sent without a limit
+MAX_LP_PAGE_SIZE = 500      # Largest page a client may ask for
+LP_STREAM_BATCH = 100       # Rows fetched per fetchmany() when streaming
+
+# Write-behind for update_user_settings
+SETTINGS_FLUSH_INTERVAL = 0.5   # Max seconds a settings update waits before it is committed
+SETTINGS_FLUSH_BATCH = 200      # Pending users that trigger an immediate commit
+SETTINGS_SPILL_FILE = "pending_user_settings.json"  # Unflushed updates kept across restarts
+SETTINGS_REFRESH_INTERVAL = 60  # Seconds between reloads of USER_PROFILE into memory
+SETTINGS_REMOTE_UNSETTLED = 300 # Seconds another worker's queued update shields a user from refresh
+
+# Server-Sent Events push channel (GET /events)
+EVENTS_MAX_SUBSCRIBERS = 40     # Open streams (one per station); each holds a worker thread
+EVENTS_HISTORY = 256            # Recent events kept for Last-Event-ID replay after a reconnect
+EVENTS_QUEUE_SIZE = 100         # Undelivered events per stream before it is dropped
+EVENTS_HEARTBEAT = 15           # Seconds between keep-alive comments on an idle stream
+EVENTS_RETRY_MS = 3000          # Reconnect delay suggested to clients
+
+# Writes retried by station outboxes (Idempotency-Key header)
+IDEMPOTENCY_KEYS = 10000        # Write responses remembered (least recently used forgotten first)
+IDEMPOTENCY_TTL = 86400         # Seconds a response is remembered; covers an outbox replayed the next morning
+
+
+def _build_site(key, config):
+    connection_string = (
+        f"DRIVER={DRIVER};"
+        f"SERVER={config['server']};"
+        f"DATABASE={config['database']};"
+        "Trusted_Connection=yes;"
+    )
+
+    def connect():
+        return pyodbc.connect(connection_string, timeout=DB_LOGIN_TIMEOUT)
+
+    breaker = CircuitBreaker(
+        probe=lambda: connect().close(),
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=BREAKER_RESET_TIMEOUT,
+        name=f"SQL Server {config['server']}",
+    )
+    pool = ConnectionPool(
+        breaker.guard(connect),
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        acquire_timeout=POOL_ACQUIRE_TIMEOUT,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        max_lifetime=POOL_MAX_LIFETIME,
+        validate_after=POOL_VALIDATE_AFTER,
+    )
+    admission = AdmissionController(
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        per_client_limit=ADMISSION_PER_CLIENT,
+        max_queue=ADMISSION_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    )
+    return Site(
+        key,
+        config["server"],
+        config["database"],
+        breaker=breaker,
+        pool=pool,
+        lp_cache=TTLCache(maxsize=LP_CACHE_SIZE, ttl=LP_CACHE_TTL),
+        inflight=SingleFlight(),    # Coalesces identical concurrent reads
+        admission=admission,
+    )
+
+
+sites = SiteRouter(
+    {key: _build_site(key, config) for key, config in SITES.items()},
+    default=DEFAULT_SITE,
+    department_prefixes=SITE_DEPARTMENTS,
+)
+home = sites.home
+# The default site's parts keep their module-level names (settings, gauges, bench)
+breaker, pool, lp_cache, inflight, admission = home.breaker, home.pool, home.lp_cache, home.inflight, home.admission
+
+query_log = QueryLog(threshold_ms=SLOW_QUERY_MS, keep=SLOW_QUERY_KEEP, window=SLOW_QUERY_WINDOW)
+settings_changes = SettingsChangeLog()
+event_broker = EventBroker(
+    history=EVENTS_HISTORY,
+    max_subscribers=EVENTS_MAX_SUBSCRIBERS,
+    queue_size=EVENTS_QUEUE_SIZE,
+)
+
+# First response per Idempotency-Key, so a retried write never runs twice
+idempotency = IdempotencyStore(
+    maxsize=IDEMPOTENCY_KEYS,
+    ttl=IDEMPOTENCY_TTL,
+    on_store=lambda key, response: _broadcast("idempotent_response", {"key": key, "response": response}),
+)
+
+# Set in cluster worker processes; changes made here are broadcast to the
+# other workers so their caches, settings and event streams stay in step
+cluster_link = None
+worker_id = None
+worker_count = 1
+
+
+def _broadcast(kind, payload):
+    if cluster_link is not None:
+        cluster_link.broadcast(kind, payload)
+
+
+def _commit_user_settings(batch):
+    """Write {username: {"theme", "zoom"}} to USER_PROFILE in one transaction."""
+    with db_connection(home) as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(
+            UPDATE_USER_SETTINGS_SQL,
+            [(s["theme"], s["zoom"], username) for username, s in batch.items()],
+        )
+        conn.commit()
+        cursor.close()
+    _broadcast("settings_settled", list(batch))
+
+
+# Merges rapid settings changes per user (last write wins) into batched UPDATEs
+settings_writes = WriteBehindQueue(
+    _commit_user_settings,
+    flush_interval=SETTINGS_FLUSH_INTERVAL,
+    max_batch=SETTINGS_FLUSH_BATCH,
+    spill_path=os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), SETTINGS_SPILL_FILE),
+    name="user settings",
+)
+
+
+# Newest version queued per user, so a change that reaches the queue late
+# (relayed from another worker) can't replace a newer one
+_settings_write_versions = {}
+_settings_write_lock = threading.Lock()
+
+
+def _settings_owner(username):
+    """
+    Worker that commits username's settings. In cluster mode all of a user's
+    writes go through one worker's write-behind queue, so they are committed
+    in version order; two queues could commit them in either order. If the
+    owner is down (restarting), the worker that took the update commits it.
+    """
+    if cluster_link is None:
+        return worker_id
+    owner = zlib.crc32(username.lower().encode("utf-8")) % worker_count
+    info = cluster_link.cluster().get(owner)
+    if owner != worker_id and info is not None and not info["alive"]:
+        return worker_id
+    return owner
+
+
+def _queue_settings_write(username, settings, version):
+    """Queue a settings write unless a newer version for the user is already queued."""
+    with _settings_write_lock:
+        if version <= _settings_write_versions.get(username, 0):
+            return False
+        _settings_write_versions[username] = version
+        settings_writes.submit(username, settings)
+        return True
+
+
+def _settings_changed(username, settings, version=None, event_id=None):
+    """
+    Stamp a settings change for delta sync and push it to /events subscribers.
+    settings is None when the user's settings were removed outside the API.
+    version and event_id are given for a change another worker stamped.
+
+    Returns:
+        (version, event_id), to broadcast with the change
+    """
+    version = settings_changes.record(username, settings, version)
+    event_id = event_broker.publish("settings", {
+        "username": username,
+        "settings": dict(settings) if settings is not None else None,
+        "epoch": settings_changes.epoch,
+        "version": version,
+    }, event_id=event_id)
+    return version, event_id
+
+
+def _settings_refreshed(username, settings):
+    """
+    The refresher found an edit made outside the API. In cluster mode every
+    worker refreshes its own store, but only worker 0 stamps and announces
+    the change, so it gets one version and event id cluster-wide.
+    """
+    if cluster_link is not None and worker_id != 0:
+        return
+    version, event_id = _settings_changed(username, settings)
+    _broadcast("settings", {"username": username, "settings": settings, "version": version,
+                            "event_id": event_id, "external": True})
+
+
+# Users another worker has queued an update for: {username: expires_at}.
+# Until it is committed there, a refresh here could read the old row back.
+_remote_unsettled = {}
+_remote_unsettled_lock = threading.Lock()
+
+
+def _unsettled_user_settings():
+    now = time.monotonic()
+    with _remote_unsettled_lock:
+        for username in [u for u, expires in _remote_unsettled.items() if expires < now]:
+            del _remote_unsettled[username]
+        remote = set(_remote_unsettled)
+    return settings_writes.unsettled_keys() | remote
+
+
+def _apply_remote_settings(payload):
+    """
+    Another worker accepted a settings update or found an external edit.
+    Applied under the version and event id it was given; if this worker
+    owns the user, it also queues the write.
+    """
+    username, settings, version = payload["username"], payload["settings"], payload.get("version")
+    if payload.get("owner") == worker_id:
+        _queue_settings_write(username, settings, version)
+    elif not payload.get("external"):
+        with _remote_unsettled_lock:
+            _remote_unsettled[username] = time.monotonic() + SETTINGS_REMOTE_UNSETTLED
+    # A relayed change can arrive after a newer one made here
+    latest = settings_changes.version_of(username)
+    if version is None or latest is None or version > latest:
+        if settings is None:
+            settings_store.remove(username)
+        else:
+            settings_store.put(username, settings)
+    _settings_changed(username, settings, version, payload.get("event_id"))
+
+
+def _remote_settings_settled(usernames):
+    with _remote_unsettled_lock:
+        for username in usernames:
+            _remote_unsettled.pop(username, None)
+
+
+def _load_user_settings():
+    with db_connection(home) as conn:
+        cursor = conn.cursor()
+        user_settings = _fetch_all_user_settings(cursor)
+        cursor.close()
+    return user_settings
+
+
+# Settings reads are served from memory; edits made outside the API are
+# picked up by the refresher and fed to delta sync and /events
+settings_store = SettingsStore(
+    _load_user_settings,
+    unsettled_keys=_unsettled_user_settings,
+    on_change=_settings_refreshed,
+)
+
+request_metrics = RequestMetrics()
+request_metrics.init_app(app)
+request_metrics.add_gauges("pool", lambda: pool.stats())
+request_metrics.add_gauges("lp_cache", lambda: lp_cache.stats())
+request_metrics.add_gauges("coalescing", lambda: inflight.stats())
+request_metrics.add_gauges("settings_writes", lambda: settings_writes.stats())
+request_metrics.add_gauges("settings_store", lambda: settings_store.stats())
+request_metrics.add_gauges("admission", lambda: admission.stats())
+request_metrics.add_gauges("queries", lambda: query_log.stats())
+request_metrics.add_gauges("events", lambda: event_broker.stats())
+request_metrics.add_gauges("idempotency", lambda: idempotency.stats())
+request_metrics.add_gauges("breaker", lambda: {
+    "open": int(breaker.state != CircuitBreaker.CLOSED),
+    **breaker.stats(),
+})
+for _site in sites:
+    if _site is not home:
+        for _name, _source in (("pool", _site.pool.stats), ("lp_cache", _site.lp_cache.stats),
+                               ("admission", _site.admission.stats), ("breaker", _site.breaker.stats)):
+            request_metrics.add_gauges(f"site_{_site.key}_{_name}", _source)
+
+
+@app.before_request
+def _resolve_site():
+    """Route the request to its site (X-Site / "site", else by department, else the default)."""
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    site_key = request.headers.get("X-Site") or request.args.get("site") or data.get("site")
+    department = data.get("department") or request.headers.get("X-Department")
+    try:
+        g.site = sites.resolve(site_key, department)
+    except UnknownSite as e:
+        return jsonify({"error": str(e), "code": "unknown_site"}), 400
+    return None
+
+@app.before_request
+def _admit_request():
+    """Reject with 429 when the client or the site is over its concurrency limit."""
+    if request.path in ADMISSION_EXEMPT:
+        return None
+    client = request.remote_addr or "unknown"
+    try:
+        g.site.admission.acquire(client)
+    except AdmissionRejected as e:
+        response = jsonify({
+            "error": str(e),
+            "code": "throttled",
+            "reason": e.reason,
+            "retry_after": e.retry_after
+        })
+        response.status_code = 429
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    g.admitted_client = client
+    return None
+
+@app.teardown_request
+def _release_admission(exc):
+    # Runs after streamed bodies finish too, so a stream holds its slot until done
+    client = g.pop("admitted_client", None)
+    if client is not None:
+        g.site.admission.release(client)
+
+
+def _site():
+    """The current request's site (the default site outside a request)."""
+    return g.get("site", home) if has_request_context() else home
+
+
+@contextmanager
+def db_connection(site=None):
+    """
+    Check a connection out of the site's pool, counting the block as DB time in /metrics.
+
+    site defaults to the current request's site. The connection's cursors
+    time every statement for the slow-query log. Raises CircuitOpenError
+    immediately while that site's SQL Server is known to be down.
+    """
+    site = site or _site()
+    site.breaker.check()
+    route = request.url_rule.rule if has_request_context() and request.url_rule else None
+    with request_metrics.time_db():
+        start = time.perf_counter()
+        with site.pool.connection() as conn:
+            timed = TimedConnection(conn, query_log, time.perf_counter() - start, route)
+            try:
+                yield timed
+            finally:
+                # Statements left open by an error still reach the log
+                timed.finish()
+
+def _error_response(key, e):
+    """
+    JSON error body for a failed route, under the key its clients read ("MSG" or "error").
+
+    Known database outages and pool exhaustion become a structured 503 with
+    Retry-After, so clients can fail fast and back off instead of waiting out a timeout.
+    """
+    if isinstance(e, (CircuitOpenError, PoolTimeoutError)):
+        retry_after = getattr(e, "retry_after", 1)
+        response = jsonify({
+            key: str(e),
+            "code": "db_unavailable" if isinstance(e, CircuitOpenError) else "db_busy",
+            "retry_after": retry_after
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+    return jsonify({key: str(e)}), 500
+
+def _idempotent(view):
+    """
+    Run a write once per Idempotency-Key (scoped to the site and route).
+    A repeat gets the first response back, marked Idempotent-Replayed.
+    Requests without the header run as before.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(*args, **kwargs)
+
+        def execute():
+            response = app.make_response(view(*args, **kwargs))
+            return response.status_code, response.get_data(), list(response.headers.items())
+
+        (status, body, headers), replayed = idempotency.run(f"{g.site.key}:{request.path}:{key}", execute)
+        response = Response(body, status=status, headers=headers)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
+    return wrapper
 
 @app.errorhandler(500)
 def handle_500_error(e):
@@ -17,14 +489,268 @@ def handle_500_error(e):
 @app.route("/health", methods=["GET"])
 def health_check():
     """
-    Health check endpoint - simple status check.
+    Health check endpoint - reports the circuit breaker of the caller's
+    site database so clients can degrade without waiting on a DB call.
+    Returns 503 while it is open. With several sites it also lists each
+    site's breaker state, and in cluster mode every worker process.
+    """
+    database = g.site.breaker.stats()
+    body = {"status": "healthy", "message": "API is running", "database": database}
+    if database["state"] != CircuitBreaker.CLOSED:
+        body.update(status="degraded", message="API is running, database unavailable")
+    if len(sites) > 1:
+        body["site"] = g.site.key
+        body["sites"] = {site.key: site.breaker.state for site in sites}
+    if cluster_link is not None:
+        body["worker_id"] = worker_id
+        body["workers"] = {
+            wid: {
+                "pid": info["pid"],
+                "alive": info["alive"],
+                "restarts": info["restarts"],
+                "uptime": info["uptime"],
+                "database": (info["report"] or {}).get("database", {}).get("state"),
+            }
+            for wid, info in cluster_link.cluster().items()
+        }
+    return jsonify(body), 200 if body["status"] == "healthy" else 503
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Per-route request counts, error counts and latency histograms (split
+    into DB and serialization time) plus pool and cache gauges, in
+    Prometheus text format. In cluster mode counters and histograms are
+    summed over all workers and gauges are labelled by worker.
+    """
+    if cluster_link is None:
+        return Response(request_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # This worker's own numbers are live; the others' are from their last report
+    workers = cluster_link.cluster()
+    reports = {wid: info["report"] for wid, info in workers.items() if "metrics" in (info["report"] or {})}
+    reports[worker_id] = _worker_report()
+    gauges = [
+        (metric, f'worker="{wid}"', value)
+        for wid, report in reports.items()
+        for metric, value in report["gauges"].items()
+    ]
+    gauges.append(("browsercontrol_cluster_workers", "", len(workers)))
+    gauges.append(("browsercontrol_cluster_workers_alive", "", sum(1 for w in workers.values() if w["alive"])))
+    gauges.extend(
+        ("browsercontrol_cluster_worker_restarts", f'worker="{wid}"', info["restarts"])
+        for wid, info in workers.items()
+    )
+    text = request_metrics.render(
+        snapshot=merge_snapshots(report["metrics"] for report in reports.values()),
+        gauges=gauges,
+        started_at=min(report["started_at"] for report in reports.values()),
+    )
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+def _local_stats():
+    """Stats for the default site and the shared parts; every site under "sites" if there are several."""
+    stats = {
+        "admission": {**admission.stats(), "throttled_clients": admission.client_stats()},
+        "pool": pool.stats(),
+        "breaker": breaker.stats(),
+        "lp_cache": lp_cache.stats(),
+        "coalescing": inflight.stats(),
+        "settings_store": settings_store.stats(),
+        "settings_writes": settings_writes.stats(),
+        "events": event_broker.stats(),
+        "idempotency": idempotency.stats()
+    }
+    if len(sites) > 1:
+        stats["sites"] = {site.key: site.stats() for site in sites}
+    return stats
+
+def _worker_report():
+    """What a cluster worker sends the supervisor every REPORT_INTERVAL."""
+    return {
+        "database": breaker.stats(),
+        "metrics": request_metrics.snapshot(),
+        "gauges": request_metrics.gauges(),
+        "started_at": request_metrics.started_at,
+        "stats": _local_stats(),
+    }
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    """
+    Runtime statistics for the API (connection pool, circuit breaker, lookup
+    cache, request coalescing, user settings store/write-behind and admission
+    counters, including the clients being throttled, and event streams).
+    In cluster mode these are this worker's, and "workers" has every
+    worker's from its last report.
+    """
+    stats = _local_stats()
+    if cluster_link is not None:
+        stats["worker_id"] = worker_id
+        stats["workers"] = {
+            wid: {
+                "pid": info["pid"],
+                "alive": info["alive"],
+                "restarts": info["restarts"],
+                "uptime": info["uptime"],
+                "report_age": info["report_age"],
+                "stats": (info["report"] or {}).get("stats"),
+            }
+            for wid, info in cluster_link.cluster().items()
+        }
+    return jsonify(stats)
+
+@app.route("/slow_queries", methods=["GET"])
+def get_slow_queries():
+    """
+    Slowest and most recently failed statements (parameters redacted to
+    type and length) and per-statement totals split into connect, execute
+    and fetch time.
+
+    Query args: top (default 20) limits both lists.
     """
+    top = request.args.get("top", default=20, type=int)
     return jsonify({
-        "status": "healthy",
-        "message": "API is running"
+        "threshold_ms": query_log.threshold_ms,
+        "window_seconds": query_log.window,
+        "slowest": query_log.slowest(top),
+        "failed": query_log.failed(top),
+        "statements": query_log.statements()[:top]
     })
 
+@app.route("/events", methods=["GET"])
+def stream_events():
+    """
+    Server-Sent Events stream of changes, so stations don't have to poll.
+
+    Events:
+        settings - {"username", "settings", "epoch", "version"} after a user's
+                   settings change (through the API or found by the refresher)
+        arrival  - {"site", "containers": {PARENT_CONTAINER_ID: rows_affected}}
+                   after pallets at the stream's site are marked as arrived
+        resync   - the Last-Event-ID sent on reconnect is no longer known;
+                   reload from the regular endpoints
+
+    Send Last-Event-ID (header, or last_event_id query arg) when reconnecting
+    to receive the events missed in between. Idle streams get a comment every
+    EVENTS_HEARTBEAT seconds.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+
+    try:
+        subscription = event_broker.subscribe(last_event_id, site=g.site.key)
+    except TooManySubscribers as e:
+        response = jsonify({"error": str(e), "code": "too_many_streams"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+
+    def stream():
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            for event in subscription.replay:
+                yield event.to_sse()
+            while True:
+                event = subscription.get(timeout=EVENTS_HEARTBEAT)
+                if event is CLOSED:
+                    return
+                yield ": keep-alive\n\n" if event is None else event.to_sse()
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/invalidate_lp_cache", methods=["POST"])
+def invalidate_lp_cache():
+    """
+    Drop cached GTIN lookups after inventory changed outside this API.
+
+    Accepts any of {"gtin": ...}, {"gtins": [...]} or {"lp": ...};
+    an empty body clears the whole cache.
+    """
+    data = request.get_json(silent=True) or {}
+    gtins = set(data.get("gtins") or [])
+    if data.get("gtin"):
+        gtins.add(data["gtin"])
+    lp = data.get("lp")
+
+    _broadcast("invalidate_lp_cache", {"site": g.site.key, "gtins": list(gtins), "lp": lp})
+    return jsonify({"invalidated": _invalidate_lp_cache(g.site, gtins, lp)})
+
+def _invalidate_lp_cache(site, gtins, lp):
+    """Drop the site's lookups for any of gtins or containing LP lp; everything if neither is given."""
+    if not gtins and not lp:
+        return site.lp_cache.clear()
+    return site.lp_cache.invalidate_where(_lp_cache_matcher(gtins=gtins, lps={lp} if lp else ()))
+
+def _lp_cache_matcher(gtins=(), lps=(), items=(), empty=False):
+    """Predicate for lp_cache.invalidate_where: the GTIN, or any row's LP or item, matches (or no rows, with empty)."""
+    def matches(key, value):
+        if key[0] in gtins:
+            return True
+        rows = value["rows"] if isinstance(value, dict) else value   # First pages are cached whole
+        if empty and not rows:
+            return True
+        return any(row.get("LOGISTICS_UNIT") in lps or row.get("ITEM") in items for row in rows)
+    return matches
+
+# Totes become LPs (LOGISTICS_UNIT = CONTAINER_ID) once received into DECANT locations
+ARRIVED_INVENTORY_SQL = """
+SELECT DISTINCT
+    LI.LOGISTICS_UNIT,
+    LI.ITEM
+FROM SHIPPING_CONTAINER SC
+INNER JOIN LOCATION_INVENTORY LI ON LI.LOGISTICS_UNIT = SC.CONTAINER_ID
+WHERE SC.PARENT_CONTAINER_ID IN ({placeholders})
+"""
+
+def _arrived_inventory(conn, container_ids):
+    """
+    (lps, items) in inventory for the totes on the given pallets, or None if
+    the lookup failed (the caller then drops every cached lookup instead).
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(ARRIVED_INVENTORY_SQL.format(placeholders=", ".join("?" for _ in container_ids)),
+                       list(container_ids))
+        rows = cursor.fetchall()
+        cursor.close()
+    except Exception as e:
+        print(f"[API] Could not read arrived inventory, dropping all cached lookups: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        return None
+    return sorted({lp for lp, _ in rows}), sorted({item for _, item in rows})
+
+def _pallets_arrived(site, containers, inventory, event_id=None):
+    """
+    Arrivals feed DECANT inventory, so drop the site's cached lookups that
+    mention the arrived LPs or their items, and the empty ones (the GTIN may
+    have stock now); also tell its /events subscribers.
+    containers: {PARENT_CONTAINER_ID: rows}, inventory: (lps, items) from
+    _arrived_inventory, or None to drop every lookup.
+    event_id is given for an arrival another worker announced.
+
+    Returns:
+        The event id, to broadcast with the arrival
+    """
+    data = {"site": site.key, "containers": containers}
+    if inventory is None:
+        site.lp_cache.clear()
+    else:
+        lps, items = inventory
+        site.lp_cache.invalidate_where(_lp_cache_matcher(lps=set(lps), items=set(items), empty=True))
+        data.update(lps=list(lps), items=list(items))
+    return event_broker.publish("arrival", data, site=site.key, event_id=event_id)
+
 @app.route("/update_pallet_arrived_by_tote", methods=["POST"])
+@_idempotent
 def update_pallet_arrived_by_tote():
     """
     Update pallet status to 'Arrived' by container ID.
@@ -36,12 +762,6 @@ def update_pallet_arrived_by_tote():
         return jsonify({"MSG": "Missing PARENT_CONTAINER_ID"}), 400
 
     try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
         sql = """
         DECLARE @PARENT_CONTAINER_ID NVARCHAR(50) = ?;
 
@@ -51,17 +771,100 @@ def update_pallet_arrived_by_tote():
         WHERE PARENT_CONTAINER_ID = @PARENT_CONTAINER_ID
             AND USER_DEF1 <> N'Arrived'
         """
-        
-        cursor = conn.cursor()
-        cursor.execute(sql, (container_id,))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, (container_id,))
+            rows_affected = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            inventory = _arrived_inventory(conn, [container_id]) if rows_affected > 0 else None
+
+        if rows_affected > 0:
+            event_id = _pallets_arrived(g.site, {container_id: rows_affected}, inventory)
+            _broadcast("arrival", {"site": g.site.key, "containers": {container_id: rows_affected},
+                                   "inventory": inventory, "event_id": event_id})
+
         return jsonify({"MSG": "Update successful", "rows_affected": rows_affected})
     except Exception as e:
-        return jsonify({"MSG": str(e)}), 500
+        return _error_response("MSG", e)
+
+def _container_key(container_id) -> str:
+    """
+    A container id as SQL Server compares it: the default collation ignores
+    case and trailing spaces, so "p123 " matches the stored "P123".
+    """
+    return str(container_id).rstrip(" ").upper()
+
+@app.route("/update_pallets_arrived_by_tote", methods=["POST"])
+@_idempotent
+def update_pallets_arrived_by_tote():
+    """
+    Update many pallets to 'Arrived' in one transaction.
+
+    Expects {"PARENT_CONTAINER_IDS": [...]} and returns rows_affected per container.
+    """
+    data = request.json
+    container_ids = data.get("PARENT_CONTAINER_IDS")
+
+    if not container_ids or not isinstance(container_ids, list):
+        return jsonify({"MSG": "Missing PARENT_CONTAINER_IDS"}), 400
+
+    # Drop blanks and duplicates (as the database compares them) but keep the
+    # caller's spelling and order for the response
+    requested = {}
+    for cid in container_ids:
+        if cid:
+            requested.setdefault(_container_key(cid), str(cid))
+    container_ids = list(requested.values())
+    if not container_ids:
+        return jsonify({"MSG": "Missing PARENT_CONTAINER_IDS"}), 400
+    if len(container_ids) > MAX_ARRIVAL_BATCH:
+        return jsonify({"MSG": f"Too many containers (max {MAX_ARRIVAL_BATCH})"}), 400
+
+    try:
+        placeholders = ", ".join("?" for _ in container_ids)
+        sql = f"""
+        SET NOCOUNT ON;
+        DECLARE @ARRIVED TABLE (PARENT_CONTAINER_ID NVARCHAR(50));
+
+        UPDATE SHIPPING_CONTAINER SET
+            USER_DEF2 = USER_DEF1
+            ,USER_DEF1 = N'Arrived'
+        OUTPUT INSERTED.PARENT_CONTAINER_ID INTO @ARRIVED
+        WHERE PARENT_CONTAINER_ID IN ({placeholders})
+            AND USER_DEF1 <> N'Arrived';
+
+        SELECT PARENT_CONTAINER_ID, ROWS_AFFECTED = COUNT(*)
+        FROM @ARRIVED
+        GROUP BY PARENT_CONTAINER_ID;
+        """
+
+        containers = {cid: 0 for cid in container_ids}
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, container_ids)
+            for cid, count in cursor.fetchall():
+                # Report under the id the caller sent, not the stored spelling
+                cid = requested.get(_container_key(cid), cid)
+                containers[cid] = containers.get(cid, 0) + count
+            conn.commit()
+            cursor.close()
+            arrived = {cid: count for cid, count in containers.items() if count}
+            inventory = _arrived_inventory(conn, list(arrived)) if arrived else None
+
+        if arrived:
+            event_id = _pallets_arrived(g.site, arrived, inventory)
+            _broadcast("arrival", {"site": g.site.key, "containers": arrived,
+                                   "inventory": inventory, "event_id": event_id})
+
+        return jsonify({
+            "MSG": "Update successful",
+            "rows_affected": sum(containers.values()),
+            "containers": containers
+        })
+    except Exception as e:
+        return _error_response("MSG", e)
 
 @app.route("/select_pallet_arrived_by_tote", methods=["POST"])
 def select_pallet_arrived_by_tote():
@@ -74,30 +877,115 @@ def select_pallet_arrived_by_tote():
     if not tote:
         return jsonify({"MSG": "Missing tote number"}), 400
 
-    try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
+    def query():
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("EXEC usp_BrowserControlArrive ?", (tote,))
+            row = cursor.fetchone()
+            columns = [desc[0] for desc in cursor.description]
+            result = dict(zip(columns, row))
+            cursor.close()
+        return result
 
-        cursor = conn.cursor()
-        cursor.execute("EXEC usp_BrowserControlArrive ?", (tote,))
-        row = cursor.fetchone()
-        columns = [desc[0] for desc in cursor.description]
-        result = dict(zip(columns, row))
-        cursor.close()
-        conn.close()
-        return jsonify(result)
+    try:
+        # Stations scanning the same tote at once share one execution
+        result = g.site.inflight.do(("select_pallet_arrived_by_tote", tote), query)
+        return encode_response(result)
     except Exception as e:
-        return jsonify({"MSG": str(e)}), 500
+        return _error_response("MSG", e)
+
+
+LOOKUP_LP_SQL = """
+DECLARE @GTIN NVARCHAR(50) = ?;
+DECLARE @LOCATION NVARCHAR(50) = ?;
+
+SELECT
+    LI.LOCATION,
+    LI.ITEM,
+    ON_HAND_QTY = CONVERT(INT, LI.ON_HAND_QTY),
+    TO_LOC = LI.USER_DEF1,
+    LI.LOGISTICS_UNIT,
+    UM_MATCH = CASE WHEN ICR.QUANTITY_UM = RIGHT(LEFT(LI.USER_DEF1, 7), 2) THEN 1 ELSE 0 END
+FROM LOCATION_INVENTORY LI
+INNER JOIN ITEM_CROSS_REFERENCE ICR ON ICR.ITEM = LI.ITEM
+WHERE
+    ICR.X_REF_ITEM = @GTIN
+    AND LI.TEMPLATE_FIELD1 = N'DECANT'
+    AND LI.ON_HAND_QTY > 0
+ORDER BY
+    CASE
+        WHEN LI.LOCATION = @LOCATION THEN N'A'
+        WHEN LI.TEMPLATE_FIELD2 = N'WS' THEN N'AB'
+        ELSE LI.LOCATION
+    END;
+"""
+
+# Keyset-paginated variant: same rows and department-first order, with
+# INTERNAL_LOCATION_INV as a unique tie-breaker so pages never overlap
+LOOKUP_LP_PAGE_SQL = """
+DECLARE @GTIN NVARCHAR(50) = ?;
+DECLARE @LOCATION NVARCHAR(50) = ?;
+DECLARE @AFTER_SORT_KEY NVARCHAR(50) = ?;
+DECLARE @AFTER_ID NUMERIC(19, 0) = ?;
+DECLARE @LIMIT INT = ?;
 
+SELECT TOP (@LIMIT)
+    LI.LOCATION,
+    LI.ITEM,
+    ON_HAND_QTY = CONVERT(INT, LI.ON_HAND_QTY),
+    TO_LOC = LI.USER_DEF1,
+    LI.LOGISTICS_UNIT,
+    UM_MATCH = CASE WHEN ICR.QUANTITY_UM = RIGHT(LEFT(LI.USER_DEF1, 7), 2) THEN 1 ELSE 0 END,
+    K.SORT_KEY,
+    LI.INTERNAL_LOCATION_INV
+FROM LOCATION_INVENTORY LI
+INNER JOIN ITEM_CROSS_REFERENCE ICR ON ICR.ITEM = LI.ITEM
+CROSS APPLY (
+    SELECT SORT_KEY = CASE
+        WHEN LI.LOCATION = @LOCATION THEN N'A'
+        WHEN LI.TEMPLATE_FIELD2 = N'WS' THEN N'AB'
+        ELSE LI.LOCATION
+    END
+) K
+WHERE
+    ICR.X_REF_ITEM = @GTIN
+    AND LI.TEMPLATE_FIELD1 = N'DECANT'
+    AND LI.ON_HAND_QTY > 0
+    AND (
+        @AFTER_SORT_KEY IS NULL
+        OR K.SORT_KEY > @AFTER_SORT_KEY
+        OR (K.SORT_KEY = @AFTER_SORT_KEY AND LI.INTERNAL_LOCATION_INV > @AFTER_ID)
+    )
+ORDER BY
+    K.SORT_KEY,
+    LI.INTERNAL_LOCATION_INV;
+"""
+
+def _encode_lp_cursor(sort_key, internal_id):
+    raw = json.dumps([sort_key, int(internal_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_lp_cursor(token):
+    """Returns (sort_key, internal_id); raises ValueError for a malformed token."""
+    try:
+        sort_key, internal_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return str(sort_key), int(internal_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
 
 @app.route("/lookup_lp_by_gtin", methods=["POST"])
 def lookup_lp_by_gtin():
     """
     Lookup location inventory by GTIN and department.
+
+    Optional body fields:
+        limit:  page size. The response becomes {"rows": [...], "next_cursor": ...}
+                and next_cursor (null on the last page) is sent back as
+                cursor to get the next page.
+        cursor: token from the previous page
+        stream: true to stream the whole result as a JSON array as rows come off
+                the cursor, instead of building it in memory first. Streams are
+                always plain JSON, whatever the Accept header asks for.
     """
     data = request.json
     gtin = data.get("gtin")
@@ -106,103 +994,365 @@ def lookup_lp_by_gtin():
     if not gtin or not loc:
         return jsonify({"error": "Missing GTIN or department"}), 400
 
+    if data.get("stream"):
+        try:
+            return _stream_lp_lookup(gtin, loc)
+        except Exception as e:
+            return _error_response("error", e)
+
+    if data.get("limit") is not None or data.get("cursor"):
+        return _lookup_lp_page(gtin, loc, data.get("limit"), data.get("cursor"))
+
+    hit, results = g.site.lp_cache.get((gtin, loc))
+    if hit:
+        return encode_response(results)
+
     try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
-        sql = """
-        DECLARE @GTIN NVARCHAR(50) = ?;
+        def query():
+            # Read first: an arrival committed while the SELECT runs makes its result suspect
+            generation = g.site.lp_cache.generation
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(LOOKUP_LP_SQL, (gtin, loc))
+                columns = [col[0] for col in cursor.description]
+                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                cursor.close()
+            g.site.lp_cache.set((gtin, loc), results, generation)
+            return results
+
+        # Concurrent misses for the same GTIN share one query
+        results = g.site.inflight.do(("lookup_lp_by_gtin", gtin, loc), query)
+        return encode_response(results)
+    except Exception as e:
+        return _error_response("error", e)
+
+def _lookup_lp_page(gtin, loc, limit, cursor_token):
+    """One keyset page of lookup_lp_by_gtin results."""
+    try:
+        limit = int(limit) if limit is not None else LP_PAGE_SIZE
+        if not 1 <= limit <= MAX_LP_PAGE_SIZE:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": f"limit must be between 1 and {MAX_LP_PAGE_SIZE}"}), 400
+
+    after_sort_key, after_id = None, None
+    if cursor_token:
+        try:
+            after_sort_key, after_id = _decode_lp_cursor(cursor_token)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    def query():
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            # Ask for one extra row to learn whether another page exists
+            cursor.execute(LOOKUP_LP_PAGE_SQL, (gtin, loc, after_sort_key, after_id, limit + 1))
+            columns = [col[0] for col in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_lp_cursor(rows[-1]["SORT_KEY"], rows[-1]["INTERNAL_LOCATION_INV"])
+        for row in rows:
+            del row["SORT_KEY"], row["INTERNAL_LOCATION_INV"]
+        return {"rows": rows, "next_cursor": next_cursor}
+
+    try:
+        if cursor_token:
+            return encode_response(query())
+
+        # First pages are what stations scan for, so they share the lookup
+        # cache and coalescing; only "load more" pages go straight to SQL
+        key = (gtin, loc, limit)
+        hit, page = g.site.lp_cache.get(key)
+        if not hit:
+            def first_page():
+                generation = g.site.lp_cache.generation
+                page = query()
+                g.site.lp_cache.set(key, page, generation)
+                return page
+
+            page = g.site.inflight.do(("lookup_lp_page", gtin, loc, limit), first_page)
+        return encode_response(page)
+    except Exception as e:
+        return _error_response("error", e)
+
+def _stream_lp_lookup(gtin, loc):
+    """
+    Stream lookup_lp_by_gtin results as a JSON array, LP_STREAM_BATCH rows at a time.
+
+    The query runs before this returns, so connection and SQL errors still
+    produce a normal error response. Only failures mid-stream truncate the body.
+    """
+    def generate():
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(LOOKUP_LP_SQL, (gtin, loc))
+            columns = [col[0] for col in cursor.description]
+            yield "["
+            separator = ""
+            while True:
+                rows = cursor.fetchmany(LP_STREAM_BATCH)
+                if not rows:
+                    break
+                yield separator + ",".join(app.json.dumps(dict(zip(columns, row))) for row in rows)
+                separator = ","
+            yield "]"
+            cursor.close()
+
+    rows = generate()
+    first = next(rows)   # Runs the query inside this request's error handling
+    return Response(stream_with_context(itertools.chain([first], rows)), mimetype="application/json")
+
+@app.route("/lookup_lp_by_gtins", methods=["POST"])
+def lookup_lp_by_gtins():
+    """
+    Lookup location inventory for several GTINs in one query.
+
+    Expects {"gtins": [...], "department": "..."} and returns
+    {"results": {gtin: [rows]}} with each GTIN's rows in the same
+    department-first order as /lookup_lp_by_gtin.
+    """
+    data = request.json
+    gtins = data.get("gtins")
+    loc = data.get("department")
+
+    if not gtins or not isinstance(gtins, list) or not loc:
+        return jsonify({"error": "Missing GTINs or department"}), 400
+
+    gtins = list(dict.fromkeys(str(g).strip() for g in gtins if g and str(g).strip()))
+    if not gtins:
+        return jsonify({"error": "Missing GTINs or department"}), 400
+    if len(gtins) > MAX_GTIN_BATCH:
+        return jsonify({"error": f"Too many GTINs (max {MAX_GTIN_BATCH})"}), 400
+
+    # Serve what we can from the lookup cache and only query the rest.
+    # Every requested GTIN gets an entry, even when nothing matched.
+    results = {}
+    missing = []
+    for gtin in gtins:
+        hit, rows = g.site.lp_cache.get((gtin, loc))
+        if hit:
+            results[gtin] = rows
+        else:
+            results[gtin] = []
+            missing.append(gtin)
+    if not missing:
+        return encode_response({"results": results})
+
+    try:
+        gtin_rows = ", ".join("(?)" for _ in missing)
+        sql = f"""
+        SET NOCOUNT ON;
         DECLARE @LOCATION NVARCHAR(50) = ?;
+        DECLARE @GTINS TABLE (GTIN NVARCHAR(50) PRIMARY KEY);
+
+        INSERT INTO @GTINS (GTIN) VALUES {gtin_rows};
 
         SELECT
+            G.GTIN,
             LI.LOCATION,
             LI.ITEM,
             ON_HAND_QTY = CONVERT(INT, LI.ON_HAND_QTY),
             TO_LOC = LI.USER_DEF1,
             LI.LOGISTICS_UNIT,
             UM_MATCH = CASE WHEN ICR.QUANTITY_UM = RIGHT(LEFT(LI.USER_DEF1, 7), 2) THEN 1 ELSE 0 END
-        FROM LOCATION_INVENTORY LI
-        INNER JOIN ITEM_CROSS_REFERENCE ICR ON ICR.ITEM = LI.ITEM
+        FROM @GTINS G
+        INNER JOIN ITEM_CROSS_REFERENCE ICR ON ICR.X_REF_ITEM = G.GTIN
+        INNER JOIN LOCATION_INVENTORY LI ON LI.ITEM = ICR.ITEM
         WHERE
-            ICR.X_REF_ITEM = @GTIN
-            AND LI.TEMPLATE_FIELD1 = N'DECANT'
+            LI.TEMPLATE_FIELD1 = N'DECANT'
             AND LI.ON_HAND_QTY > 0
         ORDER BY
+            G.GTIN,
             CASE
                 WHEN LI.LOCATION = @LOCATION THEN N'A'
                 WHEN LI.TEMPLATE_FIELD2 = N'WS' THEN N'AB'
                 ELSE LI.LOCATION
             END;
         """
+
+        generation = g.site.lp_cache.generation
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, [loc] + missing)
+            columns = [col[0] for col in cursor.description]
+            for row in cursor.fetchall():
+                record = dict(zip(columns, row))
+                results.setdefault(record.pop("GTIN"), []).append(record)
+            cursor.close()
+        for gtin in missing:
+            g.site.lp_cache.set((gtin, loc), results[gtin], generation)
+        return encode_response({"results": results})
+    except Exception as e:
+        return _error_response("error", e)
+
+def _fetch_user_settings_etag(cursor):
+    """
+    Cheap fingerprint of every user's settings: row count plus CHECKSUM_AGG
+    over the settings columns, so no rows have to leave SQL Server.
+    """
+    cursor.execute("""
+    SELECT
+        USER_COUNT = COUNT(*),
+        SETTINGS_CHECKSUM = CHECKSUM_AGG(CHECKSUM(USER_NAME, USER_DEF3, USER_DEF4))
+    FROM USER_PROFILE
+    WHERE USER_DEF3 IS NOT NULL
+      AND USER_DEF4 IS NOT NULL
+    """)
+    user_count, checksum = cursor.fetchone()
+    return f"settings-{user_count}-{checksum or 0}"
+
+def _fetch_all_user_settings(cursor):
+    """
+    Read every user with settings defined, keyed by username.
+
+    USER_DEF3 = theme ('light' or 'dark')
+    USER_DEF4 = zoom level ('150', '200', '250', '300')
+    """
+    cursor.execute("""
+    SELECT
+        USER_NAME AS username,
+        USER_DEF3 AS theme,
+        USER_DEF4 AS zoom
+    FROM USER_PROFILE
+    WHERE USER_DEF3 IS NOT NULL
+      AND USER_DEF4 IS NOT NULL
+    """)
+    columns = [col[0] for col in cursor.description]
+    results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # Build a dictionary keyed by username
+    user_settings = {}
+    for row in results:
+        username = row.get("username")
+        if username:
+            user_settings[username] = {
+                "theme": row.get("theme") or "dark",
+                "zoom": row.get("zoom") or "200"
+            }
+    return user_settings
+
+def _current_user_settings():
+    """
+    (etag, users) for every user with settings defined, or (etag, None) when
+    the request's If-None-Match already matches.
+
+    Served from settings_store once it has loaded. Until then (e.g. SQL
+    Server was down at startup) the rows and ETag come from the database.
+    """
+    if settings_store.loaded:
+        etag, user_settings = settings_store.snapshot()
+        if request.if_none_match.contains(etag):
+            return etag, None
+        return etag, user_settings
+
+    # Commit queued updates first so the ETag and rows include them
+    settings_writes.flush()
+    with db_connection(home) as conn:
         cursor = conn.cursor()
-        cursor.execute(sql, (gtin, loc))
-        columns = [col[0] for col in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        etag = _fetch_user_settings_etag(cursor)
+        if request.if_none_match.contains(etag):
+            cursor.close()
+            return etag, None
+        user_settings = _fetch_all_user_settings(cursor)
         cursor.close()
-        conn.close()
-        return jsonify(results)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return etag, user_settings
 
 @app.route("/get_all_user_settings", methods=["GET"])
 def get_all_user_settings():
     """
     Get ALL user settings from USER_PROFILE table where settings are defined.
     Used during app startup to pre-cache settings.
-    
-    USER_DEF3 = theme ('light' or 'dark')
-    USER_DEF4 = zoom level ('150', '200', '250', '300')
+
+    The response carries an ETag fingerprinting the settings. Clients that
+    send it back in If-None-Match get an empty 304 when nothing changed,
+    skipping serialization.
     """
     try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
-        sql = """
-        SELECT 
-            USER_NAME AS username,
-            USER_DEF3 AS theme,
-            USER_DEF4 AS zoom
-        FROM USER_PROFILE 
-        WHERE USER_DEF3 IS NOT NULL 
-          AND USER_DEF4 IS NOT NULL
-        """
-        
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        columns = [col[0] for col in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
-        
-        # Build a dictionary keyed by username
-        user_settings = {}
-        for row in results:
-            username = row.get("username")
-            if username:
-                user_settings[username] = {
-                    "theme": row.get("theme") or "dark",
-                    "zoom": row.get("zoom") or "200"
-                }
-        
-        return jsonify({
+        etag, user_settings = _current_user_settings()
+        if user_settings is None:
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        response = encode_response({
             "count": len(user_settings),
             "users": user_settings
         })
-            
+        response.set_etag(etag)
+        return response
+
+    except Exception as e:
+        return _error_response("error", e)
+
+@app.route("/get_user_settings_delta", methods=["GET"])
+def get_user_settings_delta():
+    """
+    Get only the user settings changed since the client's last sync.
+
+    Query args: epoch and since, both taken from the previous response.
+    Returns {"epoch", "version", "full", "count", "users", "removed"}. When
+    full is false, users holds only the changed entries and should be merged
+    into the client's copy, and removed lists users to drop from it. When the epoch is unknown (first sync or service
+    restart), users is the full set and replaces the client's copy. The
+    exception is an If-None-Match that still matches the current data: then
+    nothing is sent and the client just adopts the new epoch/version.
+    """
+    epoch = request.args.get("epoch")
+    since = request.args.get("since", type=int)
+
+    if epoch and since is not None:
+        delta = settings_changes.changes_since(epoch, since)
+        if delta is not None:
+            version, changed = delta
+            users = {username: settings for username, settings in changed.items() if settings is not None}
+            return encode_response({
+                "epoch": settings_changes.epoch,
+                "version": version,
+                "full": False,
+                "count": len(users),
+                "users": users,
+                "removed": sorted(username for username, settings in changed.items() if settings is None)
+            })
+
+    try:
+        # Read the version first so changes racing the snapshot are re-sent next sync
+        version = settings_changes.version
+        etag, user_settings = _current_user_settings()
+        if user_settings is None:
+            response = encode_response({
+                "epoch": settings_changes.epoch,
+                "version": version,
+                "full": False,
+                "count": 0,
+                "users": {},
+                "removed": []
+            })
+            response.set_etag(etag)
+            return response
+
+        response = encode_response({
+            "epoch": settings_changes.epoch,
+            "version": version,
+            "full": True,
+            "count": len(user_settings),
+            "users": user_settings,
+            "removed": []
+        })
+        response.set_etag(etag)
+        return response
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response("error", e)
 
 @app.route("/get_user_settings", methods=["POST"])
 def get_user_settings():
     """
     Get user-specific settings from USER_PROFILE table.
-    
+
     USER_DEF3 = theme ('light' or 'dark')
     USER_DEF4 = zoom level ('150', '200', '250', '300')
     """
@@ -212,28 +1362,32 @@ def get_user_settings():
     if not username:
         return jsonify({"error": "Missing username"}), 400
 
+    # Users with settings defined are answered from memory
+    user_settings = settings_store.get(username)
+    if user_settings is not None:
+        return encode_response(user_settings)
+
+    # An update still waiting in the write-behind queue is the current value
+    queued, user_settings = settings_writes.pending(username)
+    if queued:
+        return encode_response(user_settings)
+
     try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
         sql = """
-        SELECT 
+        SELECT
             USER_DEF3 AS theme,
             USER_DEF4 AS zoom
-        FROM USER_PROFILE 
+        FROM USER_PROFILE
         WHERE USER_NAME = ?
         """
-        
-        cursor = conn.cursor()
-        cursor.execute(sql, (username,))
-        columns = [col[0] for col in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
-        
+
+        with db_connection(home) as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, (username,))
+            columns = [col[0] for col in cursor.description]
+            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.close()
+
         if results and len(results) > 0:
             user_settings = results[0]
             # Provide defaults if NULL
@@ -243,17 +1397,43 @@ def get_user_settings():
             })
         else:
             return jsonify({"error": "User not found"}), 404
-            
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response("error", e)
+
+UPDATE_USER_SETTINGS_SQL = """
+UPDATE USER_PROFILE
+SET USER_DEF3 = ?, USER_DEF4 = ?
+WHERE USER_NAME = ?
+"""
+
+def _user_exists(username) -> bool:
+    """True if username has a USER_PROFILE row; users with settings are known from memory."""
+    if settings_store.get(username) is not None or settings_writes.pending(username)[0]:
+        return True
+    with db_connection(home) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM USER_PROFILE WHERE USER_NAME = ?", (username,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row is not None
 
 @app.route("/update_user_settings", methods=["POST"])
+@_idempotent
 def update_user_settings():
     """
     Update user-specific settings in USER_PROFILE table.
-    
+
     USER_DEF3 = theme ('light' or 'dark')
     USER_DEF4 = zoom level ('150', '200', '250', '300')
+
+    The update is queued and committed by the write-behind flusher within
+    SETTINGS_FLUSH_INTERVAL, merged with any other pending change for the
+    same user. The in-memory store is updated first, so reads see the new
+    values at once. In cluster mode the write is queued on the user's
+    owner worker (see _settings_owner). Responds 202 once queued, or 404 for
+    a user that isn't in USER_PROFILE (checked before queueing, since the
+    batched UPDATE can't report it per user).
     """
     data = request.json
     username = data.get("username")
@@ -264,52 +1444,212 @@ def update_user_settings():
         return jsonify({"error": "Missing username"}), 400
 
     try:
-        conn = pyodbc.connect(f"""
-            DRIVER={DRIVER};
-            SERVER={SERVER};
-            DATABASE={DATABASE};
-            Trusted_Connection=yes;
-        """)
-        sql = """
-        UPDATE USER_PROFILE 
-        SET USER_DEF3 = ?, USER_DEF4 = ?
-        WHERE USER_NAME = ?
-        """
-        
-        cursor = conn.cursor()
-        cursor.execute(sql, (theme, zoom, username))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        if rows_affected > 0:
-            return jsonify({"message": "Settings updated successfully", "rows_affected": rows_affected})
-        else:
-            return jsonify({"error": "User not found or no changes made"}), 404
-            
+        if not _user_exists(username):
+            return jsonify({"error": "User not found"}), 404
+
+        user_settings = {"theme": theme or "dark", "zoom": zoom or "200"}
+        settings_store.put(username, user_settings)
+        version, event_id = _settings_changed(username, user_settings)
+        owner = _settings_owner(username)
+        if owner == worker_id:
+            _queue_settings_write(username, user_settings, version)
+        _broadcast("settings", {"username": username, "settings": user_settings,
+                                "version": version, "event_id": event_id, "owner": owner})
+        return jsonify({"message": "Settings update queued", "queued": True}), 202
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response("error", e)
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="BrowserControl backend API")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS,
+                        help="worker threads handling requests concurrently")
+    parser.add_argument("--connection-limit", type=int, default=SERVE_CONNECTION_LIMIT,
+                        help="max open client connections (bounds queued requests)")
+    parser.add_argument("--backlog", type=int, default=SERVE_BACKLOG,
+                        help="listen backlog for connections waiting to be accepted")
+    parser.add_argument("--keepalive-timeout", type=int, default=SERVE_KEEPALIVE_TIMEOUT,
+                        help="seconds an idle keep-alive connection stays open")
+    parser.add_argument("--drain-timeout", type=float, default=SERVE_DRAIN_TIMEOUT,
+                        help="seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--max-in-flight", type=int, default=ADMISSION_MAX_IN_FLIGHT,
+                        help="requests admitted at once across all clients")
+    parser.add_argument("--per-client-limit", type=int, default=ADMISSION_PER_CLIENT,
+                        help="requests one client IP may have in flight")
+    parser.add_argument("--admission-queue", type=int, default=ADMISSION_QUEUE,
+                        help="requests allowed to wait for a slot before 429s")
+    parser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS,
+                        help="log statements slower than this many milliseconds")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS,
+                        help="processes sharing the port; more than 1 starts a supervisor")
+    parser.add_argument("--dev", action="store_true",
+                        help="use Flask's development server instead of waitress")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
 
-if __name__ == "__main__":
     print("[API] Starting Flask API...")
     print("[API] Endpoints:")
     print("  - GET  /health")
+    print("  - GET  /metrics")
+    print("  - GET  /stats")
+    print("  - GET  /slow_queries")
+    print("  - GET  /events")
+    print("  - POST /invalidate_lp_cache")
     print("  - POST /update_pallet_arrived_by_tote")
+    print("  - POST /update_pallets_arrived_by_tote")
     print("  - POST /select_pallet_arrived_by_tote")
     print("  - POST /lookup_lp_by_gtin")
+    print("  - POST /lookup_lp_by_gtins")
     print("  - GET  /get_all_user_settings")
+    print("  - GET  /get_user_settings_delta")
     print("  - POST /get_user_settings")
     print("  - POST /update_user_settings")
     print("")
-    
-    # Start Flask in a thread so the tray doesn't block it
-    flask_thread = threading.Thread(target=lambda: app.run(host="0.0.0.0", port=5000), daemon=True)
-    flask_thread.start()
 
-    # Keep the main thread alive so the service doesn't exit
+    if args.workers > 1 and not args.dev:
+        _run_cluster(args, sys.argv[1:] if argv is None else argv)
+        return
+    _serve(args)
+
+
+def _serve(args, sock=None):
+    """Run this process's API server until stopped (or until the supervisor says so)."""
+    # Limits apply to each site separately
+    for site in sites:
+        site.admission.max_in_flight = args.max_in_flight
+        site.admission.per_client_limit = args.per_client_limit
+        site.admission.max_queue = args.admission_queue
+    query_log.threshold_ms = args.slow_query_ms
+
+    # Open connections up front so the first scans don't pay the SSPI handshake
+    for site in sites:
+        opened = site.pool.prewarm()
+        print(f"[API] Site {site.key} ({site.server}/{site.database}): connection pool pre-warmed with "
+              f"{opened}/{site.pool.min_size} connections (max {site.pool.max_size})")
+        site.pool.start_reaper()
+    settings_writes.start()
+    settings_store.start_refresher(SETTINGS_REFRESH_INTERVAL)
+
+    if args.dev:
+        print(f"[API] Development server on {args.host}:{args.port} (not for production)")
+        try:
+            app.run(host=args.host, port=args.port, threaded=True)
+        finally:
+            event_broker.close()
+            settings_writes.close()
+        return
+
+    server = APIServer(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        backlog=args.backlog,
+        channel_timeout=args.keepalive_timeout,
+        sock=sock,
+    )
+    print(f"[API] Serving {server.describe()}")
+    print(f"[API] Admitting {args.max_in_flight} requests at once per site ({args.per_client_limit} per client), "
+          f"{args.admission_queue} may wait up to {ADMISSION_QUEUE_TIMEOUT}s")
+    if args.max_in_flight >= args.threads:
+        print(f"[API] Note: --max-in-flight {args.max_in_flight} >= {args.threads} threads, "
+              f"so the global limit never queues; only per-client limits apply")
+    if args.max_in_flight > pool.max_size:
+        print(f"[API] Note: {args.max_in_flight} admitted requests share {pool.max_size} DB connections; "
+              f"extra requests wait up to {POOL_ACQUIRE_TIMEOUT}s for one")
+    admitted = args.max_in_flight * len(sites)
+    if admitted + EVENTS_MAX_SUBSCRIBERS >= args.threads:
+        print(f"[API] Note: {EVENTS_MAX_SUBSCRIBERS} event streams + {admitted} admitted requests "
+              f"can occupy all {args.threads} threads; raise --threads")
+    server.start()
+
+    # Serve until Ctrl+C, a termination signal or the supervisor's stop, then drain
+    stop = cluster_link.stopped if cluster_link is not None else threading.Event()
+    for sig_name in ("SIGTERM", "SIGBREAK"):
+        sig = getattr(signal, sig_name, None)
+        if sig is not None:
+            signal.signal(sig, lambda *_: stop.set())
     try:
-        while True:
-            threading.Event().wait()
+        while not stop.wait(1):
+            pass
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
+
+    # Event streams never finish on their own; end them so the drain can complete
+    event_broker.close()
+    print(f"[API] Shutting down, draining {server.in_flight()} in-flight request(s)...")
+    drained = server.shutdown(timeout=args.drain_timeout)
+    # Commit queued settings updates while the pool is still open
+    settings_store.stop()
+    settings_writes.close()
+    for site in sites:
+        site.pool.close()
+    print("[API] Stopped" if drained else "[API] Stopped (drain timed out)")
+
+
+def _run_cluster(args, argv):
+    """Supervise args.workers processes serving on one shared socket."""
+    supervisor = Supervisor(
+        _worker_main,
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        args=(argv,),
+        stop_timeout=args.drain_timeout + 5,
+        # One epoch and numbering for delta sync and /events across workers
+        sequences=("settings", "events"),
+    )
+    supervisor.bind()
+    print(f"[API] Supervisor (pid {os.getpid()}) listening on {args.host}:{supervisor.port}, "
+          f"starting {args.workers} workers")
+    print(f"[API] DB connections (max {POOL_MAX_SIZE} per site) and --max-in-flight {args.max_in_flight} "
+          f"are split between workers; per-client limits apply per worker")
+    supervisor.run()
+    print("[API] Supervisor stopped")
+
+
+def _worker_main(sock, wid, conn, sequences, argv):
+    """Entry point of a cluster worker process (see cluster.py)."""
+    global cluster_link, worker_id, worker_count
+    args = _parse_args(argv)
+    worker_id = wid
+    worker_count = args.workers
+    settings_changes.use_sequence(sequences["settings"])
+    event_broker.use_sequence(sequences["events"])
+
+    # Each worker gets its share of the DB connections and admission slots
+    def share(total):
+        return max(1, math.ceil(total / args.workers))
+    for site in sites:
+        site.pool.max_size = max(2, share(POOL_MAX_SIZE))
+        site.pool.min_size = min(share(POOL_MIN_SIZE), site.pool.max_size)
+    args.max_in_flight = share(args.max_in_flight)
+
+    # Spill files are per worker so restarts restore their own queue
+    base, ext = os.path.splitext(settings_writes.spill_path)
+    settings_writes.spill_path = f"{base}.{wid}{ext}"
+
+    cluster_link = WorkerLink(wid, conn, report=_worker_report)
+    cluster_link.on("arrival", lambda p: _pallets_arrived(sites.get(p["site"]), p["containers"],
+                                                          p.get("inventory"), p.get("event_id")))
+    cluster_link.on("invalidate_lp_cache", lambda p: _invalidate_lp_cache(sites.get(p["site"]), set(p["gtins"]), p["lp"]))
+    cluster_link.on("settings", _apply_remote_settings)
+    cluster_link.on("settings_settled", _remote_settings_settled)
+    cluster_link.on("idempotent_response", lambda p: idempotency.remember(p["key"], p["response"]))
+    cluster_link.start()
+
+    print(f"[API] Worker {wid} (pid {os.getpid()}) starting")
+    _serve(args, sock=sock)
+
+
+if __name__ == "__main__":
+    # Needed for worker processes in the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,571 @@
+# bench.py
+# Offline load benchmark for the backend API against a SQLite stand-in for ILS
+#
+# Seeds a SQLite database with synthetic SHIPPING_CONTAINER, LOCATION_INVENTORY,
+# ITEM_CROSS_REFERENCE and USER_PROFILE rows, points app.pool at it, serves the
+# real Flask app with the real waitress server on a local port, and drives
+# every endpoint with concurrent HTTP clients. Prints throughput and
+# p50/p95/p99 latency per route.
+#
+#     cd backend
+#     python bench.py --scale 1 --clients 16 --duration 30
+#     python bench.py --accept msgpack --json after.json
+#
+# The T-SQL the routes send (DECLARE, table variables, OUTPUT, CHECKSUM_AGG,
+# the usp_BrowserControlArrive procedure) is translated to SQLite by
+# _SQLiteCursor. Statements that are already portable pass through unchanged.
+# SQLite is not SQL Server. Compare runs of this harness with each other, not
+# with production numbers.
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+import requests
+
+import app
+from db_pool import ConnectionPool
+from encoding import COLUMNAR_MIMETYPE, JSON_MIMETYPE, MSGPACK_MIMETYPE
+from server import APIServer
+
+# Rows generated per unit of --scale
+ITEMS_PER_SCALE = 2000
+INVENTORY_PER_SCALE = 20000
+PALLETS_PER_SCALE = 1500
+USERS_PER_SCALE = 50
+
+DEPARTMENTS = ("DECANT.1", "DECANT.2", "DECANT.3", "DECANT.4")
+HOT_GTIN_SHARE = 0.05       # Fraction of GTINs that get most of the scans
+HOT_GTIN_WEIGHT = 0.8       # Share of lookups that hit the hot GTINs
+
+ACCEPT = {
+    "json": JSON_MIMETYPE,
+    "columnar": COLUMNAR_MIMETYPE,
+    "msgpack": MSGPACK_MIMETYPE,
+}
+
+
+# ----------------------------------------------------------------------
+# Synthetic ILS data
+# ----------------------------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE SHIPPING_CONTAINER (
+    CONTAINER_ID TEXT PRIMARY KEY,
+    PARENT_CONTAINER_ID TEXT,
+    USER_DEF1 TEXT,
+    USER_DEF2 TEXT
+);
+CREATE INDEX IX_SC_PARENT ON SHIPPING_CONTAINER (PARENT_CONTAINER_ID);
+
+CREATE TABLE ITEM_CROSS_REFERENCE (
+    ITEM TEXT,
+    X_REF_ITEM TEXT,
+    QUANTITY_UM TEXT
+);
+CREATE INDEX IX_ICR_XREF ON ITEM_CROSS_REFERENCE (X_REF_ITEM);
+
+CREATE TABLE LOCATION_INVENTORY (
+    INTERNAL_LOCATION_INV INTEGER PRIMARY KEY,
+    LOCATION TEXT,
+    ITEM TEXT,
+    ON_HAND_QTY NUMERIC,
+    USER_DEF1 TEXT,
+    LOGISTICS_UNIT TEXT,
+    TEMPLATE_FIELD1 TEXT,
+    TEMPLATE_FIELD2 TEXT
+);
+CREATE INDEX IX_LI_ITEM ON LOCATION_INVENTORY (ITEM);
+
+CREATE TABLE USER_PROFILE (
+    USER_NAME TEXT PRIMARY KEY,
+    USER_DEF3 TEXT,
+    USER_DEF4 TEXT
+);
+"""
+
+
+class Dataset:
+    """Keys of the seeded data that the workload picks from."""
+
+    def __init__(self, gtins, totes, pallets, lps, users):
+        self.gtins = gtins
+        self.hot_gtins = gtins[:max(1, int(len(gtins) * HOT_GTIN_SHARE))]
+        self.totes = totes
+        self.pallets = pallets
+        self.lps = lps
+        self.users = users
+
+
+def seed_database(path: str, scale: float = 1.0, seed: int = 42) -> Dataset:
+    """Create and fill a fresh SQLite stand-in at path."""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+
+    n_items = max(10, int(ITEMS_PER_SCALE * scale))
+    items = [f"ITEM{i:06d}" for i in range(n_items)]
+    gtins = []
+    xrefs = []
+    for i, item in enumerate(items):
+        # Each item has a case GTIN-14 and sometimes an each-level UPC-12
+        for gtin, um in ((f"1{i:013d}", "CS"), (f"{i:012d}", "EA")):
+            if um == "EA" and rng.random() < 0.5:
+                continue
+            gtins.append(gtin)
+            xrefs.append((item, gtin, um))
+    rng.shuffle(gtins)
+    conn.executemany("INSERT INTO ITEM_CROSS_REFERENCE VALUES (?, ?, ?)", xrefs)
+
+    n_inventory = max(20, int(INVENTORY_PER_SCALE * scale))
+    inventory = []
+    lps = []
+    for i in range(n_inventory):
+        department = rng.choice(DEPARTMENTS)
+        um = rng.choice(("CS", "EA"))
+        lp = f"LP{i:08d}"
+        lps.append(lp)
+        inventory.append((
+            i + 1,
+            f"{department}-{rng.randint(1, 40):02d}-{rng.randint(1, 9)}",
+            rng.choice(items),
+            rng.randint(0, 48),
+            f"SLOT-{um}-{rng.randint(100, 999)}",
+            lp,
+            "DECANT" if rng.random() < 0.9 else "RESERVE",
+            "WS" if rng.random() < 0.1 else None,
+        ))
+    conn.executemany("INSERT INTO LOCATION_INVENTORY VALUES (?, ?, ?, ?, ?, ?, ?, ?)", inventory)
+
+    n_pallets = max(5, int(PALLETS_PER_SCALE * scale))
+    pallets = [f"PLT{i:07d}" for i in range(n_pallets)]
+    totes = []
+    containers = []
+    for pallet in pallets:
+        for t in range(rng.randint(2, 12)):
+            tote = f"{pallet}T{t:02d}"
+            totes.append((tote, pallet))
+            containers.append((tote, pallet, "In Transit", None))
+    conn.executemany("INSERT INTO SHIPPING_CONTAINER VALUES (?, ?, ?, ?)", containers)
+
+    n_users = max(2, int(USERS_PER_SCALE * scale))
+    users = [f"user{i:04d}" for i in range(n_users)]
+    conn.executemany(
+        "INSERT INTO USER_PROFILE VALUES (?, ?, ?)",
+        [(u, rng.choice(("light", "dark")), rng.choice(("150", "200", "250", "300"))) for u in users],
+    )
+
+    conn.commit()
+    conn.close()
+    return Dataset(gtins, [t for t, _ in totes], pallets, lps, users)
+
+
+# ----------------------------------------------------------------------
+# T-SQL -> SQLite translation
+# ----------------------------------------------------------------------
+
+_SORT_KEY_SQL = """
+    CASE
+        WHEN LI.LOCATION = :location THEN 'A'
+        WHEN LI.TEMPLATE_FIELD2 = 'WS' THEN 'AB'
+        ELSE LI.LOCATION
+    END
+"""
+
+_LP_COLUMNS_SQL = """
+    LI.LOCATION,
+    LI.ITEM,
+    CAST(LI.ON_HAND_QTY AS INTEGER) AS ON_HAND_QTY,
+    LI.USER_DEF1 AS TO_LOC,
+    LI.LOGISTICS_UNIT,
+    CASE WHEN ICR.QUANTITY_UM = substr(LI.USER_DEF1, 6, 2) THEN 1 ELSE 0 END AS UM_MATCH
+"""
+
+_LP_FILTER_SQL = """
+    LI.TEMPLATE_FIELD1 = 'DECANT'
+    AND LI.ON_HAND_QTY > 0
+"""
+
+
+class _SQLiteCursor:
+    """DB-API cursor that runs the backend's T-SQL statements on SQLite."""
+
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+        self._rows = None
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        params = list(params)
+        self._rows = None
+        if "usp_BrowserControlArrive" in sql:
+            self._arrive(params[0])
+        elif "OUTPUT INSERTED.PARENT_CONTAINER_ID" in sql:
+            self._arrive_batch(params)
+        elif "UPDATE SHIPPING_CONTAINER" in sql:
+            self._run(
+                "UPDATE SHIPPING_CONTAINER SET USER_DEF2 = USER_DEF1, USER_DEF1 = 'Arrived' "
+                "WHERE PARENT_CONTAINER_ID = ? AND USER_DEF1 <> 'Arrived'",
+                params,
+            )
+        elif "@GTINS" in sql:
+            self._lookup_gtins(params[0], params[1:])
+        elif "@AFTER_SORT_KEY" in sql:
+            self._lookup_page(*params)
+        elif "FROM LOCATION_INVENTORY LI" in sql:
+            self._lookup(*params)
+        elif "CHECKSUM_AGG" in sql:
+            self._settings_checksum()
+        else:
+            self._run(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # Only the portable UPDATE USER_PROFILE is batched this way
+        self._rows = None
+        self._cur.executemany(sql, seq_of_params)
+        self.description = None
+        self.rowcount = self._cur.rowcount
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self._cur.fetchone()
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            rows, self._rows = self._rows[:size], self._rows[size:]
+            return rows
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self._cur.fetchall()
+
+    def close(self):
+        self._cur.close()
+
+    # Statement emulations --------------------------------------------
+
+    def _run(self, sql, params=()):
+        self._cur.execute(sql, params)
+        self.description = self._cur.description
+        self.rowcount = self._cur.rowcount
+
+    def _result(self, columns, rows):
+        self.description = [(c, None, None, None, None, None, None) for c in columns]
+        self._rows = list(rows)
+        self.rowcount = len(self._rows)
+
+    def _arrive(self, tote):
+        self._cur.execute("SELECT PARENT_CONTAINER_ID FROM SHIPPING_CONTAINER WHERE CONTAINER_ID = ?", (tote,))
+        row = self._cur.fetchone()
+        if row is None:
+            self._result(["MSG", "PARENT_CONTAINER_ID", "TOTES_IN_TRANSIT"], [(f"Tote {tote} not found", None, 0)])
+            return
+        self._cur.execute(
+            "SELECT COUNT(*) FROM SHIPPING_CONTAINER WHERE PARENT_CONTAINER_ID = ? AND USER_DEF1 <> 'Arrived'",
+            (row[0],),
+        )
+        self._result(["MSG", "PARENT_CONTAINER_ID", "TOTES_IN_TRANSIT"], [("", row[0], self._cur.fetchone()[0])])
+
+    def _arrive_batch(self, container_ids):
+        placeholders = ", ".join("?" for _ in container_ids)
+        self._cur.execute(
+            "UPDATE SHIPPING_CONTAINER SET USER_DEF2 = USER_DEF1, USER_DEF1 = 'Arrived' "
+            f"WHERE PARENT_CONTAINER_ID IN ({placeholders}) AND USER_DEF1 <> 'Arrived' "
+            "RETURNING PARENT_CONTAINER_ID",
+            container_ids,
+        )
+        counts = {}
+        for (cid,) in self._cur.fetchall():
+            counts[cid] = counts.get(cid, 0) + 1
+        self._result(["PARENT_CONTAINER_ID", "ROWS_AFFECTED"], counts.items())
+
+    def _lookup(self, gtin, location):
+        self._run(
+            f"SELECT {_LP_COLUMNS_SQL} "
+            "FROM LOCATION_INVENTORY LI JOIN ITEM_CROSS_REFERENCE ICR ON ICR.ITEM = LI.ITEM "
+            f"WHERE ICR.X_REF_ITEM = :gtin AND {_LP_FILTER_SQL} "
+            f"ORDER BY {_SORT_KEY_SQL}",
+            {"gtin": gtin, "location": location},
+        )
+
+    def _lookup_page(self, gtin, location, after_sort_key, after_id, limit):
+        self._run(
+            f"SELECT * FROM (SELECT {_LP_COLUMNS_SQL}, {_SORT_KEY_SQL} AS SORT_KEY, LI.INTERNAL_LOCATION_INV "
+            "FROM LOCATION_INVENTORY LI JOIN ITEM_CROSS_REFERENCE ICR ON ICR.ITEM = LI.ITEM "
+            f"WHERE ICR.X_REF_ITEM = :gtin AND {_LP_FILTER_SQL}) "
+            "WHERE :after_sort IS NULL OR SORT_KEY > :after_sort "
+            "OR (SORT_KEY = :after_sort AND INTERNAL_LOCATION_INV > :after_id) "
+            "ORDER BY SORT_KEY, INTERNAL_LOCATION_INV LIMIT :limit",
+            {"gtin": gtin, "location": location, "after_sort": after_sort_key,
+             "after_id": after_id, "limit": limit},
+        )
+
+    def _lookup_gtins(self, location, gtins):
+        values = ", ".join("(?)" for _ in gtins)
+        sort_key = _SORT_KEY_SQL.replace(":location", "?")
+        self._run(
+            f"WITH G(GTIN) AS (VALUES {values}) "
+            f"SELECT G.GTIN, {_LP_COLUMNS_SQL} "
+            "FROM G JOIN ITEM_CROSS_REFERENCE ICR ON ICR.X_REF_ITEM = G.GTIN "
+            "JOIN LOCATION_INVENTORY LI ON LI.ITEM = ICR.ITEM "
+            f"WHERE {_LP_FILTER_SQL} "
+            f"ORDER BY G.GTIN, {sort_key}",
+            list(gtins) + [location],
+        )
+
+    def _settings_checksum(self):
+        # No CHECKSUM_AGG in SQLite; XOR of per-row CRCs behaves the same way
+        self._cur.execute(
+            "SELECT USER_NAME, USER_DEF3, USER_DEF4 FROM USER_PROFILE "
+            "WHERE USER_DEF3 IS NOT NULL AND USER_DEF4 IS NOT NULL"
+        )
+        count, checksum = 0, 0
+        for row in self._cur.fetchall():
+            count += 1
+            checksum ^= zlib.crc32("\x1f".join(row).encode("utf-8"))
+        self._result(["USER_COUNT", "SETTINGS_CHECKSUM"], [(count, checksum)])
+
+
+class _SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def cursor(self):
+        return _SQLiteCursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+# ----------------------------------------------------------------------
+# Workload
+# ----------------------------------------------------------------------
+
+def _hot_gtin(rng, data):
+    pool = data.hot_gtins if rng.random() < HOT_GTIN_WEIGHT else data.gtins
+    return rng.choice(pool)
+
+
+def _lookup_page(rng, data):
+    return "POST", "/lookup_lp_by_gtin", {
+        "gtin": _hot_gtin(rng, data), "department": rng.choice(DEPARTMENTS), "limit": 25,
+    }
+
+
+# name -> (weight, request builder returning (method, path, json body or None))
+WORKLOAD = {
+    "lookup_lp_by_gtin": (35, lambda rng, data: ("POST", "/lookup_lp_by_gtin", {
+        "gtin": _hot_gtin(rng, data), "department": rng.choice(DEPARTMENTS)})),
+    "lookup_lp_by_gtin[page]": (5, _lookup_page),
+    "lookup_lp_by_gtin[stream]": (2, lambda rng, data: ("POST", "/lookup_lp_by_gtin", {
+        "gtin": _hot_gtin(rng, data), "department": rng.choice(DEPARTMENTS), "stream": True})),
+    "lookup_lp_by_gtins": (5, lambda rng, data: ("POST", "/lookup_lp_by_gtins", {
+        "gtins": [_hot_gtin(rng, data) for _ in range(10)], "department": rng.choice(DEPARTMENTS)})),
+    "select_pallet_arrived_by_tote": (20, lambda rng, data: ("POST", "/select_pallet_arrived_by_tote", {
+        "tote": rng.choice(data.totes)})),
+    "update_pallet_arrived_by_tote": (4, lambda rng, data: ("POST", "/update_pallet_arrived_by_tote", {
+        "PARENT_CONTAINER_ID": rng.choice(data.pallets)})),
+    "update_pallets_arrived_by_tote": (2, lambda rng, data: ("POST", "/update_pallets_arrived_by_tote", {
+        "PARENT_CONTAINER_IDS": rng.sample(data.pallets, min(10, len(data.pallets)))})),
+    "invalidate_lp_cache": (1, lambda rng, data: ("POST", "/invalidate_lp_cache", {
+        "lp": rng.choice(data.lps)})),
+    "get_user_settings": (10, lambda rng, data: ("POST", "/get_user_settings", {
+        "username": rng.choice(data.users)})),
+    "update_user_settings": (4, lambda rng, data: ("POST", "/update_user_settings", {
+        "username": rng.choice(data.users), "theme": rng.choice(("light", "dark")),
+        "zoom": rng.choice(("150", "200", "250", "300"))})),
+    "get_all_user_settings": (2, lambda rng, data: ("GET", "/get_all_user_settings", None)),
+    "get_user_settings_delta": (2, lambda rng, data: ("GET", "/get_user_settings_delta", None)),
+    "health": (2, lambda rng, data: ("GET", "/health", None)),
+    "stats": (1, lambda rng, data: ("GET", "/stats", None)),
+    "metrics": (1, lambda rng, data: ("GET", "/metrics", None)),
+}
+
+
+class Results:
+    """Latency samples and error counts per workload entry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = {}
+
+    def record(self, name, seconds, ok, size):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.bytes[name] = self.bytes.get(name, 0) + size
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        report = {}
+        with self._lock:
+            for name, samples in sorted(self.latencies.items()):
+                samples = sorted(samples)
+                report[name] = {
+                    "requests": len(samples),
+                    "errors": self.errors.get(name, 0),
+                    "throughput": round(len(samples) / elapsed, 1),
+                    "p50_ms": round(_percentile(samples, 50) * 1000, 2),
+                    "p95_ms": round(_percentile(samples, 95) * 1000, 2),
+                    "p99_ms": round(_percentile(samples, 99) * 1000, 2),
+                    "avg_bytes": self.bytes.get(name, 0) // len(samples),
+                }
+        return report
+
+
+def _percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_samples))))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+def run_clients(base_url, data, clients, duration, accept, routes, seed=0):
+    """Drive the server with concurrent keep-alive clients for duration seconds."""
+    names = list(routes)
+    weights = [WORKLOAD[name][0] for name in names]
+    results = Results()
+    stop = threading.Event()
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        session.headers["Accept"] = accept
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            method, path, body = WORKLOAD[name][1](rng, data)
+            start = time.perf_counter()
+            try:
+                resp = session.request(method, base_url + path, json=body, timeout=30)
+                size = len(resp.content)
+                ok = resp.status_code < 500
+            except requests.RequestException:
+                size, ok = 0, False
+            results.record(name, time.perf_counter() - start, ok, size)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return results.summary(time.perf_counter() - start)
+
+
+def print_report(report):
+    header = f"{'route':34} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'bytes':>7}"
+    print(header)
+    print("-" * len(header))
+    total = errors = throughput = 0
+    for name, r in report.items():
+        print(f"{name:34} {r['requests']:>7} {r['errors']:>5} {r['throughput']:>8} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['avg_bytes']:>7}")
+        total += r["requests"]
+        errors += r["errors"]
+        throughput += r["throughput"]
+    print("-" * len(header))
+    print(f"{'total':34} {total:>7} {errors:>5} {round(throughput, 1):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backend API against a SQLite ILS stand-in")
+    parser.add_argument("--scale", type=float, default=1.0, help="Synthetic data size multiplier")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent HTTP clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--accept", choices=sorted(ACCEPT), default="json", help="Response encoding to request")
+    parser.add_argument("--routes", help="Comma-separated workload entries to run (default: all)")
+    parser.add_argument("--threads", type=int, default=app.SERVE_THREADS, help="Server worker threads")
+    parser.add_argument("--pool-size", type=int, default=app.POOL_MAX_SIZE, help="Max pooled DB connections")
+    parser.add_argument("--max-in-flight", type=int, default=app.ADMISSION_MAX_IN_FLIGHT,
+                        help="Requests admitted at once")
+    parser.add_argument("--per-client-limit", type=int,
+                        help="Per-client admission limit (default: --clients, since every bench client shares one IP)")
+    parser.add_argument("--db", help="SQLite file to create (default: a temp file)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_out", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    routes = args.routes.split(",") if args.routes else list(WORKLOAD)
+    unknown = [r for r in routes if r not in WORKLOAD]
+    if unknown:
+        parser.error(f"Unknown routes: {', '.join(unknown)} (choose from {', '.join(WORKLOAD)})")
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bc-bench-"), "ils.db")
+    print(f"[BENCH] Seeding {db_path} at scale {args.scale}...")
+    data = seed_database(db_path, args.scale, args.seed)
+    print(f"[BENCH] {len(data.gtins)} GTINs, {len(data.totes)} totes on {len(data.pallets)} pallets, "
+          f"{len(data.lps)} LPs, {len(data.users)} users")
+
+    # Point the default site (and its module-level alias) at the SQLite stand-in
+    app.pool = app.home.pool = ConnectionPool(
+        lambda: _SQLiteConnection(db_path),
+        min_size=min(app.POOL_MIN_SIZE, args.pool_size),
+        max_size=args.pool_size,
+        acquire_timeout=app.POOL_ACQUIRE_TIMEOUT,
+    )
+    app.pool.prewarm()
+    app.settings_writes.start()
+    app.settings_store.refresh()
+
+    app.admission.max_in_flight = args.max_in_flight
+    app.admission.per_client_limit = args.per_client_limit or args.clients
+
+    server = APIServer(app.app, host="127.0.0.1", port=0, threads=args.threads)
+    server.start()
+    base_url = f"http://127.0.0.1:{server.port}"
+    print(f"[BENCH] Server {server.describe()}")
+
+    accept = ACCEPT[args.accept]
+    if args.warmup > 0:
+        run_clients(base_url, data, args.clients, args.warmup, accept, routes, seed=args.seed + 1000)
+    print(f"[BENCH] {args.clients} clients for {args.duration}s, Accept: {accept}")
+    report = run_clients(base_url, data, args.clients, args.duration, accept, routes, seed=args.seed)
+
+    print()
+    print_report(report)
+    print()
+    print(f"[BENCH] Pool: {app.pool.stats()}")
+    print(f"[BENCH] LP cache: {app.lp_cache.stats()}")
+    print(f"[BENCH] Coalescing: {app.inflight.stats()}")
+    print(f"[BENCH] Admission: {app.admission.stats()}")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"args": vars(args), "routes": report}, f, indent=2)
+        print(f"[BENCH] Report written to {args.json_out}")
+
+    server.shutdown(timeout=5)
+    app.settings_writes.close()
+    app.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# circuit_breaker.py
+# Fast-fail guard around database access for SQL Server outages
+#
+# Without it, every request during an outage blocks for the full ODBC login
+# timeout before failing, and clients pile up behind it. The breaker counts
+# consecutive connect failures. Once it trips, requests are refused
+# immediately while a background thread probes the server until it answers
+# again.
+#
+#   closed    -> normal operation, failures are counted
+#   open      -> every call is rejected with CircuitOpenError
+#   half_open -> the background probe is testing the server; calls still rejected
+
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of touching the database while the breaker is open."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Args:
+        probe: Zero-argument callable that raises if the database is still down
+        failure_threshold: Consecutive failures that trip the breaker
+        reset_timeout: Seconds between background probes while open
+        name: Label used in log lines
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, probe, failure_threshold: int = 3, reset_timeout: float = 10.0, name: str = "database"):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._next_probe_at = None
+        self._last_error = None
+        self._trips = 0
+        self._rejected = 0
+        self._probe_thread = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def check(self):
+        """Raise CircuitOpenError if calls are currently refused."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            self._rejected += 1
+            retry_after = max(1, int(round(self._next_probe_at - time.monotonic()))) if self._next_probe_at else 1
+            last_error = self._last_error
+        raise CircuitOpenError(f"{self.name} unavailable: {last_error}", retry_after)
+
+    def guard(self, fn):
+        """Wrap a connect function so its failures and successes drive the breaker."""
+        def guarded(*args, **kwargs):
+            self.check()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.record_failure(e)
+                raise
+            self.record_success()
+            return result
+        return guarded
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._last_error = str(error)
+            if self._state != self.CLOSED or self._consecutive_failures < self.failure_threshold:
+                return
+            self._trip()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "open_for_seconds": round(time.monotonic() - self._opened_at, 1) if self._opened_at else 0,
+                "trips": self._trips,
+                "rejected": self._rejected,
+                "last_error": self._last_error,
+            }
+
+    def _trip(self):
+        """Open the breaker and start probing. Caller holds the lock."""
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._next_probe_at = self._opened_at + self.reset_timeout
+        self._trips += 1
+        print(f"[API] Circuit breaker OPEN for {self.name} after "
+              f"{self._consecutive_failures} failures: {self._last_error}")
+        if not (self._probe_thread and self._probe_thread.is_alive()):
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="breaker-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self._state = self.HALF_OPEN
+            try:
+                self._probe()
+            except Exception as e:
+                with self._lock:
+                    self._state = self.OPEN
+                    self._last_error = str(e)
+                    self._next_probe_at = time.monotonic() + self.reset_timeout
+                continue
+
+            with self._lock:
+                self._state = self.CLOSED
+                self._consecutive_failures = 0
+                self._opened_at = None
+                self._next_probe_at = None
+            print(f"[API] Circuit breaker CLOSED for {self.name}, connection restored")
+            return
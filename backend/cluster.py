@@ -0,0 +1,360 @@
+# cluster.py
+# Multi-process serving: a supervisor and N worker processes sharing one port
+#
+# A single process is bound by the GIL for request parsing and JSON
+# encoding, however fast SQL Server answers. In cluster mode the supervisor
+# binds the listening socket once and starts N worker processes that all
+# accept on it (the socket is handed over through multiprocessing, which
+# duplicates it on Windows and passes the descriptor on POSIX).
+#
+# Each worker has a pipe to the supervisor, used for:
+#   - reports: every REPORT_INTERVAL seconds a worker sends a snapshot
+#     (health, metrics, stats). The supervisor sends the latest snapshot of
+#     every worker back to all of them, so /health, /metrics and /stats on
+#     any worker can answer for the whole cluster.
+#   - broadcasts: state changes one worker made that the others must apply
+#     (cache invalidation, settings updates, events for /events streams).
+#     The supervisor relays them to every other worker.
+#   - stop: the supervisor asks workers to drain and exit.
+#
+# Sequences (SharedSequence) give every worker the same epoch and one
+# counter in shared memory, so version numbers and event ids handed to
+# clients mean the same thing whichever worker answers. They are created by
+# the supervisor and outlive worker restarts.
+#
+# Workers that exit unexpectedly are restarted, with a growing delay if they
+# keep crashing right after start.
+#
+#     supervisor = Supervisor(worker_main, workers=4, host="0.0.0.0", port=5000,
+#                             sequences=("events",))
+#     supervisor.run()    # until Ctrl+C / SIGTERM
+#
+#     def worker_main(sock, worker_id, conn, sequences, *args):
+#         broker.use_sequence(sequences["events"])
+#         link = WorkerLink(worker_id, conn, report=lambda: {...})
+#         link.on("invalidate", handler)
+#         link.start()
+#         ...serve on sock until link.stopped is set...
+
+import multiprocessing
+import multiprocessing.connection
+import signal
+import socket
+import threading
+import time
+import uuid
+
+REPORT_INTERVAL = 1.0       # Seconds between worker reports / cluster snapshots
+RESTART_DELAY = 1.0         # Seconds before restarting a crashed worker
+MAX_RESTART_DELAY = 30.0    # Backoff cap for a worker that keeps crashing
+STABLE_AFTER = 30.0         # A worker that ran this long resets the backoff
+
+
+class SharedSequence:
+    """
+    Cluster-wide epoch and counter. Pass it to worker processes when they
+    are started (it lives in shared memory and can't be sent over a pipe).
+    """
+
+    def __init__(self, ctx=multiprocessing):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._value = ctx.Value("q", 0)
+
+    def next(self) -> int:
+        """Take the next number."""
+        with self._value.get_lock():
+            self._value.value += 1
+            return self._value.value
+
+    @property
+    def current(self) -> int:
+        """Last number taken by any worker."""
+        with self._value.get_lock():
+            return self._value.value
+
+
+class WorkerLink:
+    """
+    Worker side of the pipe to the supervisor.
+
+    Args:
+        worker_id: Index of this worker (stable across restarts)
+        conn: multiprocessing Connection to the supervisor
+        report: Zero-argument callable returning this worker's snapshot
+        report_interval: Seconds between reports
+    """
+
+    def __init__(self, worker_id: int, conn, report, report_interval: float = REPORT_INTERVAL):
+        self.worker_id = worker_id
+        self._conn = conn
+        self._report = report
+        self.report_interval = report_interval
+        self._send_lock = threading.Lock()
+        self._handlers = {}
+        self._cluster = {}
+        self._cluster_lock = threading.Lock()
+        self.stopped = threading.Event()   # Set when the supervisor asks us to stop or goes away
+
+    def on(self, kind: str, handler):
+        """Call handler(payload) for broadcasts of kind sent by other workers."""
+        self._handlers[kind] = handler
+
+    def broadcast(self, kind: str, payload):
+        """Send a change to every other worker. Never raises; a lost broadcast only costs freshness."""
+        self._send(("broadcast", kind, payload))
+
+    def cluster(self) -> dict:
+        """Latest {worker_id: {"pid", "alive", "restarts", "uptime", "report_age", "report"}}."""
+        with self._cluster_lock:
+            return dict(self._cluster)
+
+    def start(self):
+        threading.Thread(target=self._receive, name="cluster-receive", daemon=True).start()
+        threading.Thread(target=self._send_reports, name="cluster-report", daemon=True).start()
+
+    def _send(self, message) -> bool:
+        try:
+            with self._send_lock:
+                self._conn.send(message)
+            return True
+        except (OSError, EOFError, ValueError):
+            return False
+
+    def _send_reports(self):
+        while not self.stopped.is_set():
+            try:
+                snapshot = self._report()
+            except Exception as e:
+                snapshot = {"error": str(e)}
+            if not self._send(("report", snapshot)):
+                self.stopped.set()
+                return
+            self.stopped.wait(self.report_interval)
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (OSError, EOFError):
+                # Supervisor is gone; don't keep serving unsupervised
+                self.stopped.set()
+                return
+            kind = message[0]
+            if kind == "stop":
+                self.stopped.set()
+            elif kind == "cluster":
+                with self._cluster_lock:
+                    self._cluster = message[1]
+            elif kind == "broadcast":
+                handler = self._handlers.get(message[1])
+                if handler is not None:
+                    try:
+                        handler(message[2])
+                    except Exception as e:
+                        print(f"[API] Worker {self.worker_id}: {message[1]} broadcast failed: {e}")
+
+
+class _WorkerSlot:
+    __slots__ = ("worker_id", "process", "conn", "started_at", "restarts", "next_delay",
+                 "restart_at", "report", "report_at")
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.conn = None
+        self.started_at = None
+        self.restarts = 0
+        self.next_delay = RESTART_DELAY
+        self.restart_at = None
+        self.report = None
+        self.report_at = None
+
+
+class Supervisor:
+    """
+    Starts and watches worker processes sharing one listening socket.
+
+    Args:
+        target: Top-level function run in each worker as
+            target(sock, worker_id, conn, sequences, *args); must be importable (spawn)
+        workers: Number of worker processes
+        host, port: Listen address
+        backlog: Listen backlog for connections waiting to be accepted
+        args: Extra arguments passed to target
+        stop_timeout: Seconds to wait for workers to drain on shutdown
+        sequences: Names of the SharedSequences passed to target as {name: SharedSequence}
+    """
+
+    def __init__(self, target, workers: int, host: str, port: int, backlog: int = 128,
+                 args: tuple = (), stop_timeout: float = 15.0, sequences: tuple = ()):
+        self.target = target
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.args = args
+        self.stop_timeout = stop_timeout
+        # Spawn everywhere: forking a process that already runs threads is unsafe
+        self._ctx = multiprocessing.get_context("spawn")
+        self.sequences = {name: SharedSequence(self._ctx) for name in sequences}
+        self._sock = None
+        self._slots = [_WorkerSlot(i) for i in range(workers)]
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()     # Router and stop() both write to the pipes
+        self._stopping = threading.Event()
+        self._router_done = threading.Event()
+
+    def bind(self):
+        """Bind the shared listening socket (port 0 picks a free port)."""
+        self._sock = socket.create_server((self.host, self.port), backlog=self.backlog)
+        self._sock.setblocking(False)
+        self.port = self._sock.getsockname()[1]
+        return self._sock
+
+    def run(self):
+        """Start the workers and supervise them until Ctrl+C or a termination signal."""
+        if self._sock is None:
+            self.bind()
+        for sig_name in ("SIGTERM", "SIGBREAK"):
+            sig = getattr(signal, sig_name, None)
+            if sig is not None:
+                signal.signal(sig, lambda *_: self._stopping.set())
+
+        for slot in self._slots:
+            self._spawn(slot)
+        router = threading.Thread(target=self._route, name="cluster-router", daemon=True)
+        router.start()
+
+        try:
+            while not self._stopping.wait(0.5):
+                self._check_workers()
+        except KeyboardInterrupt:
+            self._stopping.set()
+
+        self.stop()
+
+    def stop(self):
+        """Ask every worker to drain and exit; terminate the ones that don't."""
+        self._stopping.set()
+        print(f"[API] Stopping {self.workers} worker(s)...")
+        with self._lock:
+            slots = list(self._slots)
+        for slot in slots:
+            self._send(slot, ("stop",))
+        deadline = time.monotonic() + self.stop_timeout
+        for slot in slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(0.0, deadline - time.monotonic()))
+            if slot.process.is_alive():
+                print(f"[API] Worker {slot.worker_id} (pid {slot.process.pid}) did not stop, terminating")
+                slot.process.terminate()
+                slot.process.join(5)
+        # Keep relaying until now so draining workers never block on a full pipe
+        self._router_done.set()
+        if self._sock is not None:
+            self._sock.close()
+
+    def snapshot(self) -> dict:
+        """Per-worker state and latest report, as sent to the workers."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                slot.worker_id: {
+                    "pid": slot.process.pid if slot.process else None,
+                    "alive": bool(slot.process and slot.process.is_alive()),
+                    "restarts": slot.restarts,
+                    "uptime": round(now - slot.started_at, 1) if slot.started_at else 0,
+                    "report_age": round(now - slot.report_at, 1) if slot.report_at else None,
+                    "report": slot.report,
+                }
+                for slot in self._slots
+            }
+
+    def _spawn(self, slot):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=self.target,
+            args=(self._sock, slot.worker_id, child_conn, self.sequences) + tuple(self.args),
+            name=f"api-worker-{slot.worker_id}",
+            daemon=False,
+        )
+        process.start()
+        child_conn.close()
+        with self._lock:
+            if slot.conn is not None:
+                slot.conn.close()
+            slot.process = process
+            slot.conn = parent_conn
+            slot.started_at = time.monotonic()
+            slot.report = None
+            slot.report_at = None
+            slot.restart_at = None
+        print(f"[API] Worker {slot.worker_id} started (pid {process.pid})")
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for slot in self._slots:
+            if self._stopping.is_set():
+                return
+            if slot.process.is_alive():
+                continue
+            if slot.restart_at is None:
+                lived = now - slot.started_at
+                if lived >= STABLE_AFTER:
+                    slot.next_delay = RESTART_DELAY
+                print(f"[API] Worker {slot.worker_id} (pid {slot.process.pid}) exited with code "
+                      f"{slot.process.exitcode} after {lived:.0f}s; restarting in {slot.next_delay:.0f}s")
+                slot.restart_at = now + slot.next_delay
+                slot.next_delay = min(slot.next_delay * 2, MAX_RESTART_DELAY)
+            elif now >= slot.restart_at:
+                slot.restarts += 1
+                self._spawn(slot)
+
+    def _route(self):
+        """Relay broadcasts between workers, collect reports and send cluster snapshots."""
+        next_snapshot = time.monotonic() + REPORT_INTERVAL
+        while not self._router_done.is_set():
+            with self._lock:
+                by_conn = {slot.conn: slot for slot in self._slots if slot.conn is not None}
+            timeout = max(0.0, next_snapshot - time.monotonic())
+            try:
+                ready = multiprocessing.connection.wait(list(by_conn), timeout)
+            except OSError:
+                ready = []
+            for conn in ready:
+                slot = by_conn[conn]
+                try:
+                    message = conn.recv()
+                except (OSError, EOFError):
+                    # Worker died; _check_workers restarts it with a new pipe
+                    with self._lock:
+                        if slot.conn is conn:
+                            slot.conn = None
+                    conn.close()
+                    continue
+                if message[0] == "report":
+                    with self._lock:
+                        slot.report = message[1]
+                        slot.report_at = time.monotonic()
+                elif message[0] == "broadcast":
+                    for other in by_conn.values():
+                        if other is not slot:
+                            self._send(other, message)
+
+            if time.monotonic() >= next_snapshot:
+                cluster = ("cluster", self.snapshot())
+                for slot in list(by_conn.values()):
+                    self._send(slot, cluster)
+                next_snapshot = time.monotonic() + REPORT_INTERVAL
+
+    def _send(self, slot, message):
+        conn = slot.conn
+        if conn is None:
+            return
+        try:
+            with self._send_lock:
+                conn.send(message)
+        except (OSError, EOFError, ValueError):
+            pass
+
@@ -0,0 +1,328 @@
+# db_pool.py
+# Bounded, pre-warmed database connection pool for the backend API
+#
+# Opening a Trusted_Connection to SQL Server costs a full SSPI handshake, which
+# dominated request latency when every route connected on its own. The pool keeps
+# a small set of connections open, hands them out per request and retires the
+# ones that break or sit idle for too long.
+#
+# The pool only needs a zero-argument connect callable, so it works the same
+# against pyodbc and a SQLite stand-in:
+#
+#     pool = ConnectionPool(lambda: sqlite3.connect("ils.db", check_same_thread=False))
+#     with pool.connection() as conn:
+#         conn.execute("SELECT 1")
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+    pass
+
+
+class _PooledConnection:
+    """A raw DB-API connection plus the bookkeeping the pool needs."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Thread-safe, bounded pool of DB-API connections.
+
+    Args:
+        connect: Zero-argument callable returning a new DB-API connection
+        min_size: Connections opened by prewarm() and kept open by the reaper
+        max_size: Hard cap on open connections (idle + in use)
+        acquire_timeout: Seconds to wait for a free connection before PoolTimeoutError
+        idle_timeout: Idle connections older than this are retired (above min_size)
+        max_lifetime: Connections older than this are retired on their next checkout
+        validate_after: Idle time after which a connection is pinged before reuse
+        validation_query: Cheap statement used for the ping
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size: int = 2,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 3600.0,
+        validate_after: float = 30.0,
+        validation_query: str = "SELECT 1",
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self.validation_query = validation_query
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []          # LIFO stack so the hottest connection is reused first
+        self._size = 0           # Open connections, idle + in use + being opened
+        self._closed = False
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "connect_failures": 0,
+            "validation_failures": 0,
+            "acquired": 0,
+            "waited": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with-block.
+
+        The connection goes back to the pool when the block exits. If the block
+        raises, the transaction is rolled back, and the connection is discarded if
+        even the rollback fails. Callers that write must commit themselves.
+        """
+        pooled = self._acquire()
+        try:
+            yield pooled.conn
+        except BaseException:
+            # Includes GeneratorExit when a streaming response is abandoned mid-way
+            self._release(pooled, rollback=True)
+            raise
+        else:
+            self._release(pooled)
+
+    def prewarm(self) -> int:
+        """
+        Open connections until min_size are available.
+
+        Called once at service start so the first scans of a shift don't pay the
+        connect cost. Failures are counted and otherwise ignored; the pool will
+        connect lazily later.
+
+        Returns:
+            Number of connections opened
+        """
+        opened = 0
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    break
+                self._size += 1
+            pooled = self._open_reserved()
+            if pooled is None:
+                break
+            with self._lock:
+                self._idle.append(pooled)
+                self._available.notify()
+            opened += 1
+        return opened
+
+    def start_reaper(self, interval: float = 30.0):
+        """Start a daemon thread that periodically retires idle connections."""
+        if self._reaper and self._reaper.is_alive():
+            return
+
+        def run():
+            while not self._stop_reaper.wait(interval):
+                self.reap()
+
+        self._reaper = threading.Thread(target=run, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def reap(self) -> int:
+        """
+        Retire idle connections past idle_timeout or max_lifetime, then top the
+        pool back up to min_size.
+
+        Returns:
+            Number of connections retired
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            keep = []
+            # Oldest-used connections sit at the bottom of the stack
+            for pooled in self._idle:
+                too_old = now - pooled.created_at > self.max_lifetime
+                too_idle = (
+                    now - pooled.last_used > self.idle_timeout
+                    and self._size - len(expired) > self.min_size
+                )
+                if too_old or too_idle:
+                    expired.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            self._size -= len(expired)
+
+        for pooled in expired:
+            self._close(pooled)
+
+        if expired:
+            self.prewarm()
+        return len(expired)
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts."""
+        self._stop_reaper.set()
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._available.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> dict:
+        """Snapshot of pool gauges and counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        snapshot["wait_seconds_total"] = round(snapshot["wait_seconds_total"], 6)
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _acquire(self) -> _PooledConnection:
+        deadline = time.monotonic() + self.acquire_timeout
+        waited = False
+
+        while True:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool is closed")
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # Reserve a slot, then connect outside the lock
+                        self._size += 1
+                        pooled = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.acquire_timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    if not waited:
+                        waited = True
+                        self._stats["waited"] += 1
+                    wait_start = time.monotonic()
+                    self._available.wait(remaining)
+                    self._stats["wait_seconds_total"] += time.monotonic() - wait_start
+
+            if pooled is None:
+                pooled = self._open_reserved(raise_errors=True)
+            elif not self._is_reusable(pooled):
+                self._discard(pooled)
+                continue
+
+            with self._lock:
+                self._stats["acquired"] += 1
+            return pooled
+
+    def _release(self, pooled: _PooledConnection, rollback: bool = False):
+        if rollback:
+            try:
+                pooled.conn.rollback()
+            except Exception:
+                self._discard(pooled)
+                return
+
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            if self._closed:
+                self._size -= 1
+                close_now = True
+            else:
+                self._idle.append(pooled)
+                self._available.notify()
+                close_now = False
+        if close_now:
+            self._close(pooled)
+
+    def _is_reusable(self, pooled: _PooledConnection) -> bool:
+        """Age checks are free; the validation ping only runs after a quiet spell."""
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.idle_timeout:
+            return False
+        if now - pooled.last_used < self.validate_after:
+            return True
+        try:
+            cursor = pooled.conn.cursor()
+            cursor.execute(self.validation_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            with self._lock:
+                self._stats["validation_failures"] += 1
+            return False
+
+    def _open_reserved(self, raise_errors: bool = False):
+        """Open a connection for a slot already counted in _size."""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._stats["connect_failures"] += 1
+                self._available.notify()
+            if raise_errors:
+                raise
+            return None
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled: _PooledConnection):
+        """Close a checked-out connection and free its slot."""
+        with self._lock:
+            self._size -= 1
+            self._available.notify()
+        self._close(pooled)
+
+    def _close(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats["connections_closed"] += 1
@@ -0,0 +1,128 @@
+# encoding.py
+# Response encodings negotiated from the Accept header
+#
+# Row data from SQL Server is a list of dicts that repeats every column name
+# on every row. Clients that ask for it get a columnar shape instead, which
+# names the columns once:
+#
+#     [{"LOCATION": "A1", "ITEM": "X"}, {"LOCATION": "B2", "ITEM": "Y"}]
+#  -> {"$columns": ["LOCATION", "ITEM"], "$rows": [["A1", "X"], ["B2", "Y"]]}
+#
+# A dict of same-shaped dicts (user settings keyed by username) also gets an
+# "$index" list holding the keys. The columnar shape can be sent as JSON or,
+# when msgpack is installed, as MessagePack. Clients that send no Accept
+# header (or */*) get plain JSON as before.
+
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, current_app, g, has_request_context, request
+from werkzeug.http import http_date
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional; columnar JSON still works
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+COLUMNAR_MIMETYPE = "application/vnd.browsercontrol.columnar+json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+
+
+def negotiate() -> str:
+    """Pick the response mimetype for the current request."""
+    offered = [JSON_MIMETYPE, COLUMNAR_MIMETYPE]
+    if msgpack is not None:
+        offered.append(MSGPACK_MIMETYPE)
+    # best_match prefers the first offer on ties, so */* keeps plain JSON
+    return request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+
+
+def to_columnar(obj):
+    """Recursively replace lists/dicts of same-shaped dicts with column tables."""
+    if isinstance(obj, list):
+        columns = _shared_columns(obj)
+        if columns is not None:
+            return {"$columns": columns, "$rows": [[to_columnar(v) for v in row.values()] for row in obj]}
+        return [to_columnar(v) for v in obj]
+
+    if isinstance(obj, dict):
+        columns = _shared_columns(list(obj.values()))
+        if columns is not None:
+            return {
+                "$columns": columns,
+                "$index": list(obj.keys()),
+                "$rows": [[to_columnar(v) for v in row.values()] for row in obj.values()],
+            }
+        return {k: to_columnar(v) for k, v in obj.items()}
+
+    return obj
+
+
+def from_columnar(obj):
+    """Inverse of to_columnar()."""
+    if isinstance(obj, dict):
+        if "$columns" in obj and "$rows" in obj:
+            columns = obj["$columns"]
+            rows = [dict(zip(columns, (from_columnar(v) for v in row))) for row in obj["$rows"]]
+            if "$index" in obj:
+                return dict(zip(obj["$index"], rows))
+            return rows
+        return {k: from_columnar(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [from_columnar(v) for v in obj]
+    return obj
+
+
+def encode_response(data, status: int = 200) -> Response:
+    """
+    Build a response for data in the encoding the client asked for.
+
+    Use for row data only. Error bodies stay plain JSON via jsonify so every
+    client can read them.
+    """
+    mimetype = negotiate()
+    if mimetype == JSON_MIMETYPE:
+        response = current_app.json.response(data)
+    else:
+        start = time.perf_counter()
+        table = to_columnar(data)
+        if mimetype == MSGPACK_MIMETYPE:
+            body = msgpack.packb(table, default=_msgpack_default, use_bin_type=True)
+            _add_serialize_time(time.perf_counter() - start)
+        else:
+            _add_serialize_time(time.perf_counter() - start)
+            body = current_app.json.dumps(table)   # The app's JSON provider times itself
+        response = Response(body, mimetype=mimetype)
+
+    response.status_code = status
+    response.vary.add("Accept")
+    return response
+
+
+def _shared_columns(rows):
+    """Column names if rows is a non-empty list of dicts with identical keys, else None."""
+    if not rows or not isinstance(rows[0], dict) or not rows[0]:
+        return None
+    columns = list(rows[0].keys())
+    for row in rows:
+        if not isinstance(row, dict) or len(row) != len(columns) or list(row.keys()) != columns:
+            return None
+    return columns
+
+
+def _msgpack_default(obj):
+    """Same conversions as Flask's JSON provider for types pyodbc returns."""
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return http_date(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+def _add_serialize_time(seconds):
+    # Same accounting as metrics._TimedJSONProvider
+    if has_request_context():
+        g.serialize_seconds = g.get("serialize_seconds", 0.0) + seconds
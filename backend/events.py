@@ -0,0 +1,221 @@
+# events.py
+# In-process broadcast of change events to Server-Sent Events subscribers
+#
+# Stations keep one GET /events stream open and are told when user settings
+# change or pallets are marked as arrived, instead of re-querying. Event ids
+# are "<epoch>-<n>": n increases, and the epoch changes on every service
+# start. Recent events are kept so a client that reconnects with
+# Last-Event-ID receives what it missed. If its id is too old or from another
+# epoch it gets a single "resync" event instead and should reload from the
+# regular endpoints. Events published for a site only go to subscribers of
+# that site (or of all sites).
+#
+# In cluster mode every worker numbers events from one SharedSequence (see
+# use_sequence) and publishes the other workers' events under their ids, so a
+# stream may reconnect to any worker.
+#
+#     broker = EventBroker()
+#     broker.publish("arrival", {"containers": {"P123": 4}})
+#
+#     sub = broker.subscribe(last_event_id)
+#     for event in sub.replay: ...
+#     event = sub.get(timeout=15)   # None on timeout, CLOSED on shutdown
+
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+CLOSED = object()   # Sentinel handed to subscribers when the stream must end
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Event:
+    __slots__ = ("id", "type", "data", "site")
+
+    def __init__(self, event_id, event_type, data, site=None):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.site = site
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """One connected stream. Events the client missed are in replay."""
+
+    def __init__(self, queue_size, replay, site=None):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.replay = replay
+        self.site = site
+        self.connected_at = time.monotonic()
+
+    def get(self, timeout: float):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wants(self, event) -> bool:
+        return event.site is None or self.site is None or event.site == self.site
+
+    def _offer(self, event) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def _close(self):
+        # Make room so the sentinel always gets through
+        while True:
+            try:
+                self._queue.put_nowait(CLOSED)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class EventBroker:
+    """
+    Args:
+        history: Recent events kept for Last-Event-ID replay
+        max_subscribers: Open streams allowed at once (each holds a worker thread)
+        queue_size: Undelivered events per subscriber before it is disconnected
+    """
+
+    def __init__(self, history: int = 256, max_subscribers: int = 48, queue_size: int = 100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self.epoch = uuid.uuid4().hex[:8]
+        self._last_id = 0       # Highest event number published or received
+        self._floor = 0         # Numbers up to this were used before this broker started
+        self._sequence = None
+        self._closed = False
+        self._stats = {
+            "published": 0,
+            "delivered": 0,
+            "connects": 0,
+            "rejected": 0,
+            "dropped_slow": 0,
+            "resyncs": 0,
+        }
+
+    def use_sequence(self, sequence):
+        """Take the epoch and event numbers from a cluster-wide SharedSequence."""
+        with self._lock:
+            self.epoch = sequence.epoch
+            self._sequence = sequence
+            # A restarted worker can't replay what happened before it started
+            self._last_id = self._floor = sequence.current
+
+    def publish(self, event_type: str, data, site: str = None, event_id: str = None) -> str:
+        """
+        Broadcast an event to every subscriber (of site, if given). Never blocks
+        on slow clients. event_id is given for an event another worker numbered.
+        """
+        with self._lock:
+            n = self._sequence_of(event_id) if event_id else None
+            if n is None:
+                n = self._sequence.next() if self._sequence is not None else self._last_id + 1
+            self._last_id = max(self._last_id, n)
+            event = Event(f"{self.epoch}-{n}", event_type, data, site)
+            self._remember(event, n)
+            self._stats["published"] += 1
+            subscribers = [sub for sub in self._subscribers if sub.wants(event)]
+
+        delivered = 0
+        for sub in subscribers:
+            if sub._offer(event):
+                delivered += 1
+            else:
+                # Disconnect it; it will reconnect and replay from its last id
+                self.unsubscribe(sub)
+                sub._close()
+                with self._lock:
+                    self._stats["dropped_slow"] += 1
+        with self._lock:
+            self._stats["delivered"] += delivered
+        return event.id
+
+    def subscribe(self, last_event_id: str = None, site: str = None) -> Subscription:
+        """
+        Open a stream, replaying events after last_event_id when still in
+        history. With site, events published for other sites are skipped.
+        """
+        with self._lock:
+            if self._closed or len(self._subscribers) >= self.max_subscribers:
+                self._stats["rejected"] += 1
+                raise TooManySubscribers(f"Event stream limit reached ({self.max_subscribers})")
+
+            replay = []
+            if last_event_id:
+                seen = self._sequence_of(last_event_id)
+                oldest = self._sequence_of(self._history[0].id) if self._history else self._last_id + 1
+                if seen is None or seen > self._last_id or seen < max(oldest - 1, self._floor):
+                    # From before a restart, too far behind, or garbage
+                    replay = [Event(f"{self.epoch}-{self._last_id}", "resync", {})]
+                    self._stats["resyncs"] += 1
+                else:
+                    replay = [e for e in self._history if self._sequence_of(e.id) > seen]
+
+            sub = Subscription(self.queue_size, [], site)
+            sub.replay = [e for e in replay if sub.wants(e)]
+            self._subscribers.add(sub)
+            self._stats["connects"] += 1
+            return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def close(self):
+        """End every open stream (on shutdown, so the drain doesn't wait on them)."""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for sub in subscribers:
+            sub._close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["subscribers"] = len(self._subscribers)
+            snapshot["last_event_id"] = f"{self.epoch}-{self._last_id}"
+        return snapshot
+
+    def _remember(self, event, n):
+        """Add to history in number order; another worker's event can arrive after a newer one. Caller holds _lock."""
+        history = self._history
+        if not history or self._sequence_of(history[-1].id) < n:
+            history.append(event)
+            return
+        if len(history) == history.maxlen:
+            if n < self._sequence_of(history[0].id):
+                return      # Older than anything kept
+            history.popleft()
+        index = len(history)
+        while index > 0 and self._sequence_of(history[index - 1].id) > n:
+            index -= 1
+        history.insert(index, event)
+
+    def _sequence_of(self, event_id: str):
+        """n from "<epoch>-<n>", or None if the id belongs to another epoch."""
+        epoch, _, n = event_id.partition("-")
+        if epoch != self.epoch or not n.isdigit():
+            return None
+        return int(n)
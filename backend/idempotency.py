@@ -0,0 +1,94 @@
+# idempotency.py
+# Replay protection for retried client writes (Idempotency-Key header)
+#
+# Stations keep writes in an outbox and retry them until they get an answer.
+# If an attempt reached the database but its answer was lost, the retry must
+# not run the write again: a replayed settings change could overwrite a newer
+# one made on another station. The first response for each key is kept for
+# `ttl` seconds and returned for every repeat; a repeat arriving while the
+# first attempt is still running waits for it and gets the same response.
+#
+# Responses that say "try again" (5xx, 429) are not kept, so the retry runs.
+#
+#     store = IdempotencyStore(maxsize=10000, ttl=86400)
+#     (status, body, headers), replayed = store.run(key, lambda: (200, b"{}", [("Content-Type", "application/json")]))
+
+import threading
+from single_flight import SingleFlight
+from ttl_cache import TTLCache
+
+
+class IdempotencyStore:
+    """
+    Args:
+        maxsize: Keys remembered; the least recently used is forgotten first
+        ttl: Seconds a key's response is remembered
+        on_store: Optional on_store(key, response), called when a response is kept
+            (used to share it with the other cluster workers)
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400, on_store=None):
+        self._responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = SingleFlight()
+        self.on_store = on_store
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._replayed = 0
+
+    @staticmethod
+    def keepable(status: int) -> bool:
+        return status < 500 and status != 429
+
+    def run(self, key, execute):
+        """
+        Return the kept response for key, or execute() once and keep its result.
+
+        Args:
+            execute: Zero-argument callable returning (status, body, headers)
+
+        Returns:
+            ((status, body, headers), replayed)
+        """
+        hit, response = self._responses.get(key)
+        if not hit:
+            ran = []
+
+            def once():
+                # A call that finished just before we joined has already stored its response
+                hit, stored = self._responses.get(key)
+                if hit:
+                    return stored
+                ran.append(True)
+                result = execute()
+                if self.keepable(result[0]):
+                    self.remember(key, result)
+                    if self.on_store is not None:
+                        self.on_store(key, result)
+                return result
+
+            response = self._inflight.do(key, once)
+            hit = not ran
+
+        with self._lock:
+            if hit:
+                self._replayed += 1
+            else:
+                self._executed += 1
+        return response, hit
+
+    def remember(self, key, response):
+        """Keep a response (also used for responses produced by another worker)."""
+        self._responses.set(key, tuple(response))
+
+    def stats(self) -> dict:
+        cache = self._responses.stats()
+        with self._lock:
+            return {
+                "keys": cache["size"],
+                "maxsize": cache["maxsize"],
+                "ttl_seconds": cache["ttl_seconds"],
+                "executed": self._executed,
+                "replayed": self._replayed,
+                "evictions": cache["evictions"],
+                "expirations": cache["expirations"],
+            }
@@ -0,0 +1,238 @@
+# metrics.py
+# Per-route request metrics for the backend API, rendered in Prometheus text format
+#
+# Usage:
+#     request_metrics = RequestMetrics()
+#     request_metrics.init_app(app)
+#     request_metrics.add_gauges("pool", pool.stats)
+#
+#     with request_metrics.time_db():
+#         ...  # counted as DB time for the current request
+#
+# Recording a request costs a few perf_counter() calls, a bisect and one
+# short lock, so it's cheap enough for the hot path.
+#
+# In cluster mode every worker process has its own RequestMetrics; their
+# snapshot()s are combined with merge_snapshots() and rendered once, with
+# gauges labelled per worker.
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+# Upper bounds in seconds; tuned for requests that normally take 5-500 ms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "browsercontrol"
+
+
+class Histogram:
+    """Cumulative-bucket histogram. Callers hold the registry lock."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that charges encoding time to the current request."""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if has_request_context():
+                g.serialize_seconds = g.get("serialize_seconds", 0.0) + time.perf_counter() - start
+
+
+class RequestMetrics:
+    """
+    Collects per-route counts, error counts and latency histograms, with each
+    request's time split into DB time and serialization time.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._requests = {}     # (route, method, status) -> count
+        self._errors = {}       # (route, method) -> count of 5xx responses
+        self._latency = {}      # (route, method) -> Histogram
+        self._db = {}           # (route, method) -> Histogram
+        self._serialize = {}    # (route, method) -> Histogram
+        self._gauge_sources = []
+        self.started_at = time.time()
+
+    def init_app(self, app):
+        """Install request hooks and the timing JSON provider on a Flask app."""
+        app.json = _TimedJSONProvider(app)
+
+        @app.before_request
+        def _start_timer():
+            g.request_start = time.perf_counter()
+            g.db_seconds = 0.0
+            g.serialize_seconds = 0.0
+
+        @app.after_request
+        def _record(response):
+            start = g.get("request_start")
+            if start is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                self.observe(
+                    route,
+                    request.method,
+                    response.status_code,
+                    time.perf_counter() - start,
+                    g.get("db_seconds", 0.0),
+                    g.get("serialize_seconds", 0.0),
+                )
+            return response
+
+    @contextmanager
+    def time_db(self):
+        """Charge the wall time of the with-block to the current request's DB time."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if has_request_context():
+                g.db_seconds = g.get("db_seconds", 0.0) + time.perf_counter() - start
+
+    def add_gauges(self, name: str, source):
+        """
+        Export the numeric values of source() as gauges named
+        browsercontrol_<name>_<key>. Sources are called only when /metrics
+        is scraped.
+        """
+        self._gauge_sources.append((name, source))
+
+    def observe(self, route, method, status, seconds, db_seconds=0.0, serialize_seconds=0.0):
+        key = (route, method)
+        with self._lock:
+            status_key = (route, method, status)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            if status >= 500:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            for table, value in (
+                (self._latency, seconds),
+                (self._db, db_seconds),
+                (self._serialize, serialize_seconds),
+            ):
+                hist = table.get(key)
+                if hist is None:
+                    hist = table[key] = Histogram(self.buckets)
+                hist.observe(value)
+
+    def gauges(self) -> dict:
+        """Current gauge values as {metric_name: value}."""
+        values = {}
+        for name, source in self._gauge_sources:
+            try:
+                stats = source()
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    values[f"{PREFIX}_{name}_{key}"] = value
+        return values
+
+    def snapshot(self) -> dict:
+        """Plain-data copy of every counter and histogram."""
+        with self._lock:
+            return {
+                "requests": dict(self._requests),
+                "errors": dict(self._errors),
+                "latency": {k: h.snapshot() for k, h in self._latency.items()},
+                "db": {k: h.snapshot() for k, h in self._db.items()},
+                "serialize": {k: h.snapshot() for k, h in self._serialize.items()},
+            }
+
+    def render(self, snapshot: dict = None, gauges: list = None, started_at: float = None) -> str:
+        """
+        Everything in Prometheus text exposition format (version 0.0.4).
+
+        Args:
+            snapshot: Counters and histograms to render instead of this
+                process's own (e.g. merged across workers)
+            gauges: (metric, labels, value) rows instead of this process's gauges
+            started_at: Start time to report instead of this process's
+        """
+        snap = snapshot if snapshot is not None else self.snapshot()
+        if gauges is None:
+            gauges = [(metric, "", value) for metric, value in self.gauges().items()]
+        lines = []
+
+        lines.append(f"# HELP {PREFIX}_requests_total Requests handled, by route, method and status.")
+        lines.append(f"# TYPE {PREFIX}_requests_total counter")
+        for (route, method, status), count in sorted(snap["requests"].items()):
+            lines.append(f'{PREFIX}_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+        lines.append(f"# HELP {PREFIX}_request_errors_total Requests that ended in a 5xx response.")
+        lines.append(f"# TYPE {PREFIX}_request_errors_total counter")
+        for (route, method), count in sorted(snap["errors"].items()):
+            lines.append(f'{PREFIX}_request_errors_total{{route="{route}",method="{method}"}} {count}')
+
+        for name, table, help_text in (
+            ("request_duration_seconds", snap["latency"], "Total time to handle a request."),
+            ("request_db_seconds", snap["db"], "Time spent holding a database connection per request."),
+            ("request_serialize_seconds", snap["serialize"], "Time spent encoding response bodies per request."),
+        ):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} histogram")
+            for (route, method), hist in sorted(table.items()):
+                labels = f'route="{route}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(list(hist["buckets"]) + ["+Inf"], hist["counts"]):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{PREFIX}_{name}_sum{{{labels}}} {hist['sum']:.6f}")
+                lines.append(f"{PREFIX}_{name}_count{{{labels}}} {hist['count']}")
+
+        typed = set()
+        for metric, labels, value in sorted(gauges, key=lambda row: (row[0], row[1])):
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{{{labels}}} {value}" if labels else f"{metric} {value}")
+
+        lines.append(f"# TYPE {PREFIX}_start_time_seconds gauge")
+        lines.append(f"{PREFIX}_start_time_seconds {started_at or self.started_at:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots) -> dict:
+    """Sum RequestMetrics.snapshot() results (e.g. from several worker processes)."""
+    merged = {"requests": {}, "errors": {}, "latency": {}, "db": {}, "serialize": {}}
+    for snap in snapshots:
+        for table in ("requests", "errors"):
+            for key, count in snap[table].items():
+                merged[table][key] = merged[table].get(key, 0) + count
+        for table in ("latency", "db", "serialize"):
+            for key, hist in snap[table].items():
+                into = merged[table].get(key)
+                if into is None:
+                    merged[table][key] = {**hist, "counts": list(hist["counts"])}
+                    continue
+                # Every worker runs the same code, so the bucket bounds match
+                into["counts"] = [a + b for a, b in zip(into["counts"], hist["counts"])]
+                into["sum"] += hist["sum"]
+                into["count"] += hist["count"]
+    return merged
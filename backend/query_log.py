@@ -0,0 +1,294 @@
+# query_log.py
+# Per-statement timing and slow-query log for the backend's SQL
+#
+# db_connection() hands routes a TimedConnection. Its cursors time each
+# statement in three phases:
+#
+#   connect  - waiting for / opening the pooled connection (charged to the
+#              first statement run on it)
+#   execute  - cursor.execute() / executemany() until SQL Server answers
+#   fetch    - fetchone/fetchmany/fetchall until the statement is done
+#
+# Every statement is aggregated under its normalized text. Executions slower
+# than the threshold are logged with their parameters redacted to type and
+# length, and kept in a rolling list for GET /slow_queries. So are statements
+# that raised (e.g. a query timeout), flagged with their error. A statement
+# is recorded when its cursor runs the next one or is closed, when it fails,
+# or at the latest when the connection goes back to the pool.
+
+import re
+import threading
+import time
+from collections import deque
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_RUN = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+|\?(?:\s*,\s*\?)+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse whitespace and runs of placeholders, so batch statements built
+    for different sizes ("IN (?, ?, ?)", "VALUES (?), (?)") share one entry.
+    """
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_RUN.sub(lambda m: "(?), ..." if m.group(0).startswith("(") else "?, ...", sql)
+
+
+def redact(params) -> list:
+    """Parameter shapes without values, e.g. ['str(14)', 'int', 'NULL']."""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        params = list(params.values())
+    shapes = []
+    for value in params:
+        if value is None:
+            shapes.append("NULL")
+        elif isinstance(value, (str, bytes)):
+            shapes.append(f"{type(value).__name__}({len(value)})")
+        else:
+            shapes.append(type(value).__name__)
+    if len(shapes) > 10:
+        shapes = shapes[:10] + [f"... {len(shapes) - 10} more"]
+    return shapes
+
+
+class _StatementStats:
+    __slots__ = ("count", "slow", "errors", "rows", "connect", "execute", "fetch", "max_total")
+
+    def __init__(self):
+        self.count = 0
+        self.slow = 0
+        self.errors = 0
+        self.rows = 0
+        self.connect = 0.0
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.max_total = 0.0
+
+
+class QueryLog:
+    """
+    Args:
+        threshold_ms: Statements taking longer than this (all phases) are logged
+        keep: Slow executions (and failed ones) kept for /slow_queries
+        window: Seconds a slow or failed execution stays visible in slowest() / failed()
+    """
+
+    def __init__(self, threshold_ms: float = 250, keep: int = 500, window: float = 3600):
+        self.threshold_ms = threshold_ms
+        self.window = window
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = deque(maxlen=keep)
+        self._failed = deque(maxlen=keep)
+
+    def record(self, sql, params, connect_s, execute_s, fetch_s, rows, route=None, batch=1, error=None):
+        """error: what the statement raised, if it failed."""
+        total = connect_s + execute_s + fetch_s
+        key = normalize_sql(sql)
+        slow = total * 1000 >= self.threshold_ms
+
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = _StatementStats()
+            stats.count += 1
+            stats.rows += rows
+            stats.connect += connect_s
+            stats.execute += execute_s
+            stats.fetch += fetch_s
+            stats.max_total = max(stats.max_total, total)
+            if slow or error:
+                entry = {
+                    "at": time.time(),
+                    "route": route,
+                    "sql": key,
+                    "params": redact(params),
+                    "batch": batch,
+                    "rows": rows,
+                    "total_ms": round(total * 1000, 1),
+                    "connect_ms": round(connect_s * 1000, 1),
+                    "execute_ms": round(execute_s * 1000, 1),
+                    "fetch_ms": round(fetch_s * 1000, 1),
+                    "error": error,
+                }
+            if slow:
+                stats.slow += 1
+                self._slow.append(entry)
+            if error:
+                stats.errors += 1
+                self._failed.append(entry)
+
+        if error:
+            print(f"[API] Failed query after {entry['total_ms']} ms on {route or '-'}: {key[:160]} "
+                  f"params={entry['params']}: {error}")
+        elif slow:
+            print(f"[API] Slow query {entry['total_ms']} ms "
+                  f"(connect {entry['connect_ms']} / execute {entry['execute_ms']} / fetch {entry['fetch_ms']}) "
+                  f"on {route or '-'}: {key[:160]} params={entry['params']}")
+
+    def slowest(self, top: int = 20) -> list:
+        """The top slow executions within the rolling window, slowest first."""
+        cutoff = time.time() - self.window
+        with self._lock:
+            recent = [e for e in self._slow if e["at"] >= cutoff]
+        recent.sort(key=lambda e: e["total_ms"], reverse=True)
+        return recent[:top]
+
+    def failed(self, top: int = 20) -> list:
+        """The most recent failed executions within the rolling window, newest first."""
+        cutoff = time.time() - self.window
+        with self._lock:
+            recent = [e for e in self._failed if e["at"] >= cutoff]
+        return recent[::-1][:top]
+
+    def statements(self) -> list:
+        """Per-statement totals, most total time first."""
+        with self._lock:
+            rows = [
+                {
+                    "sql": key,
+                    "count": s.count,
+                    "slow": s.slow,
+                    "errors": s.errors,
+                    "rows": s.rows,
+                    "total_ms": round((s.connect + s.execute + s.fetch) * 1000, 1),
+                    "avg_ms": round((s.connect + s.execute + s.fetch) * 1000 / s.count, 2),
+                    "max_ms": round(s.max_total * 1000, 1),
+                    "connect_ms": round(s.connect * 1000, 1),
+                    "execute_ms": round(s.execute * 1000, 1),
+                    "fetch_ms": round(s.fetch * 1000, 1),
+                }
+                for key, s in self._statements.items()
+            ]
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "statements": len(self._statements),
+                "executions": sum(s.count for s in self._statements.values()),
+                "slow": sum(s.slow for s in self._statements.values()),
+                "errors": sum(s.errors for s in self._statements.values()),
+                "threshold_ms": self.threshold_ms,
+            }
+
+
+class TimedConnection:
+    """Wraps a pooled DB-API connection so its cursors report to a QueryLog."""
+
+    def __init__(self, conn, log, connect_seconds=0.0, route=None):
+        self._conn = conn
+        self._log = log
+        self._route = route
+        self._connect_seconds = connect_seconds
+        self._cursors = []
+
+    def cursor(self):
+        cursor = TimedCursor(self._conn.cursor(), self)
+        self._cursors.append(cursor)
+        return cursor
+
+    def finish(self):
+        """Record statements whose cursor was never closed (e.g. the route raised); call on release."""
+        cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            cursor._finish()
+
+    def take_connect_seconds(self) -> float:
+        """The checkout time, reported once with the first statement."""
+        seconds, self._connect_seconds = self._connect_seconds, 0.0
+        return seconds
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TimedCursor:
+    """Cursor proxy timing execute and fetch per statement."""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._current = None
+
+    def execute(self, sql, *params):
+        self._finish()
+        connect = self._connection.take_connect_seconds()
+        shown = params[0] if len(params) == 1 and isinstance(params[0], (list, tuple, dict)) else params
+        start = time.perf_counter()
+        try:
+            # Pass arguments through as given; pyodbc accepts a sequence or varargs
+            result = self._cursor.execute(sql, *params)
+        except Exception as e:
+            self._current = [sql, shown, connect, time.perf_counter() - start, 0.0, 0, 1, _describe(e)]
+            self._finish()
+            raise
+        self._current = [sql, shown, connect, time.perf_counter() - start, 0.0, 0, 1, None]
+        return self if result is self._cursor else result
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        seq_of_params = list(seq_of_params)
+        connect = self._connection.take_connect_seconds()
+        first = seq_of_params[0] if seq_of_params else ()
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_params)
+        except Exception as e:
+            self._current = [sql, first, connect, time.perf_counter() - start, 0.0, 0, len(seq_of_params), _describe(e)]
+            self._finish()
+            raise
+        self._current = [sql, first, connect, time.perf_counter() - start, 0.0, 0, len(seq_of_params), None]
+
+    def fetchone(self):
+        return self._timed_fetch(self._cursor.fetchone, lambda row: 0 if row is None else 1)
+
+    def fetchmany(self, size=1):
+        return self._timed_fetch(lambda: self._cursor.fetchmany(size), len)
+
+    def fetchall(self):
+        return self._timed_fetch(self._cursor.fetchall, len)
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # Driver options like fast_executemany go to the real cursor
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+    def _timed_fetch(self, fetch, count):
+        start = time.perf_counter()
+        try:
+            result = fetch()
+        except Exception as e:
+            if self._current is not None:
+                self._current[4] += time.perf_counter() - start
+                self._current[7] = _describe(e)
+                self._finish()
+            raise
+        if self._current is not None:
+            self._current[4] += time.perf_counter() - start
+            self._current[5] += count(result)
+        return result
+
+    def _finish(self):
+        if self._current is None:
+            return
+        sql, params, connect, execute, fetch, rows, batch, error = self._current
+        self._current = None
+        self._connection._log.record(sql, params, connect, execute, fetch, rows,
+                                     route=self._connection._route, batch=batch, error=error)
+
+
+def _describe(error) -> str:
+    return f"{type(error).__name__}: {error}"[:300]
@@ -0,0 +1,114 @@
+# server.py
+# Production WSGI serving for the backend API (waitress)
+#
+# Flask's development server handles requests on whatever threads it spawns
+# with no limits, no keep-alive tuning and no way to drain on shutdown. This
+# wraps waitress with:
+#   - a fixed pool of worker threads (one slow SQL call only ties up one)
+#   - HTTP/1.1 keep-alive, with idle connections closed after channel_timeout
+#   - a cap on open connections (connection_limit) plus the listen backlog.
+#     Waitress handles one request per connection at a time, so
+#     connection_limit also bounds the number of queued requests.
+#   - graceful drain: stop accepting, let in-flight requests finish, then exit
+#   - serving on an already bound socket, so several worker processes can
+#     share one port (see cluster.py)
+
+import threading
+import time
+
+from waitress import wasyncore
+from waitress.server import create_server
+
+
+class APIServer:
+    """
+    Multi-threaded waitress server around a WSGI app.
+
+    Args:
+        app: WSGI application
+        host, port: Listen address
+        threads: Worker threads handling requests concurrently
+        connection_limit: Max open client connections; new ones wait in the backlog
+        backlog: Listen backlog for connections waiting to be accepted
+        channel_timeout: Seconds an idle keep-alive connection stays open
+        sock: Already bound listening socket to serve on instead of host/port
+    """
+
+    def __init__(
+        self,
+        app,
+        host: str = "0.0.0.0",
+        port: int = 5000,
+        threads: int = 16,
+        connection_limit: int = 200,
+        backlog: int = 128,
+        channel_timeout: int = 60,
+        sock=None,
+    ):
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.connection_limit = connection_limit
+        self.backlog = backlog
+        self.channel_timeout = channel_timeout
+        if sock is not None:
+            listen = {"sockets": [sock]}
+            self.host, self.port = sock.getsockname()[:2]
+        else:
+            listen = {"host": host, "port": port}
+        self._server = create_server(
+            app,
+            **listen,
+            threads=threads,
+            connection_limit=connection_limit,
+            backlog=backlog,
+            channel_timeout=channel_timeout,
+            ident="BrowserControlAPI",
+        )
+        # Port 0 asks the OS for a free port; report the one actually bound
+        self.port = self._server.effective_port
+        self._thread = None
+
+    def start(self):
+        """Start serving on a background thread."""
+        self._thread = threading.Thread(target=self._server.run, name="api-server", daemon=True)
+        self._thread.start()
+
+    def describe(self) -> str:
+        """One-line summary of the effective concurrency settings for startup logs."""
+        return (
+            f"listening on {self.host}:{self.port} with {self.threads} worker threads, "
+            f"up to {self.connection_limit} open connections (backlog {self.backlog}), "
+            f"keep-alive idle timeout {self.channel_timeout}s"
+        )
+
+    def in_flight(self) -> int:
+        """Requests currently being handled or waiting for a worker thread."""
+        dispatcher = self._server.task_dispatcher
+        with dispatcher.lock:
+            return dispatcher.active_count + len(dispatcher.queue)
+
+    def shutdown(self, timeout: float = 10.0) -> bool:
+        """
+        Stop accepting connections and wait for in-flight requests to finish.
+
+        Returns:
+            True if everything drained within the timeout
+        """
+        # The listening socket belongs to the event loop thread, so close it there
+        self._server.trigger.pull_trigger(self._stop_accepting)
+
+        deadline = time.monotonic() + timeout
+        drained = False
+        while time.monotonic() < deadline:
+            if self.in_flight() == 0:
+                drained = True
+                break
+            time.sleep(0.05)
+
+        self._server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+        return drained
+
+    def _stop_accepting(self):
+        self._server.accepting = False
+        wasyncore.dispatcher.close(self._server)
@@ -0,0 +1,86 @@
+# settings_changes.py
+# Version counter and change log for USER_PROFILE settings (delta sync)
+
+import threading
+import uuid
+
+
+class SettingsChangeLog:
+    """
+    Tracks which users' settings changed, stamped with a monotonic version.
+
+    Clients remember the (epoch, version) pair of their last sync and ask only
+    for users changed after that version. Only the latest change per user is
+    kept, so memory is bounded by the number of users, not the number of
+    updates.
+
+    The counter lives in memory, so each service start gets a fresh epoch.
+    A client with a different epoch can't trust its version number and must
+    take a full snapshot instead.
+
+    A user whose settings were removed is recorded with settings None.
+
+    In cluster mode every worker takes its versions from one SharedSequence
+    (see use_sequence) and records the other workers' changes under the
+    version they were given, so a client may sync against any worker.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._version = 0
+        self._floor = 0         # Versions up to this were stamped before this log started
+        self._sequence = None
+        self._changes = {}   # username -> (version, settings)
+        self._lock = threading.Lock()
+
+    def use_sequence(self, sequence):
+        """Take the epoch and versions from a cluster-wide SharedSequence."""
+        with self._lock:
+            self.epoch = sequence.epoch
+            self._sequence = sequence
+            # A restarted worker never saw the changes before it started
+            self._version = self._floor = sequence.current
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def record(self, username: str, settings, version: int = None) -> int:
+        """
+        Record a user's new settings (None if removed) and return the version
+        it was stamped with. version is given for a change another worker stamped.
+        """
+        with self._lock:
+            if version is None:
+                version = self._sequence.next() if self._sequence is not None else self._version + 1
+            self._version = max(self._version, version)
+            # Another worker's change can arrive after a newer one made here
+            current = self._changes.get(username)
+            if current is None or current[0] < version:
+                self._changes[username] = (version, dict(settings) if settings is not None else None)
+            return version
+
+    def version_of(self, username: str):
+        """Version of the latest change recorded for username, or None."""
+        with self._lock:
+            current = self._changes.get(username)
+            return current[0] if current is not None else None
+
+    def changes_since(self, epoch: str, version: int):
+        """
+        Collect settings changed after `version`.
+
+        Returns:
+            tuple: (current_version, {username: settings or None if removed}),
+            or None if the caller's epoch/version can't be served as a delta
+        """
+        with self._lock:
+            if epoch != self.epoch or version < self._floor or version > self._version:
+                return None
+            changed = {
+                username: dict(settings) if settings is not None else None
+                for username, (changed_at, settings) in self._changes.items()
+                if changed_at > version
+            }
+            return self._version, changed
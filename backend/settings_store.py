@@ -0,0 +1,169 @@
+# settings_store.py
+# In-memory copy of every user's USER_PROFILE settings
+#
+# The settings table is tiny (one row per user) and only changes through
+# update_user_settings, so the backend loads it once at startup and answers
+# settings reads from memory. Updates are applied here first and written to
+# SQL Server through the write-behind queue. A periodic refresh picks up
+# edits made outside the API, skipping users whose own update hasn't reached
+# the database yet. Users whose settings disappear from the table are dropped.
+
+import json
+import threading
+import time
+import zlib
+
+
+class SettingsStore:
+    """
+    Args:
+        load_all: Zero-argument callable returning {username: settings} from the database
+        unsettled_keys: Zero-argument callable returning usernames whose update is
+            still queued or being committed; refresh() leaves those alone
+        on_change: Called as on_change(username, settings) for every change found by refresh();
+            settings is None for a user whose settings were removed from the table
+    """
+
+    def __init__(self, load_all, unsettled_keys=lambda: set(), on_change=None):
+        self._load_all = load_all
+        self._unsettled_keys = unsettled_keys
+        self._on_change = on_change
+
+        self._lock = threading.Lock()
+        self._users = {}
+        self._loaded = False
+        self._put_since = None      # Users updated while a refresh query runs
+        self._refresher = None
+        self._stop_refresher = threading.Event()
+
+        self._stats = {
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "external_changes": 0,
+            "hits": 0,
+            "misses": 0,
+        }
+        self._last_refresh = None
+
+    @property
+    def loaded(self) -> bool:
+        """False until the first successful load; callers fall back to SQL until then."""
+        with self._lock:
+            return self._loaded
+
+    def get(self, username):
+        """Settings dict for username, or None if not in the store."""
+        with self._lock:
+            settings = self._users.get(username)
+            self._stats["hits" if settings is not None else "misses"] += 1
+            return dict(settings) if settings is not None else None
+
+    def all(self) -> dict:
+        """Copy of every user's settings."""
+        with self._lock:
+            return {username: dict(settings) for username, settings in self._users.items()}
+
+    def snapshot(self):
+        """
+        (etag, users) taken together. The ETag fingerprints the content, so
+        it stays valid across restarts as long as the settings don't change.
+        """
+        with self._lock:
+            users = {username: dict(settings) for username, settings in self._users.items()}
+        checksum = zlib.crc32(json.dumps(users, sort_keys=True).encode("utf-8"))
+        return f"settings-{len(users)}-{checksum:08x}", users
+
+    def put(self, username, settings):
+        """Apply an update made through the API."""
+        with self._lock:
+            self._users[username] = dict(settings)
+            if self._put_since is not None:
+                self._put_since.add(username)
+
+    def remove(self, username):
+        """Drop a user whose settings another worker's refresh found removed."""
+        with self._lock:
+            self._users.pop(username, None)
+            if self._put_since is not None:
+                self._put_since.add(username)
+
+    def refresh(self) -> int:
+        """
+        Reload from the database and merge in external edits.
+
+        Returns:
+            Number of users whose settings changed or were removed (0 for the initial load)
+        """
+        # Users with an update in the write queue now, or one made while the
+        # query runs, may read back stale from SQL, so their memory copy wins
+        started = time.monotonic()
+        skip = set(self._unsettled_keys())
+        with self._lock:
+            self._put_since = set()
+        try:
+            fresh = self._load_all()
+        except Exception:
+            with self._lock:
+                self._stats["refresh_failures"] += 1
+                self._put_since = None
+            raise
+
+        changed = []
+        with self._lock:
+            skip |= self._put_since
+            self._put_since = None
+            for username, settings in fresh.items():
+                if username in skip or self._users.get(username) == settings:
+                    continue
+                self._users[username] = dict(settings)
+                changed.append((username, settings))
+            # Rows deleted or nulled outside the API
+            for username in [u for u in self._users if u not in fresh and u not in skip]:
+                del self._users[username]
+                changed.append((username, None))
+            first_load = not self._loaded
+            self._loaded = True
+            self._stats["refreshes"] += 1
+            if not first_load:
+                self._stats["external_changes"] += len(changed)
+            self._last_refresh = started
+
+        if first_load:
+            print(f"[API] Loaded settings for {len(fresh)} users into memory")
+            return 0
+        if self._on_change:
+            for username, settings in changed:
+                self._on_change(username, settings)
+        return len(changed)
+
+    def start_refresher(self, interval: float):
+        """Refresh every interval seconds on a daemon thread; the first run loads the store."""
+        if self._refresher and self._refresher.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    changed = self.refresh()
+                    if changed:
+                        print(f"[API] Picked up {changed} external user settings change(s)")
+                except Exception as e:
+                    print(f"[API] User settings refresh failed: {e}")
+                if self._stop_refresher.wait(interval):
+                    return
+
+        self._refresher = threading.Thread(target=run, name="settings-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop_refresher.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["loaded"] = self._loaded
+            snapshot["users"] = len(self._users)
+            snapshot["seconds_since_refresh"] = (
+                round(time.monotonic() - self._last_refresh, 1) if self._last_refresh else 0
+            )
+        return snapshot
@@ -0,0 +1,85 @@
+# single_flight.py
+# Request coalescing: identical concurrent reads share one execution
+#
+# When a pallet shows up, several stations tend to look up the same tote or
+# GTIN within the same few milliseconds. Instead of each request opening a
+# connection and running the same query, the first caller for a key runs it
+# and everyone else arriving while it is in flight waits for that result.
+
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    Only calls that overlap in time are merged; nothing is cached once the
+    leader finishes. Only use it for reads: every waiter gets the same result
+    object (or the same exception) and must not mutate it.
+
+    Example:
+        inflight = SingleFlight()
+        row = inflight.do(("arrive", tote), lambda: run_query(tote))
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._max_waiters = 0
+
+    def do(self, key, fn):
+        """Run fn() for this key, or wait for an identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                self._max_waiters = max(self._max_waiters, call.waiters)
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Snapshot of coalescing counters."""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "errors": self._errors,
+                "max_waiters": self._max_waiters,
+            }
@@ -0,0 +1,95 @@
+# sites.py
+# Site-aware routing: one backend serving several buildings (SQL Server instances)
+#
+# Every request is routed to a site. Each site has its own circuit breaker,
+# connection pool, GTIN lookup cache, request coalescing and admission
+# limits, so a slow or unreachable database in one building never takes
+# connections, cache space or request slots from another.
+#
+# The site comes from, in order:
+#   1. an explicit site key (X-Site header, "site" query arg or JSON field)
+#   2. the department (JSON "department" field or X-Department header),
+#      matched against department prefixes configured per site
+#   3. the default site
+#
+#     router = SiteRouter({"main": main_site, "b2": b2_site}, default="main",
+#                         department_prefixes={"B2.": "b2"})
+#     site = router.resolve(site_key, department)
+
+
+class UnknownSite(Exception):
+    """Raised when a request names a site this backend doesn't serve."""
+
+
+class Site:
+    """Per-site state. Built by the app, which owns the configuration."""
+
+    __slots__ = ("key", "server", "database", "breaker", "pool", "lp_cache", "inflight", "admission")
+
+    def __init__(self, key, server, database, breaker, pool, lp_cache, inflight, admission):
+        self.key = key
+        self.server = server
+        self.database = database
+        self.breaker = breaker
+        self.pool = pool
+        self.lp_cache = lp_cache
+        self.inflight = inflight
+        self.admission = admission
+
+    def stats(self) -> dict:
+        return {
+            "server": self.server,
+            "database": self.database,
+            "admission": {**self.admission.stats(), "throttled_clients": self.admission.client_stats()},
+            "pool": self.pool.stats(),
+            "breaker": self.breaker.stats(),
+            "lp_cache": self.lp_cache.stats(),
+            "coalescing": self.inflight.stats(),
+        }
+
+
+class SiteRouter:
+    """
+    Args:
+        sites: {site_key: Site}
+        default: Key of the site used when a request names none
+        department_prefixes: {department prefix: site_key}; the longest match wins
+    """
+
+    def __init__(self, sites: dict, default: str, department_prefixes: dict = None):
+        if default not in sites:
+            raise ValueError(f"Default site {default!r} is not configured")
+        for prefix, key in (department_prefixes or {}).items():
+            if key not in sites:
+                raise ValueError(f"Department prefix {prefix!r} maps to unknown site {key!r}")
+        self._sites = dict(sites)
+        self.default = default
+        # Longest prefix first, so "DECANT.B2" beats "DECANT."
+        self._prefixes = sorted((department_prefixes or {}).items(), key=lambda item: -len(item[0]))
+
+    @property
+    def home(self) -> Site:
+        """The default site."""
+        return self._sites[self.default]
+
+    def get(self, key: str) -> Site:
+        site = self._sites.get(key)
+        if site is None:
+            raise UnknownSite(f"Unknown site {key!r} (configured: {', '.join(sorted(self._sites))})")
+        return site
+
+    def resolve(self, site_key: str = None, department: str = None) -> Site:
+        """Site for a request; raises UnknownSite for a site key that isn't configured."""
+        if site_key:
+            return self.get(site_key)
+        if department:
+            for prefix, key in self._prefixes:
+                if department.startswith(prefix):
+                    return self._sites[key]
+        return self.home
+
+    def __iter__(self):
+        return iter(self._sites.values())
+
+    def __len__(self):
+        return len(self._sites)
@@ -0,0 +1,7 @@
+# conftest.py
+# The backend modules are flat, imported by name from backend/ (as app.py does)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+# test_admission.py
+# AdmissionController per-client and global limits
+
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_per_client_limit_rejects_and_release_frees_slot():
+    admission = AdmissionController(max_in_flight=10, per_client_limit=2)
+    admission.acquire("10.0.0.1")
+    admission.acquire("10.0.0.1")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("10.0.0.1")
+    assert rejected.value.reason == "client_limit"
+    admission.acquire("10.0.0.2")   # Other clients are unaffected
+
+    admission.release("10.0.0.1")
+    admission.acquire("10.0.0.1")
+    assert admission.stats()["rejected_client_limit"] == 1
+
+
+def test_per_client_limit_holds_when_client_table_is_full():
+    admission = AdmissionController(max_in_flight=10, per_client_limit=1, max_tracked_clients=1)
+    admission.acquire("10.0.0.1")
+    admission.release("10.0.0.1")
+    admission.acquire("10.0.0.2")
+    with pytest.raises(AdmissionRejected):
+        admission.acquire("10.0.0.2")
+
+    admission.release("10.0.0.2")
+    stats = admission.stats()
+    assert stats["in_flight"] == 0
+    assert stats["clients"] <= 2
+
+
+def test_queue_full_and_queue_timeout():
+    admission = AdmissionController(max_in_flight=1, per_client_limit=5, max_queue=1, queue_timeout=0.1)
+    admission.acquire("a")
+
+    waiting = threading.Event()
+    errors = []
+
+    def wait_for_slot():
+        waiting.set()
+        try:
+            admission.acquire("b")
+        except AdmissionRejected as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    waiting.wait()
+    while admission.stats()["waiting"] == 0 and waiter.is_alive():
+        time.sleep(0.005)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("c")
+    assert rejected.value.reason == "queue_full"
+
+    waiter.join()
+    assert errors and errors[0].reason == "queue_timeout"
+
+
+def test_queued_request_gets_released_slot():
+    admission = AdmissionController(max_in_flight=1, per_client_limit=5, queue_timeout=2)
+    admission.acquire("a")
+    threading.Timer(0.05, admission.release, args=("a",)).start()
+    admission.acquire("b")
+    stats = admission.stats()
+    assert stats["admitted"] == 2 and stats["queued"] == 1 and stats["in_flight"] == 1
@@ -0,0 +1,84 @@
+# test_circuit_breaker.py
+# CircuitBreaker tripping, fast-fail and recovery through the probe
+
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Database:
+    """Connect callable that fails while down is set."""
+
+    def __init__(self):
+        self.down = False
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if self.down:
+            raise ConnectionError("login timeout")
+        return "connection"
+
+
+def wait_for_state(breaker, state, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while breaker.state != state and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return breaker.state
+
+
+def test_success_resets_failure_count():
+    db = Database()
+    breaker = CircuitBreaker(db.connect, failure_threshold=2, reset_timeout=60)
+    connect = breaker.guard(db.connect)
+    db.down = True
+    with pytest.raises(ConnectionError):
+        connect()
+    db.down = False
+    assert connect() == "connection"
+    db.down = True
+    with pytest.raises(ConnectionError):
+        connect()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_trips_after_threshold_and_fails_fast():
+    db = Database()
+    breaker = CircuitBreaker(db.connect, failure_threshold=3, reset_timeout=60)
+    connect = breaker.guard(db.connect)
+    db.down = True
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            connect()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        connect()
+    assert db.connects == 3     # Refused without touching the database
+    assert rejected.value.retry_after >= 1
+    stats = breaker.stats()
+    assert stats["trips"] == 1 and stats["rejected"] == 1
+    assert "login timeout" in stats["last_error"]
+
+
+def test_probe_closes_breaker_once_database_is_back():
+    db = Database()
+    breaker = CircuitBreaker(db.connect, failure_threshold=1, reset_timeout=0.05)
+    connect = breaker.guard(db.connect)
+    db.down = True
+    with pytest.raises(ConnectionError):
+        connect()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Probes keep failing while the database is down
+    time.sleep(0.15)
+    assert breaker.state in (CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+    with pytest.raises(CircuitOpenError):
+        connect()
+
+    db.down = False
+    assert wait_for_state(breaker, CircuitBreaker.CLOSED) == CircuitBreaker.CLOSED
+    assert connect() == "connection"
+    assert breaker.stats()["consecutive_failures"] == 0
@@ -0,0 +1,74 @@
+# test_cluster.py
+# SharedSequence and a small Supervisor run with real worker processes
+
+import multiprocessing
+import queue
+import signal
+import threading
+
+from cluster import SharedSequence, Supervisor, WorkerLink
+
+
+def test_shared_sequence_counts_across_processes():
+    ctx = multiprocessing.get_context("spawn")
+    sequence = SharedSequence(ctx)
+    workers = [ctx.Process(target=_take_numbers, args=(sequence, 50)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    assert sequence.current == 150
+    assert sequence.next() == 151
+
+
+def _take_numbers(sequence, count):
+    for _ in range(count):
+        sequence.next()
+
+
+def _worker(sock, worker_id, conn, sequences, results):
+    """Worker target: reports its epoch and a number, and relays a broadcast."""
+    link = WorkerLink(worker_id, conn, report=lambda: {"worker": worker_id}, report_interval=0.1)
+    link.on("hello", lambda payload: results.put(("hello", worker_id, payload)))
+    link.start()
+    ids = sequences["ids"]
+    results.put(("number", worker_id, ids.epoch, ids.next()))
+    if worker_id == 0:
+        link.broadcast("hello", {"from": 0})
+    link.stopped.wait(30)
+    results.put(("stopped", worker_id))
+
+
+def test_supervisor_shares_sequences_and_relays_broadcasts():
+    results = multiprocessing.get_context("spawn").Queue()
+    supervisor = Supervisor(_worker, workers=2, host="127.0.0.1", port=0, args=(results,),
+                            stop_timeout=10, sequences=("ids",))
+    seen = []
+
+    def collect():
+        # Stop once both workers numbered and worker 1 got the broadcast
+        while True:
+            try:
+                message = results.get(timeout=20)
+            except queue.Empty:
+                break
+            seen.append(message)
+            if len([m for m in seen if m[0] == "number"]) == 2 and any(m[0] == "hello" for m in seen):
+                break
+        supervisor.stop()
+
+    collector = threading.Thread(target=collect, daemon=True)
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        collector.start()
+        supervisor.run()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    collector.join(5)
+
+    numbers = [m for m in seen if m[0] == "number"]
+    assert {m[1] for m in numbers} == {0, 1}
+    assert {m[2] for m in numbers} == {supervisor.sequences["ids"].epoch}
+    assert sorted(m[3] for m in numbers) == [1, 2]
+    # Relayed to the other worker only
+    assert [m[1:] for m in seen if m[0] == "hello"] == [(1, {"from": 0})]
@@ -0,0 +1,190 @@
+# test_db_pool.py
+# ConnectionPool against real sqlite3 connections
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+def sqlite_connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class BrokenRollback:
+    """sqlite3 connection whose rollback fails, like a dropped network session."""
+
+    def __init__(self):
+        self.conn = sqlite_connect()
+        self.closed = False
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def rollback(self):
+        raise sqlite3.OperationalError("connection lost")
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+def test_connection_is_reused():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=2)
+    with pool.connection() as first:
+        first.execute("SELECT 1")
+    with pool.connection() as second:
+        pass
+    assert first is second
+    stats = pool.stats()
+    assert stats["connections_created"] == 1
+    assert stats["acquired"] == 2
+    assert stats["idle"] == 1 and stats["in_use"] == 0
+
+
+def test_acquire_times_out_when_pool_is_exhausted():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=1, acquire_timeout=0.1)
+    with pool.connection():
+        started = time.monotonic()
+        with pytest.raises(PoolTimeoutError):
+            with pool.connection():
+                pass
+        assert time.monotonic() - started >= 0.1
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["waited"] == 1
+    assert stats["size"] == 1
+
+
+def test_waiter_gets_connection_released_by_another_thread():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=1, acquire_timeout=2)
+    checked_out = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            checked_out.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    checked_out.wait()
+    threading.Timer(0.05, release.set).start()
+    with pool.connection() as conn:
+        conn.execute("SELECT 1")
+    holder.join()
+    assert pool.stats()["connections_created"] == 1
+
+
+def test_failed_block_rolls_back_and_keeps_connection():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=1)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("handler failed")
+    with pool.connection() as again:
+        assert again is conn
+        assert again.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+
+
+def test_connection_is_discarded_when_rollback_fails():
+    opened = []
+
+    def connect():
+        opened.append(BrokenRollback())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("handler failed")
+    assert opened[0].closed
+    stats = pool.stats()
+    assert stats["size"] == 0 and stats["idle"] == 0
+    assert stats["connections_closed"] == 1
+
+    # The freed slot is usable again with a fresh connection
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+
+def test_prewarm_opens_min_size_and_tolerates_connect_failures():
+    pool = ConnectionPool(sqlite_connect, min_size=3, max_size=5)
+    assert pool.prewarm() == 3
+    assert pool.prewarm() == 0
+    assert pool.stats()["idle"] == 3
+
+    def refuse():
+        raise sqlite3.OperationalError("server unavailable")
+
+    down = ConnectionPool(refuse, min_size=2, max_size=2)
+    assert down.prewarm() == 0
+    stats = down.stats()
+    assert stats["connect_failures"] == 1
+    assert stats["size"] == 0
+
+
+def test_reap_retires_idle_connections_above_min_size():
+    pool = ConnectionPool(sqlite_connect, min_size=1, max_size=3, idle_timeout=0.05)
+    pool.prewarm()
+    with pool.connection():
+        with pool.connection():
+            pass
+    assert pool.stats()["idle"] == 2
+    time.sleep(0.1)
+    assert pool.reap() == 1
+    stats = pool.stats()
+    assert stats["size"] == 1 and stats["idle"] == 1
+
+
+def test_reap_replaces_connections_past_max_lifetime():
+    pool = ConnectionPool(sqlite_connect, min_size=2, max_size=2, max_lifetime=0.05)
+    pool.prewarm()
+    time.sleep(0.1)
+    assert pool.reap() == 2
+    stats = pool.stats()
+    # Topped back up to min_size with new connections
+    assert stats["idle"] == 2
+    assert stats["connections_created"] == 4
+    assert stats["connections_closed"] == 2
+
+
+def test_reaper_thread_runs_until_close():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=2, idle_timeout=0.02)
+    with pool.connection():
+        pass
+    pool.start_reaper(interval=0.02)
+    deadline = time.monotonic() + 2
+    while pool.stats()["size"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()["size"] == 0
+    pool.close()
+    pool._reaper.join(1)
+    assert not pool._reaper.is_alive()
+
+
+def test_stale_connection_fails_validation_and_is_replaced():
+    pool = ConnectionPool(sqlite_connect, min_size=0, max_size=1, validate_after=0)
+    with pool.connection() as first:
+        pass
+    first.close()   # Ping on the next checkout fails
+    with pool.connection() as second:
+        assert second is not first
+        second.execute("SELECT 1")
+    assert pool.stats()["validation_failures"] == 1
+
+
+def test_closed_pool_refuses_checkouts():
+    pool = ConnectionPool(sqlite_connect, min_size=1, max_size=1)
+    pool.prewarm()
+    pool.close()
+    assert pool.stats()["size"] == 0
+    with pytest.raises(PoolTimeoutError):
+        with pool.connection():
+            pass
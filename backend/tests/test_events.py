@@ -0,0 +1,96 @@
+# test_events.py
+# EventBroker delivery, Last-Event-ID replay and resync
+
+import pytest
+
+from cluster import SharedSequence
+from events import CLOSED, EventBroker, TooManySubscribers
+
+
+def test_publish_reaches_subscribers_of_the_site():
+    broker = EventBroker()
+    everyone = broker.subscribe()
+    building_a = broker.subscribe(site="A")
+    building_b = broker.subscribe(site="B")
+
+    broker.publish("arrival", {"containers": {"P1": 4}}, site="A")
+    broker.publish("settings", {"username": "jdoe"})
+
+    assert [everyone.get(0).type, everyone.get(0).type] == ["arrival", "settings"]
+    assert building_a.get(0).type == "arrival"
+    assert building_b.get(0).type == "settings"
+    assert building_b.get(0) is None
+
+
+def test_reconnect_replays_missed_events():
+    broker = EventBroker()
+    first = broker.publish("settings", {"username": "jdoe"})
+    broker.publish("arrival", {"containers": {"P1": 4}})
+    broker.publish("settings", {"username": "asmith"})
+
+    sub = broker.subscribe(first)
+    assert [e.data for e in sub.replay] == [{"containers": {"P1": 4}}, {"username": "asmith"}]
+    assert broker.subscribe(broker.stats()["last_event_id"]).replay == []
+
+
+def test_unknown_or_too_old_id_gets_resync():
+    broker = EventBroker(history=2)
+    first = broker.publish("settings", {"username": "jdoe"})
+    for _ in range(3):
+        broker.publish("settings", {"username": "asmith"})
+
+    assert [e.type for e in broker.subscribe(first).replay] == ["resync"]
+    assert [e.type for e in broker.subscribe("otherepoch-1").replay] == ["resync"]
+    assert [e.type for e in broker.subscribe(f"{broker.epoch}-99").replay] == ["resync"]
+    assert broker.stats()["resyncs"] == 3
+
+
+def test_slow_subscriber_is_disconnected():
+    broker = EventBroker(queue_size=2)
+    slow = broker.subscribe()
+    for n in range(3):
+        broker.publish("settings", {"n": n})
+    assert broker.stats()["dropped_slow"] == 1
+    assert broker.stats()["subscribers"] == 0
+    events = [slow.get(0) for _ in range(2)]
+    assert CLOSED in events
+
+
+def test_subscriber_limit_and_close():
+    broker = EventBroker(max_subscribers=1)
+    sub = broker.subscribe()
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe()
+    broker.close()
+    assert sub.get(0) is CLOSED
+
+
+def test_workers_share_ids_and_accept_late_events():
+    sequence = SharedSequence()
+    worker_a, worker_b = EventBroker(), EventBroker()
+    worker_a.use_sequence(sequence)
+    worker_b.use_sequence(sequence)
+
+    first = worker_a.publish("settings", {"n": 1})
+    second = worker_b.publish("settings", {"n": 2})
+    # Each relays its event to the other, here out of order on worker_b
+    worker_a.publish("settings", {"n": 2}, event_id=second)
+    worker_b.publish("settings", {"n": 1}, event_id=first)
+
+    for broker in (worker_a, worker_b):
+        assert [e.data["n"] for e in broker.subscribe(f"{sequence.epoch}-0").replay] == [1, 2]
+        assert [e.data["n"] for e in broker.subscribe(first).replay] == [2]
+
+
+def test_restarted_worker_resyncs_ids_from_before_it_started():
+    sequence = SharedSequence()
+    broker = EventBroker()
+    broker.use_sequence(sequence)
+    old = broker.publish("settings", {"n": 1})
+    latest = broker.publish("settings", {"n": 2})
+
+    restarted = EventBroker()
+    restarted.use_sequence(sequence)
+    # It never saw event 2, so a client that only saw event 1 must reload
+    assert [e.type for e in restarted.subscribe(old).replay] == ["resync"]
+    assert restarted.subscribe(latest).replay == []
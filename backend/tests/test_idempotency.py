@@ -0,0 +1,66 @@
+# test_idempotency.py
+# IdempotencyStore: one execution per key, replays of kept responses
+
+import threading
+
+from idempotency import IdempotencyStore
+
+
+def ok(body=b"{}"):
+    return 200, body, [("Content-Type", "application/json")]
+
+
+def test_repeat_gets_first_response_without_running_again():
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    runs = []
+    first, replayed = store.run("k1", lambda: runs.append(1) or ok(b'{"n": 1}'))
+    assert not replayed
+    again, replayed = store.run("k1", lambda: runs.append(1) or ok(b'{"n": 2}'))
+    assert replayed and again == first
+    assert len(runs) == 1
+    assert store.stats()["executed"] == 1 and store.stats()["replayed"] == 1
+
+
+def test_retryable_answers_are_not_kept():
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    store.run("k1", lambda: (503, b"{}", []))
+    store.run("k2", lambda: (429, b"{}", []))
+    response, replayed = store.run("k1", ok)
+    assert not replayed and response[0] == 200
+    assert not store.run("k2", ok)[1]
+
+
+def test_concurrent_repeat_waits_for_first_attempt():
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def slow_write():
+        runs.append(1)
+        started.set()
+        release.wait()
+        return ok()
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run("k1", slow_write)))
+    first.start()
+    started.wait()
+    second = threading.Thread(target=lambda: results.append(store.run("k1", slow_write)))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+    assert len(runs) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True]
+
+
+def test_responses_from_other_workers_are_shared():
+    stored = []
+    worker_a = IdempotencyStore(maxsize=10, ttl=60, on_store=lambda key, response: stored.append((key, response)))
+    worker_b = IdempotencyStore(maxsize=10, ttl=60)
+    worker_a.run("k1", ok)
+    for key, response in stored:
+        worker_b.remember(key, response)
+    response, replayed = worker_b.run("k1", lambda: (500, b"", []))
+    assert replayed and response == ok()
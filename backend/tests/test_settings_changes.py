@@ -0,0 +1,60 @@
+# test_settings_changes.py
+# SettingsChangeLog versions, including the cluster-wide sequence
+
+from cluster import SharedSequence
+from settings_changes import SettingsChangeLog
+
+
+def test_changes_since_returns_newer_changes_only():
+    log = SettingsChangeLog()
+    v1 = log.record("jdoe", {"theme": "dark", "zoom": "100"})
+    v2 = log.record("asmith", {"theme": "light", "zoom": "150"})
+    assert log.changes_since(log.epoch, v1) == (v2, {"asmith": {"theme": "light", "zoom": "150"}})
+    assert log.changes_since(log.epoch, v2) == (v2, {})
+    assert log.changes_since("other-epoch", v1) is None
+    assert log.changes_since(log.epoch, v2 + 1) is None
+
+
+def test_removed_user_is_reported_as_none():
+    log = SettingsChangeLog()
+    log.record("jdoe", {"theme": "dark", "zoom": "100"})
+    version = log.version
+    log.record("jdoe", None)
+    assert log.changes_since(log.epoch, version)[1] == {"jdoe": None}
+
+
+def test_workers_share_one_sequence():
+    sequence = SharedSequence()
+    first, second = SettingsChangeLog(), SettingsChangeLog()
+    first.use_sequence(sequence)
+    second.use_sequence(sequence)
+    assert first.epoch == second.epoch == sequence.epoch
+
+    v1 = first.record("jdoe", {"zoom": "100"})
+    v2 = second.record("asmith", {"zoom": "150"})
+    assert v2 > v1
+    # Each relays its change to the other under the version it was given
+    second.record("jdoe", {"zoom": "100"}, v1)
+    first.record("asmith", {"zoom": "150"}, v2)
+    assert first.changes_since(first.epoch, 0) == second.changes_since(second.epoch, 0)
+
+
+def test_late_relayed_change_does_not_replace_newer_one():
+    log = SettingsChangeLog()
+    newer = log.record("jdoe", {"zoom": "200"}, 7)
+    log.record("jdoe", {"zoom": "100"}, 5)
+    assert log.version_of("jdoe") == newer
+    assert log.changes_since(log.epoch, 0)[1] == {"jdoe": {"zoom": "200"}}
+    assert log.version_of("nobody") is None
+
+
+def test_restarted_worker_rejects_versions_from_before_it_started():
+    sequence = SharedSequence()
+    log = SettingsChangeLog()
+    log.use_sequence(sequence)
+    log.record("jdoe", {"zoom": "100"})
+
+    restarted = SettingsChangeLog()
+    restarted.use_sequence(sequence)
+    assert restarted.changes_since(sequence.epoch, 0) is None
+    assert restarted.changes_since(sequence.epoch, sequence.current) == (sequence.current, {})
@@ -0,0 +1,79 @@
+# test_single_flight.py
+# SingleFlight coalescing of overlapping reads
+
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def _run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_single_flight_coalesces_overlapping_calls():
+    inflight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return ["row"]
+
+    threads, results, errors = _run_concurrently(1, lambda: inflight.do("tote", query))
+    started.wait()
+    more, more_results, _ = _run_concurrently(3, lambda: inflight.do("tote", query))
+    deadline = time.monotonic() + 2
+    while inflight.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads + more:
+        t.join()
+
+    assert len(calls) == 1
+    assert results[0] == ["row"]
+    assert all(r is results[0] for r in more_results)
+    stats = inflight.stats()
+    assert stats["executions"] == 1 and stats["coalesced"] == 3 and stats["in_flight"] == 0
+
+
+def test_single_flight_shares_errors_and_forgets_key():
+    inflight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise RuntimeError("database down")
+
+    threads, _, errors = _run_concurrently(1, lambda: inflight.do("tote", failing))
+    started.wait()
+    more, _, more_errors = _run_concurrently(2, lambda: inflight.do("tote", failing))
+    deadline = time.monotonic() + 2
+    while inflight.stats()["coalesced"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads + more:
+        t.join()
+
+    assert isinstance(errors[0], RuntimeError)
+    assert all(e is errors[0] for e in more_errors)
+    assert inflight.stats()["errors"] == 1
+    # Nothing is cached: the next call runs again
+    assert inflight.do("tote", lambda: "ok") == "ok"
@@ -0,0 +1,48 @@
+# test_ttl_cache.py
+# TTLCache expiry, LRU eviction and stale-fill protection
+
+import time
+
+from ttl_cache import TTLCache
+
+
+def test_cache_entries_expire():
+    cache = TTLCache(maxsize=4, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == (True, 1)
+    time.sleep(0.1)
+    assert cache.get("a") == (False, None)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["expirations"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_skips_set_made_stale_by_invalidation():
+    cache = TTLCache(maxsize=4, ttl=60)
+    generation = cache.generation
+    cache.invalidate_where(lambda key, value: key == "a")
+    cache.set("a", "old rows", generation)
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["stale_skips"] == 1
+
+    cache.set("a", "new rows", cache.generation)
+    assert cache.get("a") == (True, "new rows")
+
+
+def test_cache_invalidate_where_drops_matching_entries():
+    cache = TTLCache(maxsize=8, ttl=60)
+    for key in ("gtin1", "gtin2", "lp1"):
+        cache.set(key, key.upper())
+    assert cache.invalidate_where(lambda key, value: key.startswith("gtin")) == 2
+    assert cache.get("lp1") == (True, "LP1")
+    assert cache.clear() == 1
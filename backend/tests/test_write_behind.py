@@ -0,0 +1,96 @@
+# test_write_behind.py
+# WriteBehindQueue merging, failure requeue and spill across restarts
+
+import threading
+import time
+
+from write_behind import WriteBehindQueue
+
+
+def test_write_behind_merges_updates_per_key():
+    batches = []
+    writes = WriteBehindQueue(batches.append)
+    writes.submit("jdoe", {"theme": "dark", "zoom": "100"})
+    writes.submit("jdoe", {"theme": "light", "zoom": "150"})
+    writes.submit("asmith", {"theme": "dark", "zoom": "100"})
+    assert writes.pending("jdoe") == (True, {"theme": "light", "zoom": "150"})
+
+    assert writes.flush() == 2
+    assert batches == [{
+        "jdoe": {"theme": "light", "zoom": "150"},
+        "asmith": {"theme": "dark", "zoom": "100"},
+    }]
+    stats = writes.stats()
+    assert stats["merged"] == 1 and stats["written"] == 2 and stats["pending"] == 0
+
+
+def test_write_behind_requeues_failed_batch_behind_newer_updates():
+    in_commit = threading.Event()
+    resume = threading.Event()
+    batches = []
+
+    def commit(batch):
+        if not batches:
+            batches.append(None)
+            in_commit.set()
+            resume.wait()
+            raise RuntimeError("database down")
+        batches.append(batch)
+
+    writes = WriteBehindQueue(commit)
+    writes.submit("jdoe", {"zoom": "100"})
+    writes.submit("asmith", {"zoom": "125"})
+    failed = []
+
+    def flush():
+        try:
+            writes.flush()
+        except RuntimeError as e:
+            failed.append(e)
+
+    flusher = threading.Thread(target=flush)
+    flusher.start()
+    in_commit.wait()
+    assert writes.unsettled_keys() == {"jdoe", "asmith"}
+    writes.submit("jdoe", {"zoom": "200"})   # Newer than the batch in flight
+    resume.set()
+    flusher.join()
+
+    assert failed
+    assert writes.pending("jdoe") == (True, {"zoom": "200"})
+    assert writes.pending("asmith") == (True, {"zoom": "125"})
+    assert writes.stats()["flush_failures"] == 1
+
+    assert writes.flush() == 2
+    assert batches[1] == {"jdoe": {"zoom": "200"}, "asmith": {"zoom": "125"}}
+
+
+def test_write_behind_flusher_commits_after_interval():
+    batches = []
+    writes = WriteBehindQueue(batches.append, flush_interval=0.05)
+    writes.start()
+    writes.submit("jdoe", {"zoom": "100"})
+    deadline = time.monotonic() + 2
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [{"jdoe": {"zoom": "100"}}]
+    assert writes.close()
+
+
+def test_write_behind_spills_on_failed_close_and_restores(tmp_path):
+    spill = str(tmp_path / "pending.json")
+
+    def down(batch):
+        raise RuntimeError("database down")
+
+    writes = WriteBehindQueue(down, spill_path=spill)
+    writes.submit("jdoe", {"zoom": "100"})
+    assert writes.close(timeout=0) is False
+
+    batches = []
+    restarted = WriteBehindQueue(batches.append, spill_path=spill)
+    restarted.start()
+    assert restarted.pending("jdoe") == (True, {"zoom": "100"})
+    assert restarted.close()
+    assert batches == [{"jdoe": {"zoom": "100"}}]
+    assert restarted.stats()["restored"] == 1
@@ -0,0 +1,135 @@
+# ttl_cache.py
+# Small thread-safe LRU cache with per-entry expiry for the backend API
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire `ttl` seconds after they were stored.
+
+    Args:
+        maxsize: Maximum number of entries; the least recently used is evicted first
+        ttl: Seconds an entry stays valid
+
+    Example:
+        cache = TTLCache(maxsize=1024, ttl=15)
+        hit, rows = cache.get(("00012345678905", "DECANT.WS.1"))
+        if not hit:
+            generation = cache.generation
+            rows = run_query()
+            cache.set(("00012345678905", "DECANT.WS.1"), rows, generation)
+
+    Passing the generation read before the query makes set() skip a result
+    that an invalidation during the query may have made stale.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 15.0):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._generation = 0
+        self._stale_skips = 0
+
+    def get(self, key):
+        """
+        Look up a key.
+
+        Returns:
+            tuple: (hit, value) - value is None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return True, value
+                del self._data[key]
+                self._expirations += 1
+            self._misses += 1
+            return False, None
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every invalidation."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation: int = None):
+        """
+        Store a value, evicting the least recently used entry if full. With
+        generation, nothing is stored if an invalidation happened since it was read.
+        """
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._stale_skips += 1
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key) -> bool:
+        """Drop one key. Returns True if it was present."""
+        with self._lock:
+            self._generation += 1
+            if self._data.pop(key, None) is not None:
+                self._invalidations += 1
+                return True
+            return False
+
+    def invalidate_where(self, predicate) -> int:
+        """
+        Drop every entry for which predicate(key, value) is true.
+
+        Returns:
+            Number of entries dropped
+        """
+        with self._lock:
+            self._generation += 1
+            doomed = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in doomed:
+                del self._data[key]
+            self._invalidations += len(doomed)
+            return len(doomed)
+
+    def clear(self) -> int:
+        """Drop every entry. Returns the number dropped."""
+        with self._lock:
+            self._generation += 1
+            count = len(self._data)
+            self._data.clear()
+            self._invalidations += count
+            return count
+
+    def stats(self) -> dict:
+        """Snapshot of size and hit/miss counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "stale_skips": self._stale_skips,
+            }
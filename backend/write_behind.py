@@ -0,0 +1,238 @@
+# write_behind.py
+# Write-behind queue that merges pending updates per key and commits in batches
+#
+# Toggling zoom or theme in the client fires one update_user_settings call per
+# change. Instead of one UPDATE round trip each, updates are parked here keyed
+# by username (last write wins) and a background thread commits whatever is
+# pending at most flush_interval seconds after the first write arrived.
+#
+#     writes = WriteBehindQueue(commit_batch, flush_interval=0.5)
+#     writes.start()
+#     writes.submit("jdoe", {"theme": "dark", "zoom": "200"})
+#     ...
+#     writes.close()   # Final flush on shutdown
+#
+# If the final flush fails, pending entries are written to spill_path and
+# queued again by the next start(), so an outage during shutdown loses nothing.
+
+import json
+import os
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """
+    Args:
+        commit: Callable taking {key: value} that writes the batch in one
+            transaction and raises on failure
+        flush_interval: Max seconds an update waits before being committed
+        max_batch: Pending keys that trigger an immediate flush
+        retry_interval: Seconds to wait before retrying a failed flush
+        spill_path: File used to keep unflushed entries across restarts
+        name: Label used in log lines
+    """
+
+    def __init__(
+        self,
+        commit,
+        flush_interval: float = 0.5,
+        max_batch: int = 200,
+        retry_interval: float = 2.0,
+        spill_path: str = None,
+        name: str = "writes",
+    ):
+        self._commit = commit
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retry_interval = retry_interval
+        self.spill_path = spill_path
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()    # One batch in flight at a time
+        self._pending = {}
+        self._in_flight = {}                   # Batch currently being committed
+        self._first_pending_at = None
+        self._retry_at = None
+        self._closed = False
+        self._thread = None
+
+        self._stats = {
+            "submitted": 0,
+            "merged": 0,
+            "flushes": 0,
+            "written": 0,
+            "flush_failures": 0,
+            "spilled": 0,
+            "restored": 0,
+        }
+
+    def start(self):
+        """Re-queue anything spilled by the last shutdown and start the flusher."""
+        self._restore_spill()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, value):
+        """Queue value for key, replacing any update for key not yet committed."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} queue is closed")
+            self._stats["submitted"] += 1
+            if key in self._pending:
+                self._stats["merged"] += 1
+            self._pending[key] = value
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._wake.notify()
+
+    def pending(self, key):
+        """(True, value) if key has an uncommitted update, else (False, None)."""
+        with self._lock:
+            if key in self._pending:
+                return True, self._pending[key]
+            return False, None
+
+    def unsettled_keys(self) -> set:
+        """Keys with an update that is queued or still being committed."""
+        with self._lock:
+            return set(self._pending) | set(self._in_flight)
+
+    def flush(self) -> int:
+        """
+        Commit everything pending now, in the calling thread.
+
+        Returns:
+            Number of entries written. Raises whatever commit raised; failed
+            entries go back in the queue unless a newer update replaced them.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+                self._first_pending_at = None
+            if not batch:
+                return 0
+            try:
+                self._commit(batch)
+            except Exception:
+                with self._lock:
+                    self._in_flight = {}
+                    self._stats["flush_failures"] += 1
+                    # Newer submits made while the batch was in flight win
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    if self._first_pending_at is None:
+                        self._first_pending_at = time.monotonic()
+                raise
+            with self._lock:
+                self._in_flight = {}
+                self._stats["flushes"] += 1
+                self._stats["written"] += len(batch)
+            return len(batch)
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """
+        Stop accepting updates and commit what's left.
+
+        Returns:
+            True if nothing was left uncommitted (entries that could not be
+            written are spilled to disk when spill_path is set)
+        """
+        with self._lock:
+            self._closed = True
+            self._wake.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+        try:
+            self.flush()
+            return True
+        except Exception as e:
+            with self._lock:
+                left = dict(self._pending)
+            print(f"[API] Final {self.name} flush failed for {len(left)} entries: {e}")
+            self._spill(left)
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["pending"] = len(self._pending)
+            snapshot["oldest_pending_seconds"] = (
+                round(time.monotonic() - self._first_pending_at, 3) if self._first_pending_at else 0
+            )
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._pending:
+                        due = self._first_pending_at + self.flush_interval
+                        if self._retry_at is not None:
+                            due = max(due, self._retry_at)
+                        if len(self._pending) >= self.max_batch and self._retry_at is None:
+                            due = now
+                        if now >= due:
+                            break
+                        self._wake.wait(due - now)
+                    else:
+                        self._wake.wait()
+                if self._closed:
+                    return   # close() does the final flush
+
+            try:
+                self.flush()
+                self._retry_at = None
+            except Exception as e:
+                print(f"[API] {self.name} flush failed, retrying in {self.retry_interval}s: {e}")
+                self._retry_at = time.monotonic() + self.retry_interval
+
+    def _spill(self, entries):
+        if not self.spill_path or not entries:
+            return
+        try:
+            existing = self._read_spill()
+            existing.update(entries)
+            tmp_path = self.spill_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(existing, f)
+            os.replace(tmp_path, self.spill_path)
+            with self._lock:
+                self._stats["spilled"] += len(entries)
+            print(f"[API] Saved {len(entries)} unflushed {self.name} to {self.spill_path}")
+        except OSError as e:
+            print(f"[API] Could not save unflushed {self.name}: {e}")
+
+    def _restore_spill(self):
+        entries = self._read_spill()
+        if not entries:
+            return
+        with self._lock:
+            for key, value in entries.items():
+                self._pending.setdefault(key, value)
+            self._first_pending_at = time.monotonic()
+            self._stats["restored"] += len(entries)
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
+        print(f"[API] Re-queued {len(entries)} {self.name} saved at last shutdown")
+
+    def _read_spill(self) -> dict:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return {}
+        try:
+            with open(self.spill_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[API] Ignoring unreadable {self.spill_path}: {e}")
+            return {}
@@ -0,0 +1,500 @@
+# backend_client.py
+# Shared HTTP client for every call to the BrowserControl backend API
+#
+# All backend requests go through one pooled requests.Session, so a scan
+# reuses an open keep-alive connection instead of paying a new TCP connect
+# each time. warm_up() opens that connection at login, before the first scan.
+#
+# Every call uses the same timeouts and site headers, and answers in any
+# encoding the backend chooses (see api_encoding.py). A request whose
+# connection failed before the backend answered (typically a keep-alive
+# connection the backend closed while idle) is retried; timeouts are not, so
+# a slow database is never asked twice. Error statuses raise:
+#
+#   DatabaseUnavailable  503 - the backend answers instantly while the database is down
+#   Throttled            429 - this station is sending too much (e.g. repeated Enter presses)
+#   BackendError         any other error status
+#
+# requests' ConnectionError / Timeout propagate unchanged.
+#
+# Standby backends can be listed in constants.BACKENDS ("ip:port"). Traffic
+# stays on the primary (IP:PORT) while it is healthy: the backend keeps
+# settings, caches, idempotency records and event history in memory, so
+# spreading requests would serve stale reads and miss invalidations. An
+# endpoint that fails or answers 5xx cools off for a while and requests go to
+# the best standby instead, ranked by an EWMA of latency and error rate.
+# Reads are also hedged: if the primary hasn't answered after its recent p95
+# latency, the same read goes to the best standby and the first answer wins.
+# Writes are never hedged, and only fail over when the connection could not
+# be opened, so the request can't have reached the backend.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+import constants
+from constants import IP, PORT
+from api_encoding import ACCEPT_HEADERS, decode_response
+from utils import site_headers
+
+BASE_URL = f"http://{IP}:{PORT}"
+CONNECT_TIMEOUT = 3     # Seconds to open a connection; the backend is on the LAN
+READ_TIMEOUT = 5        # Seconds to wait for an answer
+POOL_SIZE = 6           # Keep-alive connections kept open per endpoint (ui_tasks workers plus the event stream)
+RETRIES = 2             # Retries for requests whose connection failed before they were answered
+RETRY_DELAY = 0.1       # Seconds before the first retry, doubled each time
+
+# Endpoint selection and hedging (only matter with constants.BACKENDS)
+EWMA_ALPHA = 0.2            # Weight of the newest sample in the latency / error averages
+ERROR_PENALTY = 10          # Score multiplier per unit of error rate
+UNMEASURED_LATENCY = 0.05   # Seconds assumed for an endpoint not yet measured
+COOLDOWN = 5                # Seconds an endpoint is skipped after a failure, doubled per failure in a row
+MAX_COOLDOWN = 60
+LATENCY_WINDOW = 100        # Recent latencies kept per endpoint for the p95
+HEDGE_MIN_SAMPLES = 20      # Latencies needed before the p95 is trusted
+HEDGE_DEFAULT_DELAY = 1.0   # Hedge delay until then
+HEDGE_MIN_DELAY = 0.05      # Never hedge sooner than this
+
+
+class Endpoint:
+    """One backend host with its latency and error history."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.latency = None         # EWMA seconds; None until measured
+        self.error_rate = 0.0       # EWMA of failures (1) and successes (0)
+        self.in_flight = 0
+        self.failures_in_row = 0
+        self.down_until = 0.0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.hedged = 0
+        self._lock = threading.Lock()
+
+    def score(self) -> float:
+        """Lower is better. Unmeasured endpoints count as fast so they get tried."""
+        with self._lock:
+            latency = self.latency if self.latency is not None else UNMEASURED_LATENCY
+            return latency * (1 + self.in_flight) * (1 + ERROR_PENALTY * self.error_rate)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            ordered = sorted(self.samples)
+        return max(HEDGE_MIN_DELAY, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def hedging(self):
+        with self._lock:
+            self.hedged += 1
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def succeeded(self, seconds):
+        with self._lock:
+            self.in_flight -= 1
+            self.samples.append(seconds)
+            self.latency = seconds if self.latency is None else (
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency)
+            self.error_rate *= (1 - EWMA_ALPHA)
+            self.failures_in_row = 0
+            self.down_until = 0.0
+
+    def failed(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.errors += 1
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            self.failures_in_row += 1
+            cooldown = min(COOLDOWN * 2 ** (self.failures_in_row - 1), MAX_COOLDOWN)
+            self.down_until = time.monotonic() + cooldown
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "hedged": self.hedged,
+                "cooling_off": max(0.0, round(self.down_until - time.monotonic(), 1)),
+            }
+
+
+def _endpoints_from_constants():
+    urls = [BASE_URL]
+    for backend in getattr(constants, "BACKENDS", None) or []:
+        url = (backend if backend.startswith("http") else f"http://{backend}").rstrip("/")
+        if url not in urls:
+            urls.append(url)
+    return [Endpoint(url) for url in urls]
+
+
+endpoints = _endpoints_from_constants()
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=POOL_SIZE)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+# Hedged reads wait on two requests at once
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="backend-hedge")
+
+
+class BackendError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class DatabaseUnavailable(BackendError):
+    pass
+
+
+class Throttled(BackendError):
+    def __init__(self, message, status=429, retry_after=None):
+        super().__init__(message, status)
+        self.retry_after = retry_after
+
+
+class EndpointMissing(BackendError):
+    """The backend predates this endpoint (404)."""
+
+
+def request(method, path, *, json=None, params=None, headers=None, timeout=None, stream=False,
+            allow=(), read=False):
+    """
+    Send a request to the backend and return the requests.Response.
+
+    Args:
+        allow: Status codes returned to the caller instead of raising
+        read: The request only reads, so it may be hedged and may fail over after a timeout
+    """
+    kwargs = {
+        "json": json,
+        "params": params,
+        "headers": {**ACCEPT_HEADERS, **site_headers(), **(headers or {})},
+        "timeout": timeout or (CONNECT_TIMEOUT, READ_TIMEOUT),
+        "stream": stream,
+    }
+    ranked = _ranked_endpoints()
+    if read and not stream and len(ranked) > 1:
+        resp = _hedged(method, path, ranked, kwargs)
+    else:
+        resp = _with_failover(method, path, ranked, kwargs, read)
+
+    if resp.status_code in allow or resp.status_code < 400:
+        return resp
+    message = _error_message(resp)
+    resp.close()
+    if resp.status_code == 503:
+        raise DatabaseUnavailable(message, 503)
+    if resp.status_code == 429:
+        raise Throttled(message, retry_after=resp.headers.get("Retry-After"))
+    if resp.status_code == 404:
+        raise EndpointMissing(message, 404)
+    raise BackendError(message, resp.status_code)
+
+
+def _ranked_endpoints():
+    """
+    The primary first while it isn't cooling off, then the standbys best first;
+    endpoints cooling off after a failure go last, soonest back first.
+    """
+    now = time.monotonic()
+    primary, standbys = endpoints[0], endpoints[1:]
+    ready = sorted((e for e in standbys if e.down_until <= now), key=lambda e: e.score())
+    if primary.down_until <= now:
+        ready.insert(0, primary)
+    cooling = sorted((e for e in endpoints if e.down_until > now), key=lambda e: e.down_until)
+    return ready + cooling
+
+
+def _never_sent(error) -> bool:
+    """True if the connection could not be opened, so the backend never saw the request."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)   # urllib3 MaxRetryError wraps the cause
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _send(endpoint, method, path, kwargs):
+    """
+    One request to one endpoint, recording its latency or failure. A 5xx
+    answer counts as a failure: a backend whose database breaker is open
+    answers 503 instantly and must not look like the fastest endpoint.
+    """
+    endpoint.started()
+    start = time.perf_counter()
+    delay = RETRY_DELAY
+    try:
+        for attempt in range(RETRIES + 1):
+            try:
+                resp = session.request(method, endpoint.base_url + path, **kwargs)
+                break
+            except requests.exceptions.ConnectionError as e:
+                # ConnectTimeout is both; an unreachable backend won't answer the retry either
+                if isinstance(e, requests.exceptions.Timeout) or attempt == RETRIES:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+    except requests.exceptions.RequestException:
+        endpoint.failed()
+        raise
+    if resp.status_code >= 500:
+        endpoint.failed()
+    else:
+        endpoint.succeeded(time.perf_counter() - start)
+    return resp
+
+
+def _with_failover(method, path, ranked, kwargs, read):
+    """
+    Try endpoints in order until one answers. Reads also move on after a
+    timeout or a 5xx answer; the last 5xx is returned if every endpoint fails.
+    """
+    error, failed_resp = None, None
+    for endpoint in ranked:
+        try:
+            resp = _send(endpoint, method, path, kwargs)
+        except requests.exceptions.ConnectionError as e:
+            # Aborted or reset after sending: a write may have been applied
+            # there, and another backend has no record of its Idempotency-Key
+            if not read and not _never_sent(e):
+                raise
+            error = e
+            continue
+        except requests.exceptions.ReadTimeout as e:
+            if not read:
+                raise
+            error = e
+            continue
+        if not read or resp.status_code < 500:
+            return resp
+        if failed_resp is not None:
+            failed_resp.close()
+        failed_resp = resp
+    if failed_resp is not None:
+        return failed_resp
+    raise error
+
+
+def _hedged(method, path, ranked, kwargs):
+    """Send a read to the first endpoint, and to the runner-up too if the first is slower than usual."""
+    primary, backup = ranked[0], ranked[1]
+    first = _hedge_pool.submit(_send, primary, method, path, kwargs)
+    done, _ = wait([first], timeout=primary.hedge_delay())
+    if done:
+        if _answered(first):
+            return first.result()
+        # Failed fast (e.g. refused or 503): plain failover to the others,
+        # keeping the first 5xx answer in case none of them does better
+        try:
+            resp = _with_failover(method, path, ranked[1:], kwargs, True)
+        except requests.exceptions.RequestException:
+            if first.exception() is None:
+                return first.result()
+            raise
+        if resp.status_code < 500 or first.exception() is not None:
+            _close_response(first)
+            return resp
+        resp.close()
+        return first.result()
+
+    primary.hedging()
+    pending = {first, _hedge_pool.submit(_send, backup, method, path, kwargs)}
+    spare = list(ranked[2:])
+    error, failed_resp = None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winners = [f for f in done if _answered(f)]
+        if winners:
+            for loser in winners[1:]:
+                loser.result().close()
+            for other in pending:
+                other.add_done_callback(_close_response)
+            if failed_resp is not None:
+                failed_resp.close()
+            return winners[0].result()
+        for future in done:
+            if future.exception() is None:
+                if failed_resp is not None:
+                    failed_resp.close()
+                failed_resp = future.result()
+            else:
+                error = future.exception()
+            # Replace each failed attempt with the next endpoint, if any
+            if spare:
+                pending.add(_hedge_pool.submit(_send, spare.pop(0), method, path, kwargs))
+    if failed_resp is not None:
+        return failed_resp
+    raise error
+
+
+def _answered(future) -> bool:
+    return future.exception() is None and future.result().status_code < 500
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+def endpoint_stats() -> dict:
+    """{base_url: latency, error and hedging counters} for every endpoint."""
+    return {e.base_url: e.stats() for e in endpoints}
+
+
+def _error_message(resp):
+    try:
+        data = resp.json()
+    except ValueError:
+        return f"{resp.status_code} {resp.reason}"
+    if isinstance(data, dict):
+        return data.get("error") or data.get("MSG") or data.get("message") or f"{resp.status_code} {resp.reason}"
+    return str(data)
+
+
+def _idempotency_headers(key):
+    # Retries with the same key are answered from the backend's record, not run again
+    return {"Idempotency-Key": key} if key else None
+
+
+def warm_up():
+    """
+    Open a pooled connection to every endpoint in the background, so the first
+    scan doesn't pay for the connect and each endpoint has a latency to rank by.
+    """
+    def run(endpoint):
+        try:
+            _send(endpoint, "GET", "/health", {
+                "headers": {**ACCEPT_HEADERS, **site_headers()},
+                "timeout": (CONNECT_TIMEOUT, READ_TIMEOUT),
+            }).close()
+        except Exception as e:
+            print(f"[BACKEND] Warm-up of {endpoint.base_url} failed: {e}")
+    for endpoint in endpoints:
+        threading.Thread(target=run, args=(endpoint,), name="backend-warm-up", daemon=True).start()
+
+
+def health():
+    """GET /health. A degraded backend (503) is reported, not raised."""
+    return request("GET", "/health", allow=(503,), read=True).json()
+
+
+# ---- SlotStax ----
+
+def select_pallet_arrived_by_tote(tote):
+    """Pallet and totes still in transit for a tote."""
+    return decode_response(request("POST", "/select_pallet_arrived_by_tote", json={"tote": tote}, read=True))
+
+
+def update_pallets_arrived_by_tote(container_ids, idempotency_key=None):
+    """Mark every tote on the given pallets as arrived."""
+    return decode_response(request(
+        "POST", "/update_pallets_arrived_by_tote",
+        json={"PARENT_CONTAINER_IDS": list(container_ids)},
+        headers=_idempotency_headers(idempotency_key),
+    ))
+
+
+# ---- Decant ----
+
+def lookup_lp_by_gtin(gtin, department, limit, cursor=None):
+    """
+    One page of LPs for a GTIN.
+
+    Returns:
+        (rows, next_cursor); an older backend without paging returns every
+        row as a single page
+    """
+    body = {"gtin": gtin, "department": department, "limit": limit}
+    if cursor:
+        body["cursor"] = cursor
+    data = decode_response(request("POST", "/lookup_lp_by_gtin", json=body, read=True))
+    if isinstance(data, list):
+        return data, None
+    return data.get("rows", []), data.get("next_cursor")
+
+
+def invalidate_lp_cache(gtin=None, lp=None):
+    """Drop the backend's cached lookups for a GTIN and/or LP after inventory changed on the scale."""
+    body = {}
+    if gtin:
+        body["gtin"] = gtin
+    if lp:
+        body["lp"] = lp
+    return request("POST", "/invalidate_lp_cache", json=body).json()
+
+
+# ---- User settings ----
+
+def get_user_settings(username):
+    return decode_response(request("POST", "/get_user_settings", json={"username": username}, read=True))
+
+
+def update_user_settings(username, theme, zoom, idempotency_key=None):
+    return decode_response(request(
+        "POST", "/update_user_settings",
+        json={"username": username, "theme": theme, "zoom": zoom},
+        headers=_idempotency_headers(idempotency_key),
+    ))
+
+
+def get_all_user_settings(etag=None):
+    """
+    Returns:
+        (data, etag); data is None when etag still matches (304)
+    """
+    headers = {"If-None-Match": etag} if etag else None
+    resp = request("GET", "/get_all_user_settings", headers=headers, allow=(304,), read=True)
+    if resp.status_code == 304:
+        return None, etag
+    return decode_response(resp), resp.headers.get("ETag")
+
+
+def get_user_settings_delta(epoch=None, since=None, etag=None):
+    """
+    Users changed since version `since` of settings epoch `epoch`.
+
+    Returns:
+        (data, etag); raises EndpointMissing on backends without delta sync
+    """
+    params = {"epoch": epoch, "since": since} if epoch and since is not None else None
+    headers = {"If-None-Match": etag} if etag else None
+    resp = request("GET", "/get_user_settings_delta", params=params, headers=headers, read=True)
+    return decode_response(resp), resp.headers.get("ETag")
+
+
+# ---- Push channel ----
+
+def open_event_stream(last_event_id=None, read_timeout=READ_TIMEOUT):
+    """
+    Open GET /events as a streaming response (use it as a context manager).
+    404 and 503 are returned, not raised, so the caller can pick its retry delay.
+
+    Routed like a write: events are published by the backend that handled
+    the change, so the stream belongs on the primary. It only lands on a
+    standby while the primary is unreachable; see on_preferred_endpoint().
+    """
+    headers = {"Accept": "text/event-stream"}
+    if last_event_id:
+        headers["Last-Event-ID"] = last_event_id
+    return request(
+        "GET", "/events", headers=headers, stream=True,
+        timeout=(CONNECT_TIMEOUT, read_timeout), allow=(404, 503),
+    )
+
+
+def on_preferred_endpoint(resp) -> bool:
+    """False if resp came from an endpoint new requests no longer go to first (e.g. a standby once the primary is back)."""
+    return resp.url.startswith(_ranked_endpoints()[0].base_url + "/")
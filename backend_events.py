@@ -0,0 +1,160 @@
+# backend_events.py
+# Background listener for the backend's Server-Sent Events stream (GET /events)
+#
+# One persistent connection per station. User settings changes are applied
+# to state.user_settings_cache as they arrive; other modules register
+# callbacks for the events they care about (e.g. SlotStax for "arrival"),
+# which run on the Tk thread. The stream reconnects with backoff and sends
+# Last-Event-ID, so nothing is missed across short drops. If the backend
+# can't replay (it restarted, or we were away too long) it sends "resync" and
+# the settings cache is reloaded in full.
+#
+# With standby backends the stream stays on the primary, where changes are
+# published. If it had to attach to a standby, it reconnects once requests
+# go back to the primary.
+
+import json
+import threading
+import time
+import backend_client
+import state
+
+RECONNECT_DELAY = 3         # Seconds before reconnecting (the backend may suggest another)
+MAX_RECONNECT_DELAY = 60    # Backoff cap while the backend is unreachable
+UNSUPPORTED_DELAY = 300     # Seconds between retries against a backend without /events
+READ_TIMEOUT = 45           # Backend sends a keep-alive every 15s; silence longer than this is a dead link
+
+_listeners = {}             # event type -> [callback(data)]
+_lock = threading.Lock()
+_thread = None
+_last_event_id = None
+
+
+def add_listener(event_type, callback):
+    """
+    Call callback(data) on the Tk thread for every event_type event.
+
+    Returns:
+        Zero-argument function that removes the listener again
+    """
+    with _lock:
+        _listeners.setdefault(event_type, []).append(callback)
+
+    def remove():
+        with _lock:
+            callbacks = _listeners.get(event_type, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+    return remove
+
+
+def start():
+    """Start the listener thread (once per process)."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_run, name="backend-events", daemon=True)
+    _thread.start()
+
+
+def _run():
+    delay = RECONNECT_DELAY
+    retry = RECONNECT_DELAY
+    while True:
+        try:
+            # Arrival events are only sent for this station's site (site headers are always sent)
+            with backend_client.open_event_stream(_last_event_id, read_timeout=READ_TIMEOUT) as resp:
+                if resp.status_code == 404:
+                    # Backend predates the push channel
+                    time.sleep(UNSUPPORTED_DELAY)
+                    continue
+                if resp.status_code == 503:
+                    time.sleep(int(resp.headers.get("Retry-After", MAX_RECONNECT_DELAY)))
+                    continue
+                print("[EVENTS] Connected to backend event stream")
+                delay = RECONNECT_DELAY
+                retry = _read_stream(resp) or retry
+            # Stream ended cleanly (backend restart or shutdown)
+            time.sleep(retry)
+        except Exception as e:
+            print(f"[EVENTS] Event stream lost ({e}), reconnecting in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+def _read_stream(resp):
+    """Dispatch events until the stream ends. Returns the backend's suggested retry delay, if any."""
+    global _last_event_id
+    retry = None
+    event_type, data_lines, event_id = "message", [], None
+
+    # chunk_size=None hands over each chunk as it arrives instead of waiting for a full buffer
+    for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+        if not backend_client.on_preferred_endpoint(resp):
+            # Attached to a standby and the primary is back (checked at least every keep-alive)
+            print("[EVENTS] Moving event stream back to the primary backend")
+            return retry
+        if not line:
+            if data_lines:
+                _dispatch(event_type, "\n".join(data_lines))
+                if event_id:
+                    _last_event_id = event_id
+            event_type, data_lines, event_id = "message", [], None
+            continue
+        if line.startswith(":"):
+            continue    # Keep-alive comment
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event_type = value
+        elif field == "data":
+            data_lines.append(value)
+        elif field == "id":
+            event_id = value
+        elif field == "retry" and value.isdigit():
+            retry = int(value) / 1000
+    return retry
+
+
+def _dispatch(event_type, raw):
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        print(f"[EVENTS] Ignoring malformed {event_type} event")
+        return
+
+    if event_type == "settings":
+        username = data.get("username")
+        if username and isinstance(data.get("settings"), dict):
+            state.user_settings_cache[username] = data["settings"]
+        elif username and "settings" in data and data["settings"] is None:
+            # Settings removed outside the API
+            state.user_settings_cache.pop(username, None)
+    elif event_type == "resync":
+        _reload_user_settings()
+
+    with _lock:
+        callbacks = list(_listeners.get(event_type, []))
+    root = state.root
+    if not callbacks or root is None:
+        return
+    for callback in callbacks:
+        try:
+            root.after(0, callback, data)
+        except Exception:
+            # Main loop is gone (app closing)
+            return
+
+
+def _reload_user_settings():
+    """Replace the settings cache after events were missed."""
+    try:
+        data, _ = backend_client.get_all_user_settings()
+        users = data.get("users", {})
+        state.user_settings_cache.clear()
+        state.user_settings_cache.update(users)
+        print(f"[EVENTS] Reloaded settings for {len(users)} users after resync")
+    except Exception as e:
+        print(f"[WARNING] Failed to reload user settings after resync: {e}")
@@ -0,0 +1,104 @@
+# gtin_cache.py
+# Client-side cache of Decant GTIN lookups (first page of lookup_lp_by_gtin)
+#
+# Operators often re-scan the same GTIN; a hit shows the LPs without a
+# backend round trip. Entries are short-lived because on-hand quantities
+# change as other stations decant, and are dropped as soon as this station
+# selects one of their LPs on the scale or pallets arrive.
+#
+#     cache = GtinCache(maxsize=64, ttl=15)
+#     page = cache.get(gtin, department)     # (rows, next_cursor) or None
+#     generation = cache.generation          # read before the lookup is sent
+#     cache.put(gtin, department, page, generation)
+#     cache.invalidate_lp("LP0001234")
+
+import threading
+import time
+from collections import OrderedDict
+
+GTIN_LENGTHS = (8, 12, 13, 14)      # GTIN-8, UPC-A, EAN-13, GTIN-14
+
+
+def is_valid_gtin(value: str) -> bool:
+    """True for a complete GTIN: digits only, a GTIN length and a correct check digit."""
+    if len(value) not in GTIN_LENGTHS or not value.isdigit():
+        return False
+    # Weights alternate 3, 1, ... from the digit next to the check digit
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(value[:-1])))
+    return (10 - total % 10) % 10 == int(value[-1])
+
+
+class GtinCache:
+    """
+    Bounded LRU of lookup pages whose entries expire `ttl` seconds after they were stored.
+
+    Args:
+        maxsize: Maximum number of GTINs kept; the least recently used is evicted first
+        ttl: Seconds an entry stays valid
+    """
+
+    def __init__(self, maxsize: int = 64, ttl: float = 15.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # (gtin, department) -> (expires_at, (rows, next_cursor))
+        self._lock = threading.Lock()
+        self.generation = 0          # Bumped by every invalidation
+
+    def get(self, gtin, department):
+        """The cached (rows, next_cursor), or None."""
+        key = (gtin, department)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, page = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return page
+
+    def put(self, gtin, department, page, generation=None):
+        """Store a page, unless an invalidation happened since generation was read."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[(gtin, department)] = (time.monotonic() + self.ttl, page)
+            self._data.move_to_end((gtin, department))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate_lp(self, lp) -> int:
+        """Drop every GTIN whose cached rows include LP lp. Returns the number dropped."""
+        return self.invalidate_arrival([lp], [], empty=False)
+
+    def invalidate_arrival(self, lps, items, empty=True) -> int:
+        """
+        Drop every GTIN whose cached rows include one of lps or items, and
+        (with empty) those that had no stock. Returns the number dropped.
+        """
+        lps, items = set(lps), set(items)
+        with self._lock:
+            self.generation += 1
+            doomed = [
+                key for key, (_, (rows, _cursor)) in self._data.items()
+                if (empty and not rows)
+                or any(row.get("LOGISTICS_UNIT") in lps or row.get("ITEM") in items for row in rows)
+            ]
+            for key in doomed:
+                del self._data[key]
+            return len(doomed)
+
+    def invalidate(self, gtin) -> int:
+        """Drop a GTIN for every department. Returns the number dropped."""
+        with self._lock:
+            self.generation += 1
+            doomed = [key for key in self._data if key[0] == gtin]
+            for key in doomed:
+                del self._data[key]
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
@@ -27,12 +27,20 @@ def build_ui():
     import settings
     import config
     import constants
+    import backend_events
+    import outbox
 
     root = tk.Tk()
     state.root = root
     state.department_var = tk.StringVar(master=root, value=config.cfg["department"])
     state.zoom_var = tk.StringVar(master=root, value=config.cfg["zoom_var"])
 
+    # Live settings/arrival updates from the backend (needs state.root for callbacks)
+    backend_events.start()
+
+    # Send settings/arrival writes left from the last run, then keep flushing
+    outbox.start()
+
     # Set up tray
     tray_icon = tray.setup_tray()
 
@@ -192,34 +200,96 @@ def _preload_user_settings(splash):
     Pre-load ALL user settings from database during splash screen.
     This avoids API calls during Chrome launch (for ~50 users).
     Cache is stored in state.user_settings_cache.
+
+    The last payload is kept on disk together with the backend's settings
+    epoch/version and ETag. At launch only the users changed since that
+    version are downloaded and merged into the saved copy; a full download
+    happens only when the backend can't serve a delta and the ETag no
+    longer matches.
     """
     import state
-    import requests
-    from constants import IP, PORT
-    
+    import settings
+    import backend_client
+
+    snapshot = settings.load_user_settings_snapshot()
+
+    # Start from the saved copy; the backend response is merged into it
+    state.user_settings_cache.clear()
+    state.user_settings_cache.update(snapshot.get("users", {}))
+
     try:
         print("[STARTUP] Pre-loading all user settings...")
-        
-        resp = requests.get(
-            f"http://{IP}:{PORT}/get_all_user_settings",
-            timeout=5
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Store in cache
-        state.user_settings_cache = data.get("users", {})
-        count = data.get("count", 0)
-        
-        print(f"[STARTUP] Loaded settings for {count} users into cache")
+
+        try:
+            data, response_etag = backend_client.get_user_settings_delta(
+                snapshot.get("epoch"), snapshot.get("version"), snapshot.get("etag")
+            )
+        except backend_client.EndpointMissing:
+            # Backend predates delta sync
+            return _preload_user_settings_full(snapshot)
+
+        users = data.get("users", {})
+        removed = data.get("removed", [])
+
+        if data.get("full"):
+            state.user_settings_cache.clear()
+            etag = response_etag
+        elif users or removed:
+            # Merged data no longer matches any ETag the backend handed out
+            etag = None
+        else:
+            etag = response_etag or snapshot.get("etag")
+        state.user_settings_cache.update(users)
+        for username in removed:
+            state.user_settings_cache.pop(username, None)
+
+        _save_user_settings_snapshot({
+            "epoch": data.get("epoch"),
+            "version": data.get("version"),
+            "etag": etag,
+            "users": state.user_settings_cache,
+        })
+
+        kind = "full" if data.get("full") else "delta"
+        print(f"[STARTUP] Synced user settings ({kind}, {len(users)} changed, {len(removed)} removed), "
+              f"{len(state.user_settings_cache)} users in cache")
         return "user_settings"
         
     except Exception as e:
         print(f"[WARNING] Failed to pre-load user settings: {e}")
         splash.status_var.set("⚠️ User settings pre-load failed (will load on demand)")
-        # Don't fail startup - just leave cache empty
-        state.user_settings_cache = {}
+        # Don't fail startup - keep the last saved copy (may be empty)
+        return "user_settings"
+
+
+def _preload_user_settings_full(snapshot):
+    """Conditional full download for backends without the delta endpoint."""
+    import state
+    import backend_client
+
+    data, etag = backend_client.get_all_user_settings(snapshot.get("etag"))
+    if data is None:
+        print(f"[STARTUP] User settings unchanged, loaded {len(state.user_settings_cache)} users from local copy")
         return "user_settings"
+    
+    # Store in cache
+    state.user_settings_cache.clear()
+    state.user_settings_cache.update(data.get("users", {}))
+    count = data.get("count", 0)
+
+    _save_user_settings_snapshot({"etag": etag, "users": state.user_settings_cache})
+    
+    print(f"[STARTUP] Loaded settings for {count} users into cache")
+    return "user_settings"
+
+
+def _save_user_settings_snapshot(snapshot):
+    """Save the settings snapshot; a failure only costs a bigger download next launch."""
+    import settings
+    try:
+        settings.save_user_settings_snapshot(snapshot)
+    except OSError as e:
+        print(f"[WARNING] Failed to save user settings snapshot: {e}")
 
 
 def start():
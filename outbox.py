@@ -0,0 +1,314 @@
+# outbox.py
+# Durable outbox for writes to the backend (user settings, pallet arrivals)
+#
+# A write is appended to an on-disk journal next to settings.ini before it is
+# sent, so a backend blip, a crash or a restart loses nothing and the station
+# never waits on the backend to record it. A background flusher sends queued
+# writes in order, retrying with backoff while the backend is unreachable, the
+# database is down or the station is throttled. Every write carries an
+# Idempotency-Key (its journal id), so a retry of a write that did reach the
+# database is answered from the backend's record instead of being applied twice.
+#
+# Journal lines (JSON):
+#   {"op": "add", "id", "kind": "settings" | "arrivals", "payload", "at"}
+#   {"op": "done", "id", "result": "sent" | "superseded" | "merged" | "rejected" | "expired"}
+# Arrivals queued behind a write that is still going out are merged into one
+# batch (a new entry plus "merged" for the old one, journaled together), so a
+# station that confirms pallets during an outage sends them in one request.
+# On start the journal is replayed. It is rewritten with only the pending
+# writes once all of them are done, or when it grows past COMPACT_AFTER lines.
+#
+#     outbox.start()
+#     outbox.enqueue("arrivals", {"containers": {"P123": 4}})
+#     remove = outbox.add_listener(on_outbox)    # on_outbox(event, entry, status) on the Tk thread
+#
+# Events: "queued", "sent" (entry["response"] holds the backend's answer),
+# "retry" (status["retry_in"], status["error"]), "rejected" (the backend refused
+# it for good, status["error"]), "expired" (a settings write that waited longer
+# than SETTINGS_MAX_AGE, e.g. replayed the next morning, and was dropped so it
+# can't overwrite a newer change made on another station). status also has
+# "queued": writes still pending.
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import requests
+import backend_client
+import state
+from utils import get_path
+
+OUTBOX_FILE = "outbox.jsonl"
+RETRY_DELAY = 2             # Seconds before the first retry while the backend is unavailable
+MAX_RETRY_DELAY = 60        # Backoff cap
+COMPACT_AFTER = 500         # Journal lines before it is rewritten with only pending writes
+SETTINGS_MAX_AGE = 3600     # Seconds a queued settings write stays worth sending
+MAX_ARRIVAL_BATCH = 100     # Pallets merged into one queued arrivals write (backend allows 500)
+
+outbox_path = get_path(OUTBOX_FILE)
+
+_pending = OrderedDict()    # id -> entry, oldest first
+_lock = threading.Lock()
+_wake = threading.Condition(_lock)
+_sending = None             # id of the entry being sent
+_journal_lines = 0
+_listeners = []
+_thread = None
+_status = {"queued": 0, "retry_in": None, "error": None}
+
+
+def _send_settings(entry):
+    p = entry["payload"]
+    return backend_client.update_user_settings(p["username"], p["theme"], p["zoom"], idempotency_key=entry["id"])
+
+
+def _send_arrivals(entry):
+    return backend_client.update_pallets_arrived_by_tote(entry["payload"]["containers"], idempotency_key=entry["id"])
+
+
+_SENDERS = {
+    "settings": _send_settings,
+    "arrivals": _send_arrivals,
+}
+
+
+def enqueue(kind, payload) -> dict:
+    """
+    Journal a write and wake the flusher. The write is on disk when this
+    returns. A settings write replaces the same user's settings still waiting
+    to be sent; arrivals are merged into the arrivals batch queued last.
+
+    Returns:
+        The queued entry
+    """
+    if kind not in _SENDERS:
+        raise ValueError(f"Unknown outbox write kind {kind!r}")
+    entry = {"op": "add", "id": uuid.uuid4().hex, "kind": kind, "payload": payload, "at": time.time()}
+    with _lock:
+        superseded = []
+        merged = None
+        if kind == "settings":
+            superseded = [
+                e["id"] for e in _pending.values()
+                if e["kind"] == "settings" and e["id"] != _sending
+                and e["payload"]["username"] == payload["username"]
+            ]
+        elif kind == "arrivals":
+            merged = _merge_target(payload)
+            if merged is not None:
+                entry["payload"] = {"containers": {**merged["payload"]["containers"], **payload["containers"]}}
+        done = [{"op": "done", "id": i, "result": "superseded"} for i in superseded]
+        if merged is not None:
+            done.append({"op": "done", "id": merged["id"], "result": "merged"})
+            superseded.append(merged["id"])
+        _append([entry] + done)
+        for i in superseded:
+            del _pending[i]
+        _pending[entry["id"]] = entry
+        _status["queued"] = len(_pending)
+        _wake.notify()
+    _notify("queued", entry)
+    return entry
+
+
+def _merge_target(payload):
+    """
+    The arrivals entry queued last, if payload can join it. Caller holds _lock.
+
+    The oldest entry is never merged into: the flusher may already have sent it
+    under its Idempotency-Key, and the retry has to carry the same batch.
+    """
+    if len(_pending) < 2:
+        return None
+    last = next(reversed(_pending.values()))
+    if last["kind"] != "arrivals" or last["id"] == _sending:
+        return None
+    if len(set(last["payload"]["containers"]) | set(payload["containers"])) > MAX_ARRIVAL_BATCH:
+        return None
+    return last
+
+
+def pending_count(kind=None) -> int:
+    with _lock:
+        return sum(1 for e in _pending.values() if kind is None or e["kind"] == kind)
+
+
+def add_listener(callback):
+    """
+    Call callback(event, entry, status) on the Tk thread for every outbox event.
+
+    Returns:
+        Zero-argument function that removes the listener again
+    """
+    with _lock:
+        _listeners.append(callback)
+
+    def remove():
+        with _lock:
+            if callback in _listeners:
+                _listeners.remove(callback)
+    return remove
+
+
+def start():
+    """Load writes left in the journal and start the flusher (once per process)."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _load()
+    if _pending:
+        print(f"[OUTBOX] {len(_pending)} write(s) left from last run, sending")
+    _thread = threading.Thread(target=_run, name="outbox-flusher", daemon=True)
+    _thread.start()
+
+
+def _load():
+    global _journal_lines
+    entries = OrderedDict()
+    lines = 0
+    try:
+        with open(outbox_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                if record.get("op") == "add" and record.get("kind") in _SENDERS:
+                    entries[record["id"]] = record
+                elif record.get("op") == "done":
+                    entries.pop(record.get("id"), None)
+    except OSError:
+        pass
+    with _lock:
+        _pending.clear()
+        _pending.update(entries)
+        _status["queued"] = len(_pending)
+        _journal_lines = lines
+        if lines and not _pending:
+            _compact()
+
+
+def _append(records):
+    """Append journal records and flush them to disk. Caller holds _lock."""
+    global _journal_lines
+    try:
+        with open(outbox_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _journal_lines += len(records)
+    except OSError as e:
+        # Still sent from memory; only crash safety is lost
+        print(f"[WARNING] Failed to write outbox journal: {e}")
+
+
+def _compact():
+    """Rewrite the journal with only the pending writes. Caller holds _lock."""
+    global _journal_lines
+    tmp_path = outbox_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in _pending.values():
+                f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, outbox_path)
+        _journal_lines = len(_pending)
+    except OSError as e:
+        print(f"[WARNING] Failed to compact outbox journal: {e}")
+
+
+def _finish(entry, result):
+    with _lock:
+        _append([{"op": "done", "id": entry["id"], "result": result}])
+        _pending.pop(entry["id"], None)
+        _status["queued"] = len(_pending)
+        if not _pending or _journal_lines > COMPACT_AFTER:
+            _compact()
+
+
+def _run():
+    global _sending
+    delay = RETRY_DELAY
+    while True:
+        with _lock:
+            while not _pending:
+                _wake.wait()
+            entry = next(iter(_pending.values()))
+            expired = _expired(entry)
+            if not expired:
+                _sending = entry["id"]
+
+        if expired:
+            print(f"[OUTBOX] Dropping settings write for {entry['payload']['username']} "
+                  f"queued {int(time.time() - entry['at'])}s ago")
+            _finish(entry, "expired")
+            _notify("expired", entry)
+            continue
+
+        try:
+            entry["response"] = _SENDERS[entry["kind"]](entry)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                backend_client.DatabaseUnavailable, backend_client.Throttled) as e:
+            _retry_later(entry, e, delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+            continue
+        except backend_client.BackendError as e:
+            if e.status is None or e.status >= 500:
+                _retry_later(entry, e, delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            # The backend refused it (bad request); retrying can't help
+            print(f"[OUTBOX] {entry['kind']} write rejected: {e}")
+            _finish(entry, "rejected")
+            _status.update(error=str(e), retry_in=None)
+            _notify("rejected", entry)
+            continue
+        finally:
+            with _lock:
+                _sending = None
+
+        delay = RETRY_DELAY
+        _finish(entry, "sent")
+        _status.update(error=None, retry_in=None)
+        _notify("sent", entry)
+
+
+def _expired(entry) -> bool:
+    """
+    A settings write is the whole profile, so one held back for long (the
+    backend was down all afternoon, or the journal is replayed at the next
+    start) would overwrite whatever the user has saved since on another
+    station. Arrivals are kept: marking a pallet arrived again is harmless.
+    """
+    return entry["kind"] == "settings" and time.time() - entry.get("at", 0) > SETTINGS_MAX_AGE
+
+
+def _retry_later(entry, error, delay):
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after and str(retry_after).isdigit():
+        delay = max(delay, int(retry_after))
+    print(f"[OUTBOX] Backend unavailable ({error}), {len(_pending)} write(s) queued, retrying in {delay}s")
+    _status.update(error=str(error), retry_in=delay)
+    _notify("retry", entry)
+    time.sleep(delay)
+
+
+def _notify(event, entry):
+    with _lock:
+        callbacks = list(_listeners)
+        status = dict(_status)
+    root = state.root
+    if not callbacks or root is None:
+        return
+    for callback in callbacks:
+        try:
+            root.after(0, callback, event, entry, status)
+        except Exception:
+            # Main loop is gone (app closing)
+            return
@@ -1,5 +1,5 @@
 #settings.py
-import os, configparser, pygetwindow as gw
+import os, json, configparser, pygetwindow as gw
 from constants import CONFIG_FILE, SECTION, DEFAULTS
 import config
 import state
@@ -7,6 +7,10 @@ from utils import get_path
 
 settings_path = get_path(CONFIG_FILE)
 
+# Last synced user settings with their epoch/version and ETag, kept next to settings.ini
+USER_SETTINGS_SNAPSHOT_FILE = "user_settings_cache.json"
+user_settings_snapshot_path = get_path(USER_SETTINGS_SNAPSHOT_FILE)
+
 def save_settings():
 
     # Use existing values from memory
@@ -71,6 +75,29 @@ def save_position(x, y):
     with open(settings_path, 'w') as configfile:
         parser.write(configfile)
 
+def load_user_settings_snapshot():
+    """
+    Load the last user settings payload saved by save_user_settings_snapshot().
+
+    Returns:
+        dict: {"epoch", "version", "etag", "users": {...}} or {} if missing/unreadable
+    """
+    try:
+        with open(user_settings_snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot, dict) and isinstance(snapshot.get("users"), dict):
+            return snapshot
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def save_user_settings_snapshot(snapshot):
+    """Persist the user settings payload atomically so a crash can't leave half a file."""
+    tmp_path = user_settings_snapshot_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, user_settings_snapshot_path)
+
 def get_window_state(driver, exclude_window=None):
     try:
         tolerance = 2
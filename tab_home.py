@@ -15,12 +15,12 @@ from functools import partial
 
 # Third-party imports
 import win32gui
-import requests
 
 # Local imports
 import state
 import config
 import tab_tools
+import backend_client
 from chrome import start_threads_parallel, reorganize_windows, run_ahk_zoom
 from utils import validate_credentials, flash_message, get_path
 from constants import USER_FILE
@@ -935,6 +935,9 @@ def build_home_tab(parent, msg):
             state.username = username
             state.password = password
             state.logged_in = True  # Set logged in state
+
+            # Open a backend connection now so the first scan reuses it
+            backend_client.warm_up()
             
             # Fetch user settings BEFORE launching browsers
             user_theme = "dark"  # Default to dark mode
@@ -951,14 +954,7 @@ def build_home_tab(parent, msg):
                 # Fallback to API call
                 print(f"[LOGIN] User '{username}' not in cache, fetching from API...")
                 try:
-                    from constants import IP, PORT
-                    resp = requests.post(
-                        f"http://{IP}:{PORT}/get_user_settings",
-                        json={"username": username},
-                        timeout=5
-                    )
-                    resp.raise_for_status()
-                    data = resp.json()
+                    data = backend_client.get_user_settings(username)
                     
                     # Update with user settings from database
                     user_zoom = data.get("zoom", "200")
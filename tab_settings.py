@@ -1,9 +1,9 @@
 import tkinter as tk
 from tkinter import ttk
 import config, state
-import requests
+import outbox
 import threading
-from constants import DEPARTMENTS, ZOOM_OPTIONS, IP, PORT
+from constants import DEPARTMENTS, ZOOM_OPTIONS
 from settings import save_settings, save_window_geometry
 from utils import flash_message
 from tab_tools import build_tools_tab
@@ -155,13 +155,8 @@ def build_settings_tab(parent):
             # Apply theme changes to live browser sessions (user sees this)
             apply_theme_to_browsers(theme)
             
-            # Save to database LAST (background operation)
-            resp = requests.post(
-                f"http://{IP}:{PORT}/update_user_settings",
-                json={"username": state.username, "theme": theme, "zoom": zoom},
-                timeout=5
-            )
-            resp.raise_for_status()
+            # Save to database LAST (journaled; the outbox retries while the backend is down)
+            outbox.enqueue("settings", {"username": state.username, "theme": theme, "zoom": zoom})
             
             # Show success message on UI thread
             state.root.after(0, lambda: flash_message(msg_lbl, msg_var, "Theme updated!", status='success'))
@@ -171,6 +166,21 @@ def build_settings_tab(parent):
             state.root.after(0, lambda: flash_message(msg_lbl, msg_var, f"Error saving settings", status='error'))
             print(f"[ERROR] Failed to save user settings: {e}")
 
+    # Settings writes the backend couldn't take right away
+    def on_outbox(event, entry, status):
+        if entry["kind"] != "settings" or not msg_lbl.winfo_exists():
+            return
+        if event == "retry":
+            flash_message(msg_lbl, msg_var, "Theme saved - will sync when the backend is back", status='error')
+        elif event == "sent" and status["queued"] == 0 and msg_var.get().startswith("Theme saved"):
+            flash_message(msg_lbl, msg_var, "Theme synced", status='success')
+        elif event == "rejected":
+            flash_message(msg_lbl, msg_var, "Error saving settings", status='error')
+        elif event == "expired" and entry["payload"]["username"] == state.username:
+            flash_message(msg_lbl, msg_var, "Theme change was not synced (backend unavailable too long)", status='error')
+
+    outbox.add_listener(on_outbox)
+
     # Auto-update department (computer-level)
     def update_department(*_):
         try:
@@ -0,0 +1,7 @@
+# conftest.py
+# The client modules are flat, imported by name from the repository root (as main.py does)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
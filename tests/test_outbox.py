@@ -0,0 +1,177 @@
+# test_outbox.py
+# Outbox journal, replay, merging and expiry
+#
+# outbox imports backend_client, state and utils, which need the station's
+# constants.py; the tests give it stand-ins with the parts it uses.
+
+import importlib
+import json
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+
+class BackendError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class DatabaseUnavailable(BackendError):
+    pass
+
+
+class Throttled(BackendError):
+    retry_after = None
+
+
+class Backend:
+    """Records sends; fail_next makes the next sends raise."""
+
+    def __init__(self):
+        self.sent = []
+        self.fail_next = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _send(self, kind, payload, key):
+        self.gate.wait()
+        if self.fail_next:
+            raise self.fail_next.pop(0)
+        self.sent.append((kind, payload, key))
+        return {"message": "ok"}
+
+    def update_user_settings(self, username, theme, zoom, idempotency_key=None):
+        return self._send("settings", {"username": username, "theme": theme, "zoom": zoom}, idempotency_key)
+
+    def update_pallets_arrived_by_tote(self, containers, idempotency_key=None):
+        return self._send("arrivals", dict(containers), idempotency_key)
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    backend = Backend()
+    client = types.SimpleNamespace(
+        BackendError=BackendError,
+        DatabaseUnavailable=DatabaseUnavailable,
+        Throttled=Throttled,
+        update_user_settings=backend.update_user_settings,
+        update_pallets_arrived_by_tote=backend.update_pallets_arrived_by_tote,
+    )
+    monkeypatch.setitem(sys.modules, "backend_client", client)
+    monkeypatch.setitem(sys.modules, "state", types.SimpleNamespace(root=None))
+    monkeypatch.setitem(sys.modules, "utils", types.SimpleNamespace(get_path=lambda name: str(tmp_path / name)))
+    monkeypatch.delitem(sys.modules, "outbox", raising=False)
+    backend.outbox = importlib.import_module("outbox")
+    backend.outbox.RETRY_DELAY = 0.01
+    return backend
+
+
+def journal(outbox):
+    with open(outbox.outbox_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_enqueue_is_journaled_before_it_returns(backend):
+    outbox = backend.outbox
+    entry = outbox.enqueue("arrivals", {"containers": {"P1": 4}})
+    assert journal(outbox) == [entry]
+    assert outbox.pending_count("arrivals") == 1
+    with pytest.raises(ValueError):
+        outbox.enqueue("unknown", {})
+
+
+def test_queued_writes_are_sent_in_order_with_their_id_as_key(backend):
+    outbox = backend.outbox
+    first = outbox.enqueue("arrivals", {"containers": {"P1": 4}})
+    second = outbox.enqueue("settings", {"username": "jdoe", "theme": "dark", "zoom": "100"})
+    outbox.start()
+    assert wait_until(lambda: len(backend.sent) == 2)
+    assert [key for _, _, key in backend.sent] == [first["id"], second["id"]]
+    assert wait_until(lambda: outbox.pending_count() == 0)
+    # Compacted once nothing is pending
+    assert journal(outbox) == []
+
+
+def test_unsent_writes_are_replayed_after_restart(backend):
+    outbox = backend.outbox
+    entry = outbox.enqueue("arrivals", {"containers": {"P1": 4}})
+    outbox.enqueue("settings", {"username": "jdoe", "theme": "dark", "zoom": "100"})
+
+    outbox._load()   # As a new process would on start
+    assert outbox.pending_count() == 2
+    outbox.start()
+    assert wait_until(lambda: len(backend.sent) == 2)
+    assert backend.sent[0][2] == entry["id"]
+
+
+def test_settings_write_replaces_queued_one_for_same_user(backend):
+    outbox = backend.outbox
+    outbox.enqueue("settings", {"username": "jdoe", "theme": "dark", "zoom": "100"})
+    outbox.enqueue("settings", {"username": "asmith", "theme": "dark", "zoom": "100"})
+    outbox.enqueue("settings", {"username": "jdoe", "theme": "light", "zoom": "150"})
+    assert outbox.pending_count() == 2
+    assert {"op": "done", "id": journal(outbox)[0]["id"], "result": "superseded"} in journal(outbox)
+
+
+def test_arrivals_queued_behind_a_write_are_merged(backend):
+    outbox = backend.outbox
+    head = outbox.enqueue("arrivals", {"containers": {"P1": 1}})
+    outbox.enqueue("arrivals", {"containers": {"P2": 2}})
+    merged = outbox.enqueue("arrivals", {"containers": {"P3": 3}})
+    assert outbox.pending_count() == 2
+    assert merged["payload"] == {"containers": {"P2": 2, "P3": 3}}
+
+    outbox._load()
+    outbox.start()
+    assert wait_until(lambda: len(backend.sent) == 2)
+    assert backend.sent == [
+        ("arrivals", {"P1": 1}, head["id"]),
+        ("arrivals", {"P2": 2, "P3": 3}, merged["id"]),
+    ]
+
+
+def test_arrivals_are_not_merged_into_the_write_being_sent(backend):
+    outbox = backend.outbox
+    backend.gate.clear()
+    outbox.start()
+    outbox.enqueue("arrivals", {"containers": {"P1": 1}})
+    assert wait_until(lambda: outbox._sending is not None)
+    outbox.enqueue("arrivals", {"containers": {"P2": 2}})
+    backend.gate.set()
+    assert wait_until(lambda: len(backend.sent) == 2)
+    assert [payload for _, payload, _ in backend.sent] == [{"P1": 1}, {"P2": 2}]
+
+
+def test_stale_settings_write_is_dropped(backend):
+    outbox = backend.outbox
+    old = {"op": "add", "id": "old", "kind": "settings", "at": time.time() - outbox.SETTINGS_MAX_AGE - 1,
+           "payload": {"username": "jdoe", "theme": "dark", "zoom": "100"}}
+    with open(outbox.outbox_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(old) + "\n")
+    outbox.start()
+    outbox.enqueue("arrivals", {"containers": {"P1": 1}})
+    assert wait_until(lambda: outbox.pending_count() == 0)
+    assert [kind for kind, _, _ in backend.sent] == ["arrivals"]
+
+
+def test_unavailable_backend_is_retried_and_bad_request_rejected(backend):
+    outbox = backend.outbox
+    backend.fail_next = [DatabaseUnavailable("database down", 503), BackendError("bad request", 400)]
+    outbox.enqueue("arrivals", {"containers": {"P1": 1}})
+    outbox.enqueue("arrivals", {"containers": {"P2": 2}})   # Merged with nothing: P1 is the oldest
+    outbox.start()
+    assert wait_until(lambda: outbox.pending_count() == 0)
+    # P1 was retried and then refused for good; P2 went out
+    assert [payload for _, payload, _ in backend.sent] == [{"P2": 2}]
+    assert backend.fail_next == []
@@ -1,11 +1,23 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from chrome import select_on_scale
-import requests
-from constants import IP, PORT
+import backend_client
+import backend_events
+import ui_tasks
+from gtin_cache import GtinCache, is_valid_gtin
 import state
 import traceback
 
+# LPs requested per page; "Load more" fetches the next page
+DECANT_PAGE_SIZE = 25
+
+# First pages are kept client-side, so re-scanning a GTIN needs no round trip
+GTIN_CACHE_SIZE = 64        # GTINs kept (least recently used evicted first)
+GTIN_CACHE_TTL = 15         # Seconds; same freshness as the backend's lookup cache
+PREFETCH_DELAY_MS = 150     # A complete GTIN left alone this long is looked up before Search
+
+lookup_cache = GtinCache(maxsize=GTIN_CACHE_SIZE, ttl=GTIN_CACHE_TTL)
+
 
 def build_decant_tools(parent):
     frame = tk.Frame(parent, bg="#2b2b2b", padx=10, pady=10)
@@ -31,39 +43,98 @@ def build_decant_tools(parent):
     )
     gtin_entry.grid(row=1, column=1, sticky="ew", padx=(0,5))
     
+    # Lookups run in the background; a new search supersedes one still running
+    busy_bar = ttk.Progressbar(frame, mode="indeterminate", length=60)
+    busy_bar.grid(row=1, column=2, sticky="w")
+    lookups = ui_tasks.LatestTask(frame, on_busy=ui_tasks.BusyIndicator(busy_bar))
+
+    # First-page lookup in flight, and whether Search is waiting for it
+    pending = {'gtin': None, 'task': None, 'show': False}
+    prefetch_job = {'id': None}
+
+    def start_lookup(gtin, show):
+        pending['gtin'], pending['show'] = gtin, show
+        # A page fetched across an arrival may already be stale; don't cache it
+        generation = lookup_cache.generation
+        pending['task'] = lookups.submit(
+            fetch_page, gtin,
+            on_success=lambda page: on_first_page(gtin, page, generation),
+            on_error=on_first_page_error,
+        )
+
+    def on_first_page(gtin, page, generation):
+        lookup_cache.put(gtin, loc, page, generation)
+        if pending['show']:
+            show_results(gtin, *page)
+        pending['show'] = False
+
+    def on_first_page_error(e):
+        # A failed prefetch stays quiet; Search will ask again
+        if pending['show']:
+            show_lookup_error(e)
+        pending['show'] = False
+
     # Search button
     def on_search():
+        cancel_prefetch()
         gtin = gtin_var.get().strip()
         # Clear previous results
         for w in results_frame.winfo_children():
             w.destroy()
         if not gtin:
+            lookups.cancel()
             msg_var.set("Please enter a GTIN.")
             return
 
+        page = lookup_cache.get(gtin, loc)
+        if page is not None:
+            lookups.cancel()
+            show_results(gtin, *page)
+            return
+
         msg_var.set("Searching...")
-        try:
-            resp = requests.post(
-                f"http://{IP}:{PORT}/lookup_lp_by_gtin",
-                json={"gtin": gtin, "department": loc},
-                timeout=5
-            )
-            resp.raise_for_status()
-            rows = resp.json()
+        if pending['gtin'] == gtin and pending['task'] is not None and pending['task'].running:
+            # Already being looked up speculatively; show it when it lands
+            pending['show'] = True
+            return
+        start_lookup(gtin, show=True)
+
+    # Look a GTIN up as soon as it is complete, before Search is pressed
+    def on_gtin_changed(*_):
+        cancel_prefetch()
+        gtin = gtin_var.get().strip()
+        if is_valid_gtin(gtin) and lookup_cache.get(gtin, loc) is None:
+            # The delay skips GTIN-length prefixes of a longer scan still being typed
+            prefetch_job['id'] = frame.after(PREFETCH_DELAY_MS, prefetch, gtin)
+
+    def prefetch(gtin):
+        prefetch_job['id'] = None
+        running = pending['task'] is not None and pending['task'].running
+        if not (running and pending['gtin'] == gtin):
+            start_lookup(gtin, show=False)
+
+    def cancel_prefetch():
+        if prefetch_job['id']:
+            frame.after_cancel(prefetch_job['id'])
+            prefetch_job['id'] = None
 
-        except Exception as e:
+    gtin_var.trace_add("write", on_gtin_changed)
+
+    def show_lookup_error(e):
+        if isinstance(e, backend_client.DatabaseUnavailable):
+            # Backend answers instantly while the database is down
+            msg_var.set("Database unavailable - try again shortly")
+        elif isinstance(e, backend_client.Throttled):
+            # Backend is throttling this station (e.g. repeated Enter presses)
+            msg_var.set("Too many requests - wait a moment")
+        else:
             msg_var.set(f"Error: {e}")
-            return
 
+    def show_results(gtin, rows, next_cursor):
         if not rows:
             msg_var.set("No results found.")
             return
 
-        if len(rows) == 1:
-            msg_var.set("1 LP found")
-        else:
-            msg_var.set(f"{len(rows)} LPs found")
-
         # Close any existing results window before opening a new one
         try:
             if state.decant_gtin_results_win and state.decant_gtin_results_win.winfo_exists():
@@ -114,6 +185,10 @@ def build_decant_tools(parent):
                 else:
                     msg_var.set(msg)
                     msg_lbl.config(fg="white")
+                    # On-hand quantities for this LP just changed
+                    lookup_cache.invalidate_lp(lp)
+                    lookup_cache.invalidate(gtin)
+                    ui_tasks.submit(frame, backend_client.invalidate_lp_cache, gtin, lp)
                     
             except Exception as e:
                 # Handle unexpected errors
@@ -131,23 +206,69 @@ def build_decant_tools(parent):
             if state.decant_gtin_results_win and state.decant_gtin_results_win.winfo_exists():
                 state.decant_gtin_results_win.destroy()
 
-        for r, row in enumerate(rows, start=1):
-            values = (
-                row.get("LOCATION", ""),
-                row.get("ITEM", ""),
-                row.get("ON_HAND_QTY", ""),
-                row.get("LOGISTICS_UNIT", "")
+        shown = 0
+        cursor = next_cursor
+
+        def add_rows(page):
+            nonlocal shown
+            for r, row in enumerate(page, start=shown + 1):
+                values = (
+                    row.get("LOCATION", ""),
+                    row.get("ITEM", ""),
+                    row.get("ON_HAND_QTY", ""),
+                    row.get("LOGISTICS_UNIT", "")
+                )
+                for c, val in enumerate(values):
+                    tk.Label(
+                        table, text=val,
+                        bg="#2b2b2b", fg="white",
+                        bd=1, relief="solid", padx=5, pady=2
+                    ).grid(row=r, column=c, sticky="nsew")
+                ttk.Button(
+                    table, text="Select",
+                    command=lambda rw=row: on_select(rw)
+                ).grid(row=r, column=len(values), sticky="nsew")
+            shown += len(page)
+
+            if cursor:
+                msg_var.set(f"{shown} LPs shown - more available")
+                more_btn.pack(pady=(0, 10))
+            else:
+                msg_var.set("1 LP found" if shown == 1 else f"{shown} LPs found")
+                more_btn.pack_forget()
+
+        def on_load_more():
+            more_btn.config(state="disabled")
+            pages.submit(
+                fetch_page, gtin, cursor,
+                on_success=add_page,
+                on_error=show_lookup_error,
+                on_finish=enable_load_more,
             )
-            for c, val in enumerate(values):
-                tk.Label(
-                    table, text=val,
-                    bg="#2b2b2b", fg="white",
-                    bd=1, relief="solid", padx=5, pady=2
-                ).grid(row=r, column=c, sticky="nsew")
-            ttk.Button(
-                table, text="Select",
-                command=lambda rw=row: on_select(rw)
-            ).grid(row=r, column=len(values), sticky="nsew")
+
+        def enable_load_more():
+            if more_btn.winfo_exists():
+                more_btn.config(state="normal")
+
+        def add_page(page):
+            nonlocal cursor
+            rows, cursor = page
+            add_rows(rows)
+
+        more_btn = ttk.Button(result_win, text="Load more", command=on_load_more)
+        # Own task: a prefetch or Search must not cancel a page in flight (its
+        # button would stay disabled), nor Load more cancel a pending Search
+        pages = ui_tasks.LatestTask(result_win)
+        add_rows(rows)
+
+    def fetch_page(gtin, cursor=None):
+        """
+        Fetch one page of LPs for a GTIN (runs on a worker thread).
+
+        Returns (rows, next_cursor). An older backend without paging returns
+        a plain list, which is treated as a single page.
+        """
+        return backend_client.lookup_lp_by_gtin(gtin, loc, DECANT_PAGE_SIZE, cursor)
 
     search_btn = ttk.Button(frame, text="Search", command=on_search)
     search_btn.grid(row=2, column=1, padx=5)
@@ -160,4 +281,20 @@ def build_decant_tools(parent):
 
     frame.bind_all("<Return>", lambda event: on_search())
 
+    # Arrivals feed DECANT inventory, so cached lookups for the arrived LPs'
+    # items (and GTINs that had no stock) may now be stale
+    def on_arrival_event(data):
+        if "lps" in data:
+            lookup_cache.invalidate_arrival(data["lps"], data.get("items", []))
+        else:
+            # Older backend: no inventory details
+            lookup_cache.clear()
+    remove_arrival_listener = backend_events.add_listener("arrival", on_arrival_event)
+
+    def on_destroy(event):
+        if event.widget is frame:
+            remove_arrival_listener()
+            cancel_prefetch()
+    frame.bind("<Destroy>", on_destroy, add="+")
+
     return frame
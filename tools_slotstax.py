@@ -3,8 +3,11 @@
 import tkinter as tk
 from tkinter import ttk
 import requests
-from constants import IP, PORT
 from utils import flash_message
+import backend_client
+import backend_events
+import outbox
+import ui_tasks
 
 def show_error_popup(title, message):
     popup = tk.Toplevel()
@@ -46,6 +49,10 @@ def build_slotstax_tools(parent):
     tote_entry = ttk.Entry(frame, textvariable=tote_var)
     tote_entry.grid(row=1, column=1, sticky="ew", padx=(0, 5))
 
+    # Tote lookups run in the background; a new scan supersedes one still running
+    busy_bar = ttk.Progressbar(frame, mode="indeterminate", length=60)
+    busy_bar.grid(row=1, column=2, sticky="w")
+    lookups = ui_tasks.LatestTask(frame, on_busy=ui_tasks.BusyIndicator(busy_bar))
 
     # Confirmation UI inside the tab
     def show_confirmation(totes, container_id):
@@ -58,24 +65,20 @@ def build_slotstax_tools(parent):
             s = ""
 
         msg_var.set(f"You are about to mark {totes} tote{s} as arrived. Do you wish to proceed?")
+        confirming['cid'] = container_id
 
         btn_frame = tk.Frame(frame, bg="#2b2b2b")
         btn_frame.grid(row=2, column=0, columnspan=3, pady=10)
 
-        # Internal function to perform the arrival update
+        # Journal the pallet in the outbox; it is sent in the background
         def do_update_arrival(container_id):
-            try:
-                resp = requests.post(
-                    f"http://{IP}:{PORT}/update_pallet_arrived_by_tote",
-                    json={"PARENT_CONTAINER_ID": container_id},
-                    timeout=5
-                )
-                resp.raise_for_status()
-                reset_form()
-                flash_message(msg_lbl, msg_var, f"{totes} tote{s} marked as arrived on pallet {container_id}", "success")
-            except Exception as e: 
-                show_error_popup("Error", str(e))
-                flash_message(msg_lbl, msg_var, "Error confirming", "error")
+            outbox.enqueue("arrivals", {"containers": {container_id: totes}})
+            reset_form()
+            queued = outbox.pending_count("arrivals")
+            if queued > 1:
+                flash_message(msg_lbl, msg_var, f"Pallet {container_id} saved ({queued} batch(es) queued)", "success")
+            else:
+                flash_message(msg_lbl, msg_var, f"Pallet {container_id} saved, sending", "success")
 
         def on_confirm():
             do_update_arrival(container_id)
@@ -86,6 +89,8 @@ def build_slotstax_tools(parent):
             msg_var.set("Mark entire pallet as arrived by tote")
 
         def reset_form():
+            confirming['cid'] = None
+            confirming['cancel'] = None
             btn_frame.destroy()
             input_label.grid()
             tote_entry.grid()
@@ -95,6 +100,39 @@ def build_slotstax_tools(parent):
         cancel_btn.grid(row=0, column=0, padx=5)
         confirm_btn = ttk.Button(btn_frame, text="Confirm", style="Danger.TButton", command=on_confirm)
         confirm_btn.grid(row=0, column=1, padx=5)
+        confirming['cancel'] = reset_form
+
+    # Pallet currently awaiting Confirm, and how to dismiss its prompt
+    confirming = {'cid': None, 'cancel': None}
+
+    # Outbox progress for arrival batches
+    def on_outbox(event, entry, status):
+        if entry["kind"] != "arrivals" or not frame.winfo_exists():
+            return
+        batch = entry["payload"]["containers"]
+        if event == "sent":
+            totes = sum(batch.values())
+            s = "" if totes == 1 else "s"
+            if len(batch) == 1:
+                msg = f"{totes} tote{s} marked as arrived on pallet {next(iter(batch))}"
+            else:
+                msg = f"{totes} tote{s} marked as arrived on {len(batch)} pallets"
+            queued = outbox.pending_count("arrivals")
+            if queued:
+                msg += f" ({queued} more batch(es) queued)"
+            flash_message(msg_lbl, msg_var, msg, "success")
+        elif event == "retry":
+            queued = outbox.pending_count("arrivals")
+            flash_message(
+                msg_lbl, msg_var,
+                f"Backend unavailable - {queued} arrival batch(es) saved, retrying in {status['retry_in']}s",
+                "error",
+            )
+        elif event == "rejected":
+            show_error_popup("Error", status["error"] or "Arrival update rejected by the backend")
+            flash_message(msg_lbl, msg_var, "Error confirming - see popup window", "error")
+
+    remove_outbox_listener = outbox.add_listener(on_outbox)
 
     # Handler for the Arrive button
     def on_arrive_click():
@@ -102,49 +140,68 @@ def build_slotstax_tools(parent):
         if not val:
             flash_message(msg_lbl, msg_var, "Please enter a tote", "error")
             return
-        try:
-            resp = requests.post(
-                f"http://{IP}:{PORT}/select_pallet_arrived_by_tote",
-                json={"tote": val},
-                timeout=5
-            )
-            resp.raise_for_status()
-            data = resp.json()
-
-            if resp.status_code != 200:
-                msg = data.get("MSG") or data.get("message") or "Unknown error"
-                show_error_popup("Error", msg)
-                flash_message(msg_lbl, msg_var, "Error: See popup window", "error")
-                return
-
-            msg = data.get("MSG", "")
-            totes = data.get("TOTES_IN_TRANSIT", 0)
-            cid = data.get("PARENT_CONTAINER_ID")
-
-            if msg:
-                flash_message(msg_lbl, msg_var, msg, "error")
-                return
-
-            if totes == 0:
-                msg = f"There are no totes to mark as arrived on pallet {cid}."
-                flash_message(msg_lbl, msg_var, msg, "error")
-                return
-
-            show_confirmation(totes, cid)
-
-        except requests.exceptions.ConnectionError:
-            msg = "Backend is not running"
+        lookups.submit(
+            backend_client.select_pallet_arrived_by_tote, val,
+            on_success=on_tote_found,
+            on_error=on_tote_error,
+        )
+
+    def on_tote_found(data):
+        msg = data.get("MSG", "")
+        totes = data.get("TOTES_IN_TRANSIT", 0)
+        cid = data.get("PARENT_CONTAINER_ID")
+
+        if msg:
             flash_message(msg_lbl, msg_var, msg, "error")
-        except requests.exceptions.Timeout:
-            msg = "Backend request timed out"
+            return
+
+        if totes == 0:
+            msg = f"There are no totes to mark as arrived on pallet {cid}."
             flash_message(msg_lbl, msg_var, msg, "error")
-        except Exception as e:
-            show_error_popup("Error", msg)
+            return
+
+        show_confirmation(totes, cid)
+
+    def on_tote_error(e):
+        if isinstance(e, backend_client.DatabaseUnavailable):
+            # Backend answers instantly while the database is down
+            flash_message(msg_lbl, msg_var, "Database unavailable - try again shortly", "error")
+        elif isinstance(e, backend_client.Throttled):
+            # Backend is throttling this station (e.g. repeated Enter presses)
+            flash_message(msg_lbl, msg_var, "Too many requests - wait a moment", "error")
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            flash_message(msg_lbl, msg_var, "Backend is not running", "error")
+        elif isinstance(e, requests.exceptions.Timeout):
+            flash_message(msg_lbl, msg_var, "Backend request timed out", "error")
+        else:
+            show_error_popup("Error", str(e))
             flash_message(msg_lbl, msg_var, "Error: See popup window", "error")
 
     # Arrive button
     arrive_btn = ttk.Button(frame, text="Arrive", command=on_arrive_click)
     arrive_btn.grid(row=2, column=1, padx=5)
+
+    # A pallet marked as arrived elsewhere (pushed by the backend) no longer needs confirming
+    def on_arrival_event(data):
+        if not frame.winfo_exists():
+            return
+        cid = confirming['cid']
+        if cid is None or cid not in data.get("containers", {}):
+            return
+        confirming['cancel']()
+        flash_message(msg_lbl, msg_var, f"Pallet {cid} already marked as arrived", "error")
+
+    remove_arrival_listener = backend_events.add_listener("arrival", on_arrival_event)
+
+    # Confirmed pallets are already in the outbox; only the listeners need removing
+    def on_destroy(event):
+        if event.widget is not frame:
+            return
+        remove_arrival_listener()
+        remove_outbox_listener()
+        lookups.cancel()
+    frame.bind("<Destroy>", on_destroy, add="+")
+
     frame.rowconfigure(3, weight=1)
     frame.columnconfigure(1, weight=1)
 
@@ -0,0 +1,171 @@
+# ui_tasks.py
+# Run blocking work (backend calls) off the Tk main loop
+#
+# Tk callbacks must never wait on the network: while they do, the window
+# freezes and scanner input is lost. submit() runs a function on a small
+# worker pool and hands its result back on the Tk thread:
+#
+#     task = ui_tasks.submit(frame, backend_client.lookup_lp_by_gtin, gtin, ...,
+#                            on_success=show_rows, on_error=show_error)
+#     task.cancel()
+#
+# A cancelled task, or one whose widget was destroyed meanwhile, never calls
+# back. The request itself still runs to completion in the background; only
+# its result is dropped.
+#
+# LatestTask keeps one task per purpose (e.g. "the current search"):
+# starting a new one cancels the one it supersedes, and an optional busy
+# callback (see BusyIndicator) is told while one is running.
+
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4     # Concurrent background calls for the whole app
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Data writes go through the outbox journal, not here. Calls still running or
+            # queued at exit (lookups, cache invalidations) are finished by concurrent.futures
+            # before the interpreter exits.
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ui-task")
+        return _executor
+
+
+class Task:
+    """Handle for a submitted call."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.finished = False
+        self._future = None
+
+    @property
+    def running(self) -> bool:
+        return not (self.cancelled or self.finished)
+
+    def cancel(self):
+        """Drop the result; the call is skipped if it hasn't started yet."""
+        self.cancelled = True
+        if self._future is not None:
+            self._future.cancel()
+
+
+def submit(widget, fn, *args, on_success=None, on_error=None, on_finish=None) -> Task:
+    """
+    Run fn(*args) on a worker thread.
+
+    Args:
+        widget: Tk widget the callbacks belong to; nothing is called once it's destroyed
+        on_success: on_success(result), on the Tk thread
+        on_error: on_error(exception), on the Tk thread
+        on_finish: on_finish(), on the Tk thread after either, unless cancelled
+    """
+    task = Task()
+
+    def deliver(callback, value):
+        if task.cancelled:
+            return
+        task.finished = True
+        try:
+            if not widget.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        try:
+            if callback is not None:
+                callback(value)
+        finally:
+            if on_finish is not None:
+                on_finish()
+
+    def run():
+        if task.cancelled:
+            return
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if on_error is None:
+                print(f"[ERROR] Background call {getattr(fn, '__name__', fn)} failed: {e}")
+            outcome = (on_error, e)
+        else:
+            outcome = (on_success, result)
+        if task.cancelled:
+            return
+        try:
+            widget.after(0, deliver, *outcome)
+        except (tk.TclError, RuntimeError):
+            # Main loop is gone (app closing)
+            pass
+
+    task._future = _get_executor().submit(run)
+    return task
+
+
+class LatestTask:
+    """
+    At most one live task; submitting another cancels the one it supersedes.
+
+    Args:
+        widget: Widget the callbacks belong to
+        on_busy: Optional on_busy(bool), called on the Tk thread when a task starts / ends
+    """
+
+    def __init__(self, widget, on_busy=None):
+        self.widget = widget
+        self.on_busy = on_busy
+        self._task = None
+
+    @property
+    def busy(self) -> bool:
+        return self._task is not None and self._task.running
+
+    def submit(self, fn, *args, on_success=None, on_error=None, on_finish=None) -> Task:
+        if self._task is not None:
+            self._task.cancel()
+
+        def finish():
+            if self._task is task:
+                self._set_busy(False)
+            if on_finish is not None:
+                on_finish()
+
+        task = submit(self.widget, fn, *args, on_success=on_success, on_error=on_error, on_finish=finish)
+        self._task = task
+        self._set_busy(True)
+        return task
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._set_busy(False)
+
+    def _set_busy(self, busy):
+        if self.on_busy is not None:
+            try:
+                self.on_busy(busy)
+            except tk.TclError:
+                pass
+
+
+class BusyIndicator:
+    """Shows an indeterminate ttk.Progressbar (already placed with grid) only while busy."""
+
+    def __init__(self, bar):
+        self.bar = bar
+        bar.grid_remove()
+
+    def __call__(self, busy):
+        if busy:
+            self.bar.grid()
+            self.bar.start(15)
+        else:
+            self.bar.stop()
+            self.bar.grid_remove()
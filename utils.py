@@ -42,6 +42,23 @@ def get_activity_type(department: str) -> str:
         return "Decant"
     return department
 
+def site_headers() -> dict:
+    """Headers routing backend requests to this station's site (building).
+
+    X-Site is sent when constants.SITE is set; otherwise the backend derives
+    the site from X-Department.
+    """
+    import config
+    import constants
+    headers = {}
+    site = getattr(constants, "SITE", None)
+    if site:
+        headers["X-Site"] = site
+    department = (config.cfg or {}).get("department")
+    if department:
+        headers["X-Department"] = department
+    return headers
+
 def update_available():
     """
     Check if an update is available with retry logic.